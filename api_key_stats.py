@@ -1,40 +1,18 @@
-import os
 import logging
 import yaml
 import requests
 from dotenv import load_dotenv
+from usage_counters import ShardedUsage, default_store
 
 load_dotenv()
 
 YAML_KEYS_FILE = "youtube-mp3-api-stats.yaml"
-GH_PAT = os.getenv("GH_PAT")
-GITHUB_REPO = "Zudiaq/youtube-mp3-apis"  # Repository containing API keys
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
-def pull_yaml_keys():
-    """
-    Pull the YAML file containing API keys from the private GitHub repository.
-    Returns the content of the file as a Python dictionary.
-    """
-    url = f"https://raw.githubusercontent.com/{GITHUB_REPO}/main/{YAML_KEYS_FILE}"
-    headers = {"Authorization": f"token {GH_PAT}"}
-    try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        with open(YAML_KEYS_FILE, "w", encoding="utf-8") as f:
-            f.write(response.text)
-        
-        # Load and return the YAML content
-        with open(YAML_KEYS_FILE, "r", encoding="utf-8") as f:
-            return yaml.safe_load(f)
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Failed to pull YAML keys file: {e}")
-        return None
-
 def format_api_key_stats(yaml_data):
     """
     Format the API key statistics into a clean, readable message.
@@ -86,5 +64,9 @@ def get_api_key_stats():
     Returns:
         str: Formatted message with API key statistics
     """
-    yaml_data = pull_yaml_keys()
+    try:
+        yaml_data = ShardedUsage(default_store(), YAML_KEYS_FILE).load()  # Base file plus unfolded usage shards
+    except (requests.exceptions.RequestException, yaml.YAMLError) as e:
+        logging.error(f"Failed to load API key usage: {e}")
+        yaml_data = None
     return format_api_key_stats(yaml_data)
@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import time
+from telegram.error import RetryAfter, Forbidden, BadRequest
+
+# ==========================
+# Configuration Variables
+# ==========================
+GLOBAL_RATE_PER_SECOND = 30  # Telegram allows roughly 30 messages per second across all chats
+PER_CHAT_INTERVAL_SECONDS = 1.0  # Telegram allows roughly 1 message per second to the same chat
+MAX_CONCURRENCY = 20  # Maximum number of in-flight send requests
+MAX_RETRIES = 3  # Retries per chat for RetryAfter and transient errors
+
+# ==========================
+# Helper Functions
+# ==========================
+def retry_after_seconds(error):
+    """
+    Return the back-off requested by a RetryAfter error in seconds.
+    Newer python-telegram-bot versions expose it as a timedelta, older ones as an int.
+    """
+    retry_after = error.retry_after
+    if hasattr(retry_after, "total_seconds"):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+class TokenBucket:
+    """
+    Asynchronous token bucket shared by every sender of a broadcast.
+    Tokens refill continuously at `rate` per second up to `capacity`.
+    A RetryAfter from Telegram pauses the whole bucket, not only the failing chat.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class BroadcastReport:
+    """
+    Outcome of a broadcast: delivery counts, throughput and the chats that failed.
+    """
+
+    def __init__(self, total):
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0
+        self.retries = 0
+        self.failed_chat_ids = []
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    @property
+    def elapsed(self):
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    @property
+    def throughput(self):
+        return self.sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self):
+        return (
+            f"{self.sent}/{self.total} sent, {self.failed} failed ({self.blocked} blocked), "
+            f"{self.retries} retries in {self.elapsed:.1f}s ({self.throughput:.1f} msg/s)"
+        )
+
+# ==========================
+# Core Functions
+# ==========================
+async def broadcast(chat_ids, send, rate=GLOBAL_RATE_PER_SECOND, concurrency=MAX_CONCURRENCY,
+                    per_chat_interval=PER_CHAT_INTERVAL_SECONDS, max_retries=MAX_RETRIES):
+    """
+    Deliver one message to many chats with bounded concurrency and Telegram rate limits.
+
+    Args:
+        chat_ids (iterable): Chat IDs to deliver to. Duplicates are sent only once.
+        send (callable): Coroutine function taking a chat ID and sending the message.
+            It must raise on failure.
+        rate (float): Global messages per second.
+        concurrency (int): Maximum number of in-flight sends.
+        per_chat_interval (float): Minimum seconds between two sends to the same chat.
+        max_retries (int): Attempts per chat after RetryAfter or transient errors.
+    Returns:
+        BroadcastReport: Delivery counts and throughput.
+    """
+    chat_ids = list(dict.fromkeys(chat_ids))
+    report = BroadcastReport(len(chat_ids))
+    bucket = TokenBucket(rate)
+    queue = asyncio.Queue()
+    last_sent_at = {}
+    for chat_id in chat_ids:
+        queue.put_nowait(chat_id)
+
+    async def deliver(chat_id):
+        for attempt in range(max_retries + 1):
+            wait = last_sent_at.get(chat_id, 0.0) + per_chat_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await bucket.acquire()
+            last_sent_at[chat_id] = time.monotonic()
+            try:
+                await send(chat_id)
+                report.sent += 1
+                return
+            except RetryAfter as e:
+                delay = retry_after_seconds(e)
+                logging.warning(f"Flood control hit while broadcasting to {chat_id}, backing off {delay}s")
+                bucket.pause(delay)
+            except Forbidden:
+                # The user blocked the bot or deleted their account; retrying will not help
+                report.blocked += 1
+                break
+            except BadRequest as e:
+                logging.error(f"Broadcast to {chat_id} rejected: {e}")
+                break
+            except Exception as e:
+                logging.error(f"Broadcast to {chat_id} failed (Attempt {attempt + 1}/{max_retries + 1}): {e}")
+                await asyncio.sleep(min(2 ** attempt, 30))
+            if attempt < max_retries:
+                report.retries += 1
+        report.failed += 1
+        report.failed_chat_ids.append(chat_id)
+
+    async def worker():
+        while True:
+            try:
+                chat_id = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await deliver(chat_id)
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, min(concurrency, len(chat_ids))))]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+        report.finished_at = time.monotonic()
+    logging.info(f"Broadcast finished: {report.summary()}")
+    return report
@@ -0,0 +1,118 @@
+import os
+import atexit
+import logging
+import threading
+import time
+import requests
+import yaml
+from telegram_client import notify_admins
+from usage_counters import COMPACT_AFTER_SHARDS, ShardConflict, ShardedUsage, counter_id, default_store, reset_epoch
+
+# ==========================
+# Configuration Variables
+# ==========================
+FLUSH_INTERVAL_SECONDS = int(os.getenv("KEY_USAGE_FLUSH_SECONDS", "300"))  # Long-running processes flush this often
+
+# ==========================
+# Key Pool
+# ==========================
+class KeyPool:
+    """
+    API keys of one YAML stats file, loaded once per process.
+
+    The file holds a `<service> keys` list per service, each entry with key, usage,
+    reset_day and last_reset. `acquire` picks the least-used key below the usage limit,
+    `record` counts a use in memory, and `flush` adds the accumulated deltas to this
+    process's usage shard (see ShardedUsage), so concurrent runs never overwrite each
+    other's counts. Deltas are flushed on interpreter exit, and at most every
+    `flush_interval` seconds by `record`.
+    """
+
+    def __init__(self, file_name, usage_limit, store=None, flush_interval=FLUSH_INTERVAL_SECONDS):
+        self.file_name = file_name
+        self.usage_limit = usage_limit
+        self.usage = ShardedUsage(store or default_store(), file_name)
+        self.flush_interval = flush_interval
+        self.lock = threading.RLock()
+        self.data = None  # Loaded on first use
+        self.pending = {}  # counter_id -> uses not yet flushed
+        self.exhausted_notified = set()
+        self.last_flush = time.monotonic()
+        atexit.register(self.flush)
+
+    def _load(self):
+        if self.data is None:
+            try:
+                self.data = self.usage.load()
+            except yaml.YAMLError as e:
+                logging.error(f"Error parsing {self.file_name}: {e}")
+                self.data = {}
+        return self.data
+
+    def keys(self, service_name):
+        with self.lock:
+            try:
+                return self._load().get(f"{service_name} keys", [])
+            except requests.exceptions.RequestException as e:
+                logging.error(f"Failed to pull {self.file_name}: {e}")
+                return []
+
+    def acquire(self, service_name):
+        """
+        Return (key, reset_day) of the least-used key of `service_name` below the usage
+        limit, or (None, None) when all are exhausted. Admins are told once per process.
+        """
+        with self.lock:
+            available = [entry for entry in self.keys(service_name) if entry["usage"] < self.usage_limit]
+            if not available:
+                if service_name not in self.exhausted_notified:
+                    self.exhausted_notified.add(service_name)
+                    notify_admins(f"All API keys for {service_name} are exhausted!")
+                return None, None
+            entry = min(available, key=lambda item: item["usage"])
+            logging.info(f"Using API key: {entry['key']} with usage: {entry['usage']}/{self.usage_limit}")
+            return entry["key"], entry["reset_day"]
+
+    def record(self, service_name, key, count=1):
+        """
+        Count `count` uses of `key` in memory; they reach GitHub with the next flush.
+        """
+        with self.lock:
+            for entry in self.keys(service_name):
+                if entry["key"] == key:
+                    entry["usage"] += count
+                    counter = counter_id(service_name, key, reset_epoch(entry.get("reset_day")))
+                    break
+            else:
+                logging.warning(f"Key {key} not found in {self.file_name} for service {service_name}.")
+                return
+            self.pending[counter] = self.pending.get(counter, 0) + count
+            due = time.monotonic() - self.last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """
+        Add all pending usage to this process's shard, compacting the shards once they pile up.
+        Returns True if nothing is left pending.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.last_flush = time.monotonic()
+        if not pending:
+            return True
+        try:
+            self.usage.add(pending)
+            logging.info(f"Flushed {sum(pending.values())} key uses for {self.file_name}.")
+        except (requests.exceptions.RequestException, ShardConflict) as e:
+            logging.error(f"Failed to flush {self.file_name} usage: {e}")
+            with self.lock:
+                for counter, count in pending.items():  # Keep the counts for the next flush
+                    self.pending[counter] = self.pending.get(counter, 0) + count
+            return False
+        if self.usage.shard_count >= COMPACT_AFTER_SHARDS:
+            try:
+                self.usage.compact()
+            except (requests.exceptions.RequestException, ShardConflict, yaml.YAMLError) as e:
+                logging.warning(f"Compacting {self.file_name} usage failed; the next run retries: {e}")
+        return True
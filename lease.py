@@ -0,0 +1,400 @@
+import os
+import json
+import base64
+import fcntl
+import asyncio
+import logging
+import time
+import uuid
+import requests
+
+# ==========================
+# Configuration Variables
+# ==========================
+LEASE_REPO = os.getenv("PANEL_LEASE_REPO", "Zudiaq/Klavir-Express")  # The panel's own repository, not the keys repo
+LEASE_BRANCH = os.getenv("PANEL_LEASE_BRANCH", "panel-lease")  # Heartbeat commits stay off the main branch
+LEASE_PATH = os.getenv("PANEL_LEASE_PATH", "panel_lease.json")
+LEASE_TTL_SECONDS = 360  # A leader that misses heartbeats for this long is considered dead
+HEARTBEAT_SECONDS = 120  # Lease renewal interval; every renewal is a commit, so keep it coarse
+WATCH_SECONDS = 5  # How often the leader checks for a waiting successor (conditional reads are free)
+SUCCESSOR_POLL_SECONDS = 1  # How often a waiting successor checks whether it was handed the lease
+
+# ==========================
+# Lease Stores
+# ==========================
+class LeaseConflict(Exception):
+    """
+    Raised when the lease changed between read and write.
+    """
+
+class FileLeaseStore:
+    """
+    Local lease store: a JSON file with compare-and-swap on a version counter under flock.
+    Stand-in for the GitHub store in tests and single-host deployments.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _locked(self):
+        handle = open(self.path, "a+")
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        handle.seek(0)
+        return handle
+
+    def read(self):
+        """
+        Returns:
+            tuple: (record or None, version)
+        """
+        with self._locked() as handle:
+            content = handle.read()
+        if not content:
+            return None, 0
+        data = json.loads(content)
+        return data["record"], data["version"]
+
+    def write(self, record, version):
+        """
+        Store `record` if the lease is still at `version`. Returns the new version.
+        """
+        with self._locked() as handle:
+            content = handle.read()
+            current = json.loads(content)["version"] if content else 0
+            if current != version:
+                raise LeaseConflict(f"Lease version is {current}, expected {version}")
+            handle.seek(0)
+            handle.truncate()
+            handle.write(json.dumps({"record": record, "version": version + 1}))
+        return version + 1
+
+class GitHubLeaseStore:
+    """
+    Lease stored as a JSON file through the GitHub contents API, on a branch of its own
+    that is created from the default branch on first use.
+
+    The blob SHA is the version: a PUT naming a stale SHA is rejected, which makes writes
+    compare-and-swap. Reads send the last ETag, and unchanged 304 answers do not count
+    against the API rate limit, so the leader can watch the lease cheaply.
+    """
+
+    def __init__(self, repo=LEASE_REPO, path=LEASE_PATH, branch=LEASE_BRANCH, token=None):
+        self.repo_url = f"https://api.github.com/repos/{repo}"
+        self.url = f"{self.repo_url}/contents/{path}"
+        self.branch = branch
+        self.branch_checked = False
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"token {token or os.getenv('GH_PAT')}"
+        self.etag = None
+        self.cached = (None, None)
+
+    def read(self):
+        headers = {"If-None-Match": self.etag} if self.etag else {}
+        response = self.session.get(self.url, params={"ref": self.branch}, headers=headers, timeout=10)
+        if response.status_code == 304:
+            return self.cached
+        if response.status_code == 404:
+            self.etag, self.cached = None, (None, None)
+            return self.cached
+        response.raise_for_status()
+        data = response.json()
+        record = json.loads(base64.b64decode(data["content"]).decode("utf-8") or "null")
+        self.etag = response.headers.get("ETag")
+        self.cached = (record, data["sha"])
+        return self.cached
+
+    def ensure_branch(self):
+        """
+        Create the lease branch from the head of the default branch unless it exists.
+        """
+        if self.branch_checked:
+            return
+        response = self.session.get(f"{self.repo_url}/git/ref/heads/{self.branch}", timeout=10)
+        if response.status_code == 404:
+            default = self.session.get(self.repo_url, timeout=10)
+            default.raise_for_status()
+            head = self.session.get(f"{self.repo_url}/git/ref/heads/{default.json()['default_branch']}", timeout=10)
+            head.raise_for_status()
+            created = self.session.post(f"{self.repo_url}/git/refs", timeout=10, json={
+                "ref": f"refs/heads/{self.branch}", "sha": head.json()["object"]["sha"],
+            })
+            if created.status_code != 422:  # 422: another instance created it meanwhile
+                created.raise_for_status()
+        else:
+            response.raise_for_status()
+        self.branch_checked = True
+
+    def write(self, record, version):
+        if not version:
+            self.ensure_branch()  # Only the very first write can meet a missing branch
+        payload = {
+            "message": f"Panel lease: {record.get('holder')}",
+            "content": base64.b64encode(json.dumps(record).encode("utf-8")).decode("utf-8"),
+            "branch": self.branch,
+        }
+        if version:
+            payload["sha"] = version
+        response = self.session.put(self.url, json=payload, timeout=10)
+        if response.status_code in (409, 422):
+            raise LeaseConflict(f"Lease changed concurrently: {response.status_code}")
+        response.raise_for_status()
+        self.etag = None
+        return response.json()["content"]["sha"]
+
+# ==========================
+# Lease Manager
+# ==========================
+class LeaseManager:
+    """
+    Leader election for panel instances polling the same bot.
+
+    Record fields: holder, expires_at, successor, last_update_id, handed_over_at, state.
+    A new instance warms up, then registers itself as `successor` and waits. The leader
+    sees the successor, stops polling, drains its handlers and hands the lease over in
+    one write that carries the last processed update_id (retried on conflict, never by
+    draining again), so the successor starts polling
+    right after the old one stopped and can drop anything already processed, and the
+    old leader's packed in-memory state (cleared again by the new leader's first renewal).
+    A leader that stops heartbeating loses the lease after LEASE_TTL_SECONDS.
+    """
+
+    def __init__(self, store, instance_id=None, ttl=LEASE_TTL_SECONDS, heartbeat=HEARTBEAT_SECONDS,
+                 watch=WATCH_SECONDS, successor_poll=SUCCESSOR_POLL_SECONDS, clock=time.time):
+        self.store = store
+        self.instance_id = instance_id or f"{os.getenv('GITHUB_RUN_ID', 'local')}-{uuid.uuid4().hex[:8]}"
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self.watch = watch
+        self.successor_poll = successor_poll
+        self.clock = clock
+
+    async def _call(self, method, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, method, *args)
+
+    def _expired(self, record):
+        return record is None or not record.get("holder") or record.get("expires_at", 0) <= self.clock()
+
+    async def acquire(self):
+        """
+        Wait until this instance holds the lease.
+        Returns:
+            dict: The lease record, including the last update_id processed by the previous leader.
+        """
+        announced = False
+        while True:
+            try:
+                record, version = await self._call(self.store.read)
+                if record and record.get("holder") == self.instance_id:
+                    logging.info(f"Lease acquired by {self.instance_id}.")
+                    return record
+                if self._expired(record):
+                    new_record = dict(record or {}, holder=self.instance_id, successor=None,
+                                      expires_at=self.clock() + self.ttl, state=None)
+                    await self._call(self.store.write, new_record, version)
+                    continue
+                if record.get("successor") != self.instance_id:
+                    await self._call(self.store.write, dict(record, successor=self.instance_id), version)
+                    if not announced:
+                        logging.info(f"Waiting for {record['holder']} to hand over the lease.")
+                        announced = True
+                    continue
+            except LeaseConflict:
+                continue
+            except Exception as e:
+                logging.error(f"Lease read/write failed: {e}")
+            await asyncio.sleep(self.successor_poll)
+
+    async def hold(self, handover, stop_event=None, export_state=None):
+        """
+        Keep the lease until a successor asks for it, the lease is lost or `stop_event` is set.
+
+        Args:
+            handover: Coroutine function that stops polling, drains handlers and returns
+                the last processed update_id.
+            export_state: Optional function returning a string handed to the successor
+                as the record's `state`, called once handlers have drained.
+        Returns:
+            str: "handed_over", "lost" or "stopped".
+        """
+        stop_event = stop_event or asyncio.Event()
+        renewed_at = self.clock()
+        while True:
+            try:
+                await asyncio.wait_for(stop_event.wait(), self.watch)
+                return "stopped"
+            except asyncio.TimeoutError:
+                pass
+            try:
+                record, version = await self._call(self.store.read)
+                if not record or record.get("holder") != self.instance_id:
+                    logging.error("Lease lost; another instance is polling.")
+                    return "lost"
+                if record.get("successor"):
+                    last_update_id = await handover()  # Polling has stopped; only the write may be retried
+                    state = export_state() if export_state else None
+                    return await self._hand_over(record, version, last_update_id, state)
+                if self.clock() - renewed_at >= self.heartbeat:
+                    await self._call(self.store.write, dict(record, expires_at=self.clock() + self.ttl, state=None), version)
+                    renewed_at = self.clock()
+            except LeaseConflict:
+                continue  # Re-read: a successor may have registered meanwhile
+            except Exception as e:
+                logging.error(f"Lease heartbeat failed: {e}")
+
+    async def _hand_over(self, record, version, last_update_id, state=None):
+        """
+        Write the lease to the successor of `record`, re-reading the version after every conflict.
+        Returns "handed_over", or "lost" if another instance took the lease meanwhile.
+        """
+        successor = record["successor"]
+        while True:
+            try:
+                await self._call(self.store.write, dict(
+                    record, holder=record.get("successor") or successor, successor=None,
+                    expires_at=self.clock() + self.ttl, last_update_id=last_update_id, handed_over_at=self.clock(),
+                    state=state,
+                ), version)
+                logging.info(f"Lease handed over to {record.get('successor') or successor} at update {last_update_id}.")
+                return "handed_over"
+            except LeaseConflict:
+                pass
+            except Exception as e:
+                logging.error(f"Lease handover write failed: {e}")
+                await asyncio.sleep(self.successor_poll)
+            try:
+                record, version = await self._call(self.store.read)
+            except Exception as e:
+                logging.error(f"Lease read failed during handover: {e}")
+                await asyncio.sleep(self.successor_poll)
+                continue
+            if not record or record.get("holder") != self.instance_id:
+                logging.error("Lease lost during handover; another instance is polling.")
+                return "lost"
+
+    async def release(self):
+        """
+        Give up the lease so a successor can take over without waiting for expiry.
+        """
+        try:
+            record, version = await self._call(self.store.read)
+            if record and record.get("holder") == self.instance_id:
+                await self._call(self.store.write, dict(record, holder=record.get("successor"), successor=None,
+                                                        expires_at=self.clock() + self.ttl), version)
+        except Exception as e:
+            logging.error(f"Failed to release lease: {e}")
+
+# ==========================
+# Update Fence
+# ==========================
+class UpdateFence:
+    """
+    Drops updates the previous leader already processed and counts suspected gaps.
+
+    Telegram assigns update_ids sequentially, so after a handover at `last_update_id`
+    a smaller or equal id is a duplicate and a jump past last_update_id + 1 on the first
+    update is a possibly dropped update.
+    """
+
+    def __init__(self, last_update_id=None):
+        self.last_update_id = last_update_id
+        self.first = True
+        self.processed = 0
+        self.duplicates = 0
+        self.gaps = 0
+
+    def admit(self, update_id):
+        if self.last_update_id is not None and update_id <= self.last_update_id:
+            self.duplicates += 1
+            return False
+        if self.first and self.last_update_id is not None and update_id > self.last_update_id + 1:
+            self.gaps += update_id - self.last_update_id - 1
+        self.first = False
+        self.last_update_id = update_id
+        self.processed += 1
+        return True
+
+# ==========================
+# Handover Simulation
+# ==========================
+if __name__ == "__main__":
+    import tempfile
+
+    class FakeTelegram:
+        """
+        getUpdates semantics: updates stay queued until confirmed by a later offset,
+        and two concurrent pollers conflict (409).
+        """
+
+        def __init__(self):
+            self.queue, self.next_id, self.poller, self.conflicts = [], 1, None, 0
+
+        def publish(self):
+            self.queue.append(self.next_id)
+            self.next_id += 1
+
+        def get_updates(self, poller, offset):
+            if self.poller not in (None, poller):
+                self.conflicts += 1
+                return []
+            self.poller = poller
+            self.queue = [update_id for update_id in self.queue if update_id >= offset]
+            return list(self.queue)
+
+        def release(self, poller):
+            if self.poller == poller:
+                self.poller = None
+
+    async def instance(name, store, telegram, processed, warmup, stop_after=None):
+        lease = LeaseManager(store, name, ttl=5, heartbeat=1, watch=0.05, successor_poll=0.05)
+        await asyncio.sleep(warmup)
+        record = await lease.acquire()
+        fence = UpdateFence(record.get("last_update_id"))
+        state = {"offset": (record.get("last_update_id") or 0) + 1, "running": True}
+
+        async def poll():
+            while state["running"]:
+                for update_id in telegram.get_updates(name, state["offset"]):
+                    if fence.admit(update_id):
+                        processed.append(update_id)
+                    state["offset"] = update_id + 1
+                await asyncio.sleep(0.01)
+
+        async def handover():
+            state["running"] = False
+            await poller
+            telegram.get_updates(name, state["offset"])  # Confirm the processed offset
+            telegram.release(name)
+            return fence.last_update_id
+
+        poller = asyncio.create_task(poll())
+        stop_event = asyncio.Event()
+        if stop_after:
+            asyncio.get_running_loop().call_later(stop_after, stop_event.set)
+        outcome = await lease.hold(handover, stop_event)
+        if outcome == "stopped":
+            state["running"] = False
+            await poller
+        return fence
+
+    async def simulate():
+        telegram, processed = FakeTelegram(), []
+        with tempfile.TemporaryDirectory() as directory:
+            store = FileLeaseStore(os.path.join(directory, "lease.json"))
+
+            async def traffic():
+                for _ in range(400):
+                    telegram.publish()
+                    await asyncio.sleep(0.005)
+
+            traffic_task = asyncio.create_task(traffic())
+            old = asyncio.create_task(instance("old", store, telegram, processed, warmup=0))
+            new = asyncio.create_task(instance("new", store, telegram, processed, warmup=0.8, stop_after=3))
+            await traffic_task
+            old_fence, new_fence = await old, await new
+        published = set(range(1, telegram.next_id))
+        print(f"published {len(published)}, processed {len(processed)} "
+              f"(old {old_fence.processed}, new {new_fence.processed})")
+        print(f"dropped {len(published - set(processed))}, duplicates processed {len(processed) - len(set(processed))}, "
+              f"duplicates fenced {new_fence.duplicates}, getUpdates conflicts {telegram.conflicts}")
+
+    asyncio.run(simulate())
@@ -0,0 +1,221 @@
+import os
+import json
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from media_cache import MEDIA_CACHE_DIR, atomic_write_json
+
+# ==========================
+# Configuration Variables
+# ==========================
+PROVIDER_TIMEOUT_SECONDS = 20  # Socket timeout of a single provider request
+RESOLVE_DEADLINE_SECONDS = 45  # Longest a link resolution waits across all providers
+FAILURE_THRESHOLD = 3  # Consecutive failures that open a provider's circuit
+COOLDOWN_SECONDS = 300  # How long an open circuit skips the provider before one trial request
+EWMA_ALPHA = 0.3  # Weight of the newest sample in the latency and error-rate averages
+LATENCY_SAMPLES = 50  # Recent successful latencies kept per provider for the hedge delay
+HEDGE_ENABLED = os.getenv("LINK_HEDGING", "1") != "0"  # Hedged requests spend quota on a second key
+HEDGE_PERCENTILE = 0.9
+HEDGE_DEFAULT_SECONDS = 6.0  # Hedge delay until a provider has enough latency samples
+HEDGE_MIN_SECONDS = 1.0
+PROVIDER_STATS_FILE = "link_providers.json"  # Kept in the media cache, so health carries across runs
+
+class Provider:
+    """
+    One way of turning a video id into an MP3 link, with its circuit breaker and statistics.
+
+    `fetch(video_id, timeout)` returns the link, or None (or raises) on failure. After
+    FAILURE_THRESHOLD consecutive failures the circuit opens and the provider is skipped;
+    once `cooldown` has passed a single trial request is let through (half-open), whose
+    outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, name, fetch, failure_threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN_SECONDS):
+        self.name = name
+        self.fetch = fetch
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.opened_at = None  # Wall-clock time the circuit opened, None while closed
+        self.trial_running = False
+        self.ewma_latency = None
+        self.ewma_error_rate = 0.0
+        self.latencies = []
+
+    def state(self, now=None):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if (now or time.time()) - self.opened_at >= self.cooldown else "open"
+
+    def admit(self):
+        """
+        Return True if a request may be sent now, claiming the trial slot of a half-open circuit.
+        """
+        with self.lock:
+            state = self.state()
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record(self, success, latency, started_at=None):
+        with self.lock:
+            self.trial_running = False
+            self.ewma_error_rate = EWMA_ALPHA * (0.0 if success else 1.0) + (1 - EWMA_ALPHA) * self.ewma_error_rate
+            if success:
+                if self.opened_at is None or started_at is None or started_at >= self.opened_at:
+                    self.consecutive_failures = 0  # A late hedged answer started before the circuit opened proves nothing
+                    self.opened_at = None
+                self.ewma_latency = latency if self.ewma_latency is None else (
+                    EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.ewma_latency)
+                self.latencies = (self.latencies + [latency])[-LATENCY_SAMPLES:]
+                return
+            self.consecutive_failures += 1
+            if self.opened_at is not None or self.consecutive_failures >= self.failure_threshold:
+                self.opened_at = time.time()  # A failed trial re-opens the circuit for another cooldown
+                logging.warning(f"Circuit for {self.name} opened after {self.consecutive_failures} failures.")
+
+    def hedge_delay(self):
+        """
+        Seconds to wait for this provider before hedging: a high percentile of its recent latencies.
+        """
+        with self.lock:
+            if len(self.latencies) < 5:
+                return HEDGE_DEFAULT_SECONDS
+            ordered = sorted(self.latencies)
+            return max(HEDGE_MIN_SECONDS, ordered[min(len(ordered) - 1, int(HEDGE_PERCENTILE * len(ordered)))])
+
+    def score(self):
+        """
+        Expected cost of a request: EWMA latency inflated by the error rate. Unmeasured providers rank last.
+        """
+        if self.ewma_latency is None:
+            return float("inf")
+        return self.ewma_latency * (1 + 4 * self.ewma_error_rate)
+
+    def snapshot(self):
+        return {
+            "consecutive_failures": self.consecutive_failures, "opened_at": self.opened_at,
+            "ewma_latency": self.ewma_latency, "ewma_error_rate": self.ewma_error_rate, "latencies": self.latencies,
+        }
+
+    def restore(self, data):
+        self.consecutive_failures = data.get("consecutive_failures", 0)
+        self.opened_at = data.get("opened_at")
+        self.ewma_latency = data.get("ewma_latency")
+        self.ewma_error_rate = data.get("ewma_error_rate", 0.0)
+        self.latencies = data.get("latencies", [])[-LATENCY_SAMPLES:]
+
+class ProviderRegistry:
+    """
+    Resolves MP3 links through the healthiest provider, failing over and hedging.
+
+    Providers with an open circuit are skipped outright. The rest are tried in order of
+    score; when one fails the next starts at once, and when one is slower than its usual
+    high-percentile latency a hedged request goes to the next, so the first link to
+    arrive wins. Everything happens within one deadline. Provider statistics are saved
+    in the media cache directory, which the workflows persist between runs.
+    """
+
+    def __init__(self, providers, hedge=HEDGE_ENABLED, deadline=RESOLVE_DEADLINE_SECONDS,
+                 timeout=PROVIDER_TIMEOUT_SECONDS, stats_path=None):
+        self.providers = list(providers)
+        self.hedge = hedge
+        self.deadline = deadline
+        self.timeout = timeout
+        self.stats_path = stats_path if stats_path is not None else os.path.join(MEDIA_CACHE_DIR, PROVIDER_STATS_FILE)
+        self.executor = ThreadPoolExecutor(max_workers=len(self.providers), thread_name_prefix="link-provider")
+        self.loaded = False
+
+    def _load(self):
+        if self.loaded or not self.stats_path:
+            return
+        self.loaded = True
+        try:
+            with open(self.stats_path, "r") as file:
+                stats = json.load(file)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            logging.error(f"Ignoring corrupt provider stats {self.stats_path}: {e}")
+            return
+        for provider in self.providers:
+            provider.restore(stats.get(provider.name, {}))
+
+    def _save(self):
+        if not self.stats_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.stats_path) or ".", exist_ok=True)
+            atomic_write_json(self.stats_path, {provider.name: provider.snapshot() for provider in self.providers})
+        except OSError as e:
+            logging.warning(f"Could not save provider stats: {e}")
+
+    def ranked(self):
+        """
+        Providers whose circuit is not open, cheapest first (registration order breaks ties).
+        """
+        self._load()
+        return sorted((provider for provider in self.providers if provider.state() != "open"),
+                      key=lambda provider: provider.score())
+
+    def _call(self, provider, video_id):
+        started_at, started = time.time(), time.perf_counter()
+        try:
+            link = provider.fetch(video_id, timeout=self.timeout)
+        except Exception as e:
+            logging.error(f"Provider {provider.name} failed for {video_id}: {e}")
+            link = None
+        provider.record(bool(link), time.perf_counter() - started, started_at)
+        return link
+
+    def resolve(self, video_id):
+        """
+        Return an MP3 link for `video_id`, or None when every available provider failed
+        or the deadline passed.
+        """
+        candidates = self.ranked()
+        deadline = time.monotonic() + self.deadline
+        running = {}
+
+        def start_next():
+            while candidates:
+                provider = candidates.pop(0)
+                if provider.admit():
+                    logging.info(f"Resolving {video_id} through {provider.name}.")
+                    running[self.executor.submit(self._call, provider, video_id)] = provider
+                    return provider
+            return None
+
+        try:
+            primary = start_next()
+            if primary is None:
+                logging.error(f"No link provider available for {video_id}; all circuits are open.")
+                return None
+            hedge_at = time.monotonic() + primary.hedge_delay() if self.hedge else None
+            while running:
+                now = time.monotonic()
+                if now >= deadline:
+                    logging.error(f"Resolving {video_id} missed its {self.deadline}s deadline.")
+                    return None
+                wake_at = min(deadline, hedge_at) if hedge_at else deadline
+                done, _ = wait(list(running), timeout=max(0, wake_at - now), return_when=FIRST_COMPLETED)
+                for future in done:
+                    provider = running.pop(future)
+                    if future.result():
+                        if len(running):
+                            logging.info(f"{provider.name} won the hedged request for {video_id}.")
+                        return future.result()
+                    start_next()  # Fail over at once instead of waiting for the hedge delay
+                if hedge_at and time.monotonic() >= hedge_at:
+                    hedge_at = None
+                    hedged = start_next()
+                    if hedged:
+                        logging.info(f"{primary.name} is slow for {video_id}; hedging with {hedged.name}.")
+            return None
+        finally:
+            self._save()
@@ -0,0 +1,473 @@
+import os
+import atexit
+import json
+import hashlib
+import logging
+import shutil
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+from mp3_stream import cancellable, read_chunks, strip_id3v2, write_tagged_mp3
+from range_download import segmented_mp3_chunks
+
+# ==========================
+# Configuration Variables
+# ==========================
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", ".cache/media")  # Persisted between workflow runs by actions/cache
+FILE_ID_CACHE_FILE = "telegram_file_ids.json"
+AUDIO_CACHE_SUBDIR = "audio"
+AUDIO_INDEX_FILE = "index.json"
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))  # LRU byte budget
+SEARCH_CACHE_FILE = "youtube_search.json"
+SEARCH_TTL_SECONDS = 30 * 24 * 3600  # A chosen video rarely disappears within a month
+SEARCH_NEGATIVE_TTL_SECONDS = 24 * 3600  # "No suitable video" is retried the next day
+LINK_CACHE_FILE = "download_links.json"
+LINK_DEFAULT_TTL_SECONDS = 10 * 60  # Links without an embedded expiry are trusted this long
+LINK_EXPIRY_MARGIN_SECONDS = 90  # Stop serving a link this long before it expires, so the download can finish
+LINK_EXPIRY_PARAMS = ("exp", "expire", "expires")  # Query parameters carrying a link's Unix expiry time
+
+def track_key(track_name, artist_name, album_name=None):
+    """
+    Stable identity of a track: normalized track, artist and album joined together.
+    """
+    parts = (track_name, artist_name or "", album_name or "")
+    return "track:" + "|".join(" ".join(str(part).lower().split()) for part in parts)
+
+def search_key(query, artist_name):
+    """
+    Identity of a YouTube search: the normalized query and the artist the results are matched against.
+    """
+    return "search:" + "|".join(" ".join(str(part or "").lower().split()) for part in (query, artist_name))
+
+def content_key(file_path, chunk_size=1024 * 1024):
+    """
+    Identity of an audio file by the SHA-256 of its bytes.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return "sha256:" + digest.hexdigest()
+
+def atomic_write_json(path, data):
+    """
+    Write JSON through a temporary file and rename it, so readers never see a partial file.
+    """
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w") as file:
+        json.dump(data, file, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+# ==========================
+# Telegram file_id Cache
+# ==========================
+class FileIdCache:
+    """
+    Persistent map from track identity or content hash to the Telegram `file_id` of an
+    uploaded audio file.
+
+    A file_id is valid for every chat of the bot, so once a track is uploaded, later sends,
+    retries and admin test posts reference it instead of uploading the bytes again.
+    Callers `invalidate` an id Telegram rejects and fall back to a fresh upload.
+    """
+
+    def __init__(self, cache_dir=MEDIA_CACHE_DIR, file_name=FILE_ID_CACHE_FILE):
+        self.path = os.path.join(cache_dir, file_name)
+        self.lock = threading.Lock()
+        self.entries = None  # Loaded on first use
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self):
+        if self.entries is None:
+            try:
+                with open(self.path, "r") as file:
+                    self.entries = json.load(file)
+            except FileNotFoundError:
+                self.entries = {}
+            except ValueError as e:
+                logging.error(f"Ignoring corrupt file_id cache {self.path}: {e}")
+                self.entries = {}
+        return self.entries
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        atomic_write_json(self.path, self.entries)
+
+    def get(self, *keys):
+        """
+        Return the file_id stored under the first known key, or None.
+        """
+        with self.lock:
+            entries = self._load()
+            for key in keys:
+                entry = entries.get(key)
+                if entry:
+                    self.hits += 1
+                    return entry["file_id"]
+            self.misses += 1
+            return None
+
+    def put(self, file_id, *keys):
+        with self.lock:
+            entries = self._load()
+            for key in keys:
+                entries[key] = {"file_id": file_id, "stored_at": int(time.time())}
+            self._save()
+
+    def invalidate(self, file_id):
+        """
+        Drop every key pointing at `file_id`. Returns the number of removed keys.
+        """
+        with self.lock:
+            entries = self._load()
+            stale = [key for key, entry in entries.items() if entry["file_id"] == file_id]
+            for key in stale:
+                del entries[key]
+            if stale:
+                self._save()
+            return len(stale)
+
+_file_id_cache = None
+
+def get_file_id_cache():
+    global _file_id_cache
+    if _file_id_cache is None:
+        _file_id_cache = FileIdCache()
+    return _file_id_cache
+
+# ==========================
+# YouTube Search Cache
+# ==========================
+class SearchCache:
+    """
+    Persistent map from a search (see search_key) to the chosen YouTube videoId, or to None
+    when no suitable video was found.
+
+    Each search.list call costs 100 quota units, and retries repeat the same searches, so
+    answers are kept for `ttl` seconds and misses for `negative_ttl`. Hit and miss counts
+    are kept in memory and stored with the entries by `put` and on interpreter exit, so
+    lookups never write and the hit rate still covers every run sharing the cache.
+    """
+
+    def __init__(self, cache_dir=MEDIA_CACHE_DIR, file_name=SEARCH_CACHE_FILE, ttl=SEARCH_TTL_SECONDS,
+                 negative_ttl=SEARCH_NEGATIVE_TTL_SECONDS):
+        self.path = os.path.join(cache_dir, file_name)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.lock = threading.Lock()
+        self.data = None  # Loaded on first use
+        self.stats_dirty = False
+        atexit.register(self.flush)
+
+    def _load(self):
+        if self.data is None:
+            try:
+                with open(self.path, "r") as file:
+                    self.data = json.load(file)
+            except FileNotFoundError:
+                self.data = {}
+            except ValueError as e:
+                logging.error(f"Ignoring corrupt search cache {self.path}: {e}")
+                self.data = {}
+            self.data.setdefault("entries", {})
+            self.data.setdefault("stats", {"hits": 0, "negative_hits": 0, "misses": 0})
+            now = time.time()
+            self.data["entries"] = {key: entry for key, entry in self.data["entries"].items()
+                                    if now < entry["expires_at"]}
+        return self.data
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        atomic_write_json(self.path, self.data)
+        self.stats_dirty = False
+
+    def get(self, key):
+        """
+        Returns:
+            tuple: (found, video_id). video_id is None for a cached "no suitable video".
+        """
+        with self.lock:
+            data = self._load()
+            entry = data["entries"].get(key)
+            if entry and time.time() < entry["expires_at"]:
+                data["stats"]["hits" if entry["video_id"] else "negative_hits"] += 1
+                self.stats_dirty = True
+                return True, entry["video_id"]
+            data["stats"]["misses"] += 1
+            self.stats_dirty = True
+            return False, None
+
+    def put(self, key, video_id):
+        with self.lock:
+            data = self._load()
+            ttl = self.ttl if video_id else self.negative_ttl
+            data["entries"][key] = {"video_id": video_id, "expires_at": time.time() + ttl}
+            self._save()
+
+    def flush(self):
+        """
+        Store hit and miss counts not yet written by `put`.
+        """
+        with self.lock:
+            if self.stats_dirty:
+                try:
+                    self._save()
+                except OSError as e:
+                    logging.warning(f"Could not save search cache stats: {e}")
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self._load()["stats"], entries=len(self.data["entries"]))
+        lookups = stats["hits"] + stats["negative_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["negative_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
+
+_search_cache = None
+
+def get_search_cache():
+    global _search_cache
+    if _search_cache is None:
+        _search_cache = SearchCache()
+    return _search_cache
+
+# ==========================
+# Download Link Cache
+# ==========================
+def link_expiry(url, default_ttl=LINK_DEFAULT_TTL_SECONDS, now=None):
+    """
+    Unix time at which a download link expires: its `exp`-style query parameter (seconds or
+    milliseconds), or `default_ttl` from now for links that do not say.
+    """
+    now = now or time.time()
+    query = parse_qs(urlparse(url).query)
+    for name in LINK_EXPIRY_PARAMS:
+        value = (query.get(name) or [""])[0]
+        if value.isdigit():
+            expiry = int(value)
+            return expiry / 1000 if expiry > 10 ** 12 else expiry
+    return now + default_ttl
+
+class LinkCache:
+    """
+    Persistent map from videoId to its resolved MP3 download link, served until shortly
+    before the link expires, so retries and repeat resolutions spend no API key use.
+    Callers `invalidate` a link whose download failed.
+    """
+
+    def __init__(self, cache_dir=MEDIA_CACHE_DIR, file_name=LINK_CACHE_FILE, margin=LINK_EXPIRY_MARGIN_SECONDS):
+        self.path = os.path.join(cache_dir, file_name)
+        self.margin = margin
+        self.lock = threading.Lock()
+        self.entries = None  # Loaded on first use
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self):
+        if self.entries is None:
+            try:
+                with open(self.path, "r") as file:
+                    self.entries = json.load(file)
+            except FileNotFoundError:
+                self.entries = {}
+            except ValueError as e:
+                logging.error(f"Ignoring corrupt link cache {self.path}: {e}")
+                self.entries = {}
+        return self.entries
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        now = time.time()
+        atomic_write_json(self.path, {key: entry for key, entry in self.entries.items() if entry["expires_at"] > now})
+
+    def get(self, video_id):
+        with self.lock:
+            entry = self._load().get(video_id)
+            if entry and time.time() < entry["expires_at"] - self.margin:
+                self.hits += 1
+                return entry["url"]
+            self.misses += 1
+            return None
+
+    def put(self, video_id, url):
+        with self.lock:
+            self._load()[video_id] = {"url": url, "expires_at": link_expiry(url)}
+            self._save()
+
+    def invalidate(self, video_id):
+        with self.lock:
+            if self._load().pop(video_id, None):
+                self._save()
+
+_link_cache = None
+
+def get_link_cache():
+    global _link_cache
+    if _link_cache is None:
+        _link_cache = LinkCache()
+    return _link_cache
+
+# ==========================
+# Audio Cache
+# ==========================
+class AudioCache:
+    """
+    Content-addressed on-disk cache of downloaded MP3 files.
+
+    Files are stored once under the SHA-256 of their bytes; the index maps track keys
+    to hashes and records each file's size and last use. Writes go to a temporary file
+    that is renamed into place, so an interrupted download never leaves a partial entry.
+    When the cache exceeds `max_bytes`, the least recently used files are evicted.
+    Callers get copies (`checkout`), so tagging or deleting them never touches the cache.
+    """
+
+    def __init__(self, cache_dir=MEDIA_CACHE_DIR, max_bytes=AUDIO_CACHE_MAX_BYTES):
+        self.dir = os.path.join(cache_dir, AUDIO_CACHE_SUBDIR)
+        self.index_path = os.path.join(self.dir, AUDIO_INDEX_FILE)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.index = None  # Loaded on first use
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self):
+        if self.index is None:
+            try:
+                with open(self.index_path, "r") as file:
+                    self.index = json.load(file)
+            except FileNotFoundError:
+                self.index = {}
+            except ValueError as e:
+                logging.error(f"Ignoring corrupt audio cache index {self.index_path}: {e}")
+                self.index = {}
+            self.index.setdefault("tracks", {})
+            self.index.setdefault("files", {})
+            self.index.setdefault("stats", {"hits": 0, "misses": 0, "evictions": 0})
+        return self.index
+
+    def _save(self):
+        os.makedirs(self.dir, exist_ok=True)
+        atomic_write_json(self.index_path, self.index)
+
+    def _blob_path(self, digest):
+        return os.path.join(self.dir, f"{digest}.mp3")
+
+    def lookup(self, key):
+        """
+        Return the cached file path for `key`, or None. Counts a hit or a miss.
+        """
+        with self.lock:
+            index = self._load()
+            digest = index["tracks"].get(key)
+            entry = index["files"].get(digest) if digest else None
+            if entry and os.path.exists(self._blob_path(digest)):
+                entry["last_used"] = time.time()
+                self.hits += 1
+                index["stats"]["hits"] += 1
+                self._save()
+                return self._blob_path(digest)
+            if digest:
+                index["tracks"].pop(key, None)  # Evicted or removed by hand
+            self.misses += 1
+            index["stats"]["misses"] += 1
+            self._save()
+            return None
+
+    def checkout(self, key, dest_path, tag=b""):
+        """
+        Write the cached audio for `key` to `dest_path`, preceded by `tag` (see write_tagged_mp3).
+        Returns dest_path, or None on a miss.
+        """
+        blob_path = self.lookup(key)
+        if blob_path is None:
+            return None
+        if tag:
+            write_tagged_mp3(dest_path, tag, read_chunks(blob_path))
+        else:
+            shutil.copyfile(blob_path, dest_path)
+        logging.info(f"Audio cache hit for {key}")
+        return dest_path
+
+    def tee(self, key, chunks):
+        """
+        Yield `chunks` unchanged while storing them under `key`. The entry is committed
+        only when the stream ends; an abandoned or failed stream leaves no trace.
+        """
+        os.makedirs(self.dir, exist_ok=True)
+        tmp_path = os.path.join(self.dir, f".partial.{os.getpid()}.{threading.get_ident()}")
+        digest, size = hashlib.sha256(), 0
+        try:
+            with open(tmp_path, "wb") as file:
+                for chunk in chunks:
+                    if chunk:
+                        file.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+                        yield chunk
+            os.replace(tmp_path, self._blob_path(digest.hexdigest()))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        with self.lock:
+            index = self._load()
+            index["tracks"][key] = digest.hexdigest()
+            index["files"][digest.hexdigest()] = {"size": size, "last_used": time.time()}
+            self._evict(keep=digest.hexdigest())
+            self._save()
+
+    def save_download(self, key, chunks, dest_path, tag=b""):
+        """
+        Stream a download into the cache and, in the same pass, to `dest_path` behind `tag`.
+        Any ID3 tag of the source is dropped. Returns dest_path.
+        """
+        try:
+            write_tagged_mp3(dest_path, tag, self.tee(key, strip_id3v2(chunks)))
+        except BaseException:
+            if os.path.exists(dest_path):
+                os.remove(dest_path)
+            raise
+        logging.info(f"Audio cache stored {key}: {self.stats()}")
+        return dest_path
+
+    def download(self, key, url, dest_path, tag=b"", cancel=None):
+        """
+        Download an MP3 from `url` through `save_download`, validating it while it streams.
+        Servers supporting ranges are read over several concurrent connections (see
+        segmented_mp3_chunks). Raises InvalidAudioError (or a requests exception) as soon
+        as the download is unusable, and DownloadCancelled once the `cancel` event is set.
+        """
+        os.makedirs(self.dir, exist_ok=True)
+        scratch_path = os.path.join(self.dir, f".segments.{os.getpid()}.{threading.get_ident()}")
+        chunks = segmented_mp3_chunks(url, scratch_path)
+        return self.save_download(key, cancellable(chunks, cancel) if cancel else chunks, dest_path, tag)
+
+    def _evict(self, keep=None):
+        files = self.index["files"]
+        total = sum(entry["size"] for entry in files.values())
+        for digest in sorted(files, key=lambda item: files[item]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if digest == keep:
+                continue
+            total -= files.pop(digest)["size"]
+            self.index["stats"]["evictions"] += 1
+            try:
+                os.remove(self._blob_path(digest))
+            except FileNotFoundError:
+                pass
+        live = set(files)
+        self.index["tracks"] = {key: digest for key, digest in self.index["tracks"].items() if digest in live}
+
+    def stats(self):
+        with self.lock:
+            index = self._load()
+            return dict(index["stats"], session_hits=self.hits, session_misses=self.misses,
+                        files=len(index["files"]), bytes=sum(entry["size"] for entry in index["files"].values()))
+
+_audio_cache = None
+
+def get_audio_cache():
+    global _audio_cache
+    if _audio_cache is None:
+        _audio_cache = AudioCache()
+    return _audio_cache
@@ -0,0 +1,214 @@
+import io
+import itertools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from mutagen.id3 import ID3, APIC, TIT2, TPE1, TALB
+
+# ==========================
+# Configuration Variables
+# ==========================
+STREAM_CHUNK_BYTES = 256 * 1024  # Network reads and disk writes happen in chunks of this size
+COVER_TIMEOUT_SECONDS = 10  # Longest the first audio byte waits for the cover art
+PROBE_BYTES = 1024  # First read of a download, enough to reject non-audio responses
+VALIDATE_FRAMES = 3  # Consecutive MPEG frame headers a download must start with
+MAX_AUDIO_BYTES = 49 * 1024 * 1024  # Telegram bots may upload 50 MB; leave room for the ID3 tag
+MIN_AUDIO_BYTES = 16 * 1024  # Anything smaller is an error page, not a song
+DOWNLOAD_TIMEOUT = (5, 30)  # Connect and per-read timeouts of audio downloads
+REJECTED_CONTENT_TYPES = ("text/", "application/json", "application/xml", "application/javascript")
+
+# MPEG audio frame header tables, indexed by the header's bitrate and sample rate fields
+BITRATES_KBPS = {
+    (3, 3): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),  # MPEG-1 Layer I
+    (3, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),  # MPEG-1 Layer II
+    (3, 1): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),  # MPEG-1 Layer III
+    (2, 3): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),  # MPEG-2/2.5 Layer I
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),  # MPEG-2/2.5 Layer II/III
+}
+SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+_cover_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cover-fetch")
+
+class InvalidAudioError(Exception):
+    """
+    Raised while downloading when the response is evidently not a usable MP3.
+    """
+
+class DownloadCancelled(Exception):
+    """
+    Raised inside a download whose cancel event was set, so it stops at the next chunk.
+    """
+
+def fetch_cover_async(url):
+    """
+    Start downloading cover art in the background. Returns a future of the image bytes (or None).
+    """
+    def fetch():
+        try:
+            response = requests.get(url, timeout=COVER_TIMEOUT_SECONDS)
+            response.raise_for_status()
+            return response.content
+        except requests.exceptions.RequestException as e:
+            logging.warning(f"Failed to fetch cover art {url}: {e}")
+            return None
+    return _cover_executor.submit(fetch) if url else None
+
+def build_id3_tag(track_name, artist_name, album_name=None, cover=None):
+    """
+    Render a complete ID3v2 tag as bytes, ready to be written in front of the audio frames.
+    """
+    tags = ID3()
+    tags.add(TIT2(encoding=3, text=track_name))  # Track name
+    tags.add(TPE1(encoding=3, text=artist_name if artist_name else "Unknown Artist"))  # Artist name
+    if album_name:
+        tags.add(TALB(encoding=3, text=album_name))  # Album name
+    if cover:
+        tags.add(APIC(encoding=3, mime="image/jpeg", type=3, desc="Cover", data=cover))
+    buffer = io.BytesIO()
+    tags.save(buffer, padding=lambda info: 0)
+    return buffer.getvalue()
+
+def _syncsafe(data):
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+def strip_id3v2(chunks):
+    """
+    Yield the audio of an MP3 byte stream without any leading ID3v2 tag, so our own tag
+    is the only one in the written file.
+    """
+    buffer = b""
+    chunks = iter(chunks)
+    for chunk in chunks:
+        buffer += chunk
+        if len(buffer) >= 10:
+            break
+    while buffer[:3] == b"ID3" and len(buffer) >= 10:
+        tag_size = 10 + _syncsafe(buffer[6:10]) + (10 if buffer[5] & 0x10 else 0)
+        while len(buffer) < tag_size:
+            chunk = next(chunks, None)
+            if chunk is None:
+                return
+            buffer += chunk
+        buffer = buffer[tag_size:]
+        while len(buffer) < 10:
+            chunk = next(chunks, None)
+            if chunk is None:
+                break
+            buffer += chunk
+    if buffer:
+        yield buffer
+    yield from chunks
+
+def mpeg_frame_length(header):
+    """
+    Return the length in bytes of the MPEG audio frame starting with the 4-byte `header`,
+    or None if the bytes are not a valid frame header (sync word, version, layer,
+    bitrate and sample rate are all checked).
+    """
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = (header[1] >> 3) & 0x03  # 3: MPEG-1, 2: MPEG-2, 0: MPEG-2.5, 1: reserved
+    layer = (header[1] >> 1) & 0x03  # 3: Layer I, 2: Layer II, 1: Layer III, 0: reserved
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+    padding = (header[2] >> 1) & 0x01
+    if version == 1 or layer == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    table = (3, layer) if version == 3 else (2, 3 if layer == 3 else 2)
+    bitrate = BITRATES_KBPS[table][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][sample_rate_index]
+    if layer == 3:
+        return (12 * bitrate // sample_rate + padding) * 4
+    if layer == 1 and version != 3:
+        return 72 * bitrate // sample_rate + padding
+    return 144 * bitrate // sample_rate + padding
+
+def check_mpeg_start(data, frames=VALIDATE_FRAMES):
+    """
+    Check that `data` (the start of a download) holds an optional ID3v2 tag followed by
+    `frames` chained MPEG frame headers.
+    Returns:
+        bool or None: True if valid, False if not, None if more bytes are needed.
+    """
+    position = 0
+    if data[:3] == b"ID3":
+        if len(data) < 10:
+            return None
+        position = 10 + _syncsafe(data[6:10]) + (10 if data[5] & 0x10 else 0)
+    for _ in range(frames):
+        if len(data) < position + 4:
+            return None
+        length = mpeg_frame_length(data[position:position + 4])
+        if not length:
+            return False
+        position += length
+    return True
+
+def check_response_headers(response, max_bytes=MAX_AUDIO_BYTES):
+    """
+    Reject a download before reading its body when its headers already rule out an MP3.
+    """
+    if response.status_code not in (200, 206):  # 206: the `bytes=0-` request of a segmented download
+        raise InvalidAudioError(f"HTTP {response.status_code}")
+    content_type = response.headers.get("Content-Type", "").lower()
+    if content_type.startswith(REJECTED_CONTENT_TYPES):
+        raise InvalidAudioError(f"Content-Type {content_type} is not audio")
+    length = response.headers.get("Content-Length")
+    if length and length.isdigit():
+        if int(length) > max_bytes:
+            raise InvalidAudioError(f"Content-Length {int(length)} exceeds the {max_bytes} byte cap")
+        if int(length) < MIN_AUDIO_BYTES:
+            raise InvalidAudioError(f"Content-Length {int(length)} is too small for a song")
+
+def validated_mp3_chunks(response, max_bytes=MAX_AUDIO_BYTES, chunk_size=STREAM_CHUNK_BYTES):
+    """
+    Yield the body of a streamed `requests` response, validating it on the way: headers
+    first, then the first MPEG frames from a small probe read, then the running size.
+    Raises InvalidAudioError as soon as the download is known to be unusable.
+    """
+    check_response_headers(response, max_bytes)
+    buffer, total = b"", 0
+    probe = [response.raw.read(PROBE_BYTES, decode_content=True)]
+    for chunk in itertools.chain(probe, response.iter_content(chunk_size)):
+        total += len(chunk)
+        if total > max_bytes:
+            raise InvalidAudioError(f"Download exceeds the {max_bytes} byte cap")
+        if buffer is None:
+            yield chunk
+            continue
+        buffer += chunk
+        status = check_mpeg_start(buffer)
+        if status is False:
+            raise InvalidAudioError(f"No MPEG audio frames at the start: {buffer[:32]!r}")
+        if status:
+            yield buffer
+            buffer = None
+    if buffer is not None:
+        raise InvalidAudioError(f"Download ended after {total} bytes, before any complete MPEG frames")
+
+def cancellable(chunks, cancel):
+    """
+    Pass `chunks` through until the threading.Event `cancel` is set.
+    """
+    for chunk in chunks:
+        if cancel.is_set():
+            raise DownloadCancelled("Download cancelled")
+        yield chunk
+
+def write_tagged_mp3(dest_path, tag, chunks):
+    """
+    Write an ID3 tag followed by the audio `chunks` to `dest_path` in one sequential pass.
+    `tag` is bytes, or a callable returning bytes that is resolved only once the first
+    audio chunk has arrived, so the cover download overlaps the wait for the audio.
+    """
+    chunks = iter(chunks)
+    first = next(chunks, b"")
+    with open(dest_path, "wb") as file:
+        file.write(tag() if callable(tag) else tag)
+        file.write(first)
+        for chunk in chunks:
+            file.write(chunk)
+    return dest_path
+
+def read_chunks(path, chunk_size=STREAM_CHUNK_BYTES):
+    with open(path, "rb") as file:
+        yield from iter(lambda: file.read(chunk_size), b"")
@@ -1,26 +1,35 @@
 import yaml
 import os
-import subprocess
+import html
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
+from telegram.error import BadRequest
+from telegram.ext import Application, ApplicationHandlerStop, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, TypeHandler, filters
 import asyncio
+import signal
 import nest_asyncio
-from collections import defaultdict
-from datetime import datetime, timedelta
+from datetime import timedelta
 import sys
+import time
+import threading
 import requests
 from api_key_stats import get_api_key_stats  
+from broadcast import broadcast
+from user_store import UserStore
+from rate_limiter import SlidingWindowLimiter
+from scheduler import ActionScheduler
+from user_search import UserSearchIndex
+from webhook import ALLOWED_UPDATES, run_webhook
+from state_snapshot import SNAPSHOT_INTERVAL_SECONDS, StateSnapshot, json_safe, pack_sections, unpack_sections
+from lease import FileLeaseStore, GitHubLeaseStore, LeaseManager, UpdateFence
 
 # ==========================
 # Configuration Variables
 # ==========================
 nest_asyncio.apply()
+PROCESS_STARTED = time.perf_counter()  # Reference point of the startup timing report
 
 # Load admin chat IDs from secrets (support multiple admins)
 ADMIN_CHAT_IDS = os.getenv("ADMIN_CHAT_ID", "").split(",")  # Split by comma for multiple admin IDs
-GH_PAT = os.getenv("GH_PAT")  # GitHub Personal Access Token
-REPO_URL = "github.com/Zudiaq/panel_user_data.git"  # GitHub repository URL
-USER_DATA_FILE = "panel_user_data.yaml"  # User data file name
 MESSAGE_LIMITS = {  # Message limits per user
     "text": 40,
     "photo": 10,
@@ -31,6 +40,20 @@ MESSAGE_LIMITS = {  # Message limits per user
     "animation": 5,
 }
 LIMIT_DURATION_MINUTES = 30  # Duration of the limit in minutes
+USER_PAGE_SIZE = 15  # Users per page in the admin user list and user pickers
+MAX_MESSAGE_LENGTH = 4096  # Telegram limit for message text
+MAX_CAPTION_LENGTH = 1024  # Telegram limit for media captions
+CAPTIONED_MEDIA = ("photo", "video", "audio", "voice", "document", "animation")  # Media types that accept a caption
+
+# Update delivery: "polling" (default) or "webhook" when the panel is reachable from Telegram
+PANEL_MODE = os.getenv("PANEL_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Public HTTPS base URL of the panel, required in webhook mode
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # Generated per run when unset
+PANEL_LEASE_FILE = os.getenv("PANEL_LEASE_FILE")  # Local lease file; the GitHub lease is used when unset
+HANDOVER_DEADLINE_SECONDS = 15 * 60  # Time the next workflow run gets to start and take over the lease
 
 # Command rate limits (modifiable by the developer)
 COMMAND_RATE_LIMITS = {
@@ -42,192 +65,160 @@ COMMAND_RATE_LIMITS = {
 # ==========================
 # Global Variables
 # ==========================
-user_message_counts = defaultdict(lambda: defaultdict(int))
-user_limit_reset_times = defaultdict(lambda: defaultdict(lambda: datetime.now() + timedelta(minutes=LIMIT_DURATION_MINUTES)))
-user_warning_messages = defaultdict(dict)  # Store warning messages per user and media type
-user_command_counts = defaultdict(lambda: defaultdict(int))  # Track command usage per user
-user_command_reset_times = defaultdict(lambda: defaultdict(lambda: datetime.now()))  # Reset times for commands
+message_limiters = {  # Sliding-window limiters per message type; unknown types have a limit of 0
+    message_type: SlidingWindowLimiter(limit, LIMIT_DURATION_MINUTES * 60)
+    for message_type, limit in MESSAGE_LIMITS.items()
+}
+command_limiters = {  # Sliding-window limiters per command
+    command: SlidingWindowLimiter(rule["limit"], rule["reset_duration"].total_seconds())
+    for command, rule in COMMAND_RATE_LIMITS.items()
+}
+action_scheduler = ActionScheduler()  # Deferred deletions and edits; pending warnings are keyed per user and type
+user_search_index = UserSearchIndex()  # Trigram index over names, usernames and chat IDs
+search_index_lock = threading.Lock()  # Guards the rebuild state below
+search_index_building = False
+search_index_stale = False  # Set by reloads that arrive while a rebuild is running
+search_index_changes = None  # User changes recorded while a rebuild is running
+user_page_cache = {}  # Rendered user list pages and page counts, valid for user_page_cache_version
+user_page_cache_version = None
 admin_last_message_ids = {}  # Track the last admin panel message ID per admin
-cached_users = []  # Initialize cached_users
-user_languages = defaultdict(lambda: "en")  # Default to English
+user_store = UserStore()  # SQLite-backed users, persisted write-behind to the user data repository
+user_languages = {}  # Languages chosen via /lang, overriding the registry
+state_snapshot = StateSnapshot()  # Warm-restart snapshot of the in-memory state above
+update_fence = UpdateFence()  # Drops updates already processed by the previous leader
+panel_lease = None  # Leader lease shared with the next panel instance, created in main()
+startup_marks = []  # (label, perf_counter) pairs for the startup timing report
 
 # ==========================
 # Helper Functions
 # ==========================
-def sync_repo():
-    if not os.path.exists("repo"):
-        subprocess.run(["git", "clone", f"https://{GH_PAT}@{REPO_URL}", "repo"], check=True)
-    else:
-        subprocess.run(["git", "-C", "repo", "pull"], check=True)
-
-def push_changes():
-    subprocess.run(["git", "-C", "repo", "config", "user.email", "you@example.com"], check=True)
-    subprocess.run(["git", "-C", "repo", "config", "user.name", "Your Name"], check=True)
-    subprocess.run(["git", "-C", "repo", "add", USER_DATA_FILE], check=True)
-    subprocess.run(["git", "-C", "repo", "commit", "-m", "Update user data"], check=True)
-    subprocess.run(["git", "-C", "repo", "push"], check=True)
-
 def round_to_nearest_15_minutes(minutes: int) -> int:
     return ((minutes + 14) // 15) * 15
 
+def warning_key(user_id: int, message_type: str) -> str:
+    return f"warning:{user_id}:{message_type}"
+
 async def send_temporary_message(context: ContextTypes.DEFAULT_TYPE, chat_id: int, text: str, delay: int = 5):
     message = await context.bot.send_message(chat_id=chat_id, text=text)
-    await asyncio.sleep(delay)
-    try:
-        await context.bot.delete_message(chat_id=chat_id, message_id=message.message_id)
-    except Exception:
-        pass
+    action_scheduler.schedule_delete(chat_id, message.message_id, delay)
+
+async def deliver_media_or_text(bot, message, chat_id: int):
+    """
+    Re-send the content of `message` to `chat_id`. Raises on failure.
+    """
+    if message.photo:
+        await bot.send_photo(chat_id=chat_id, photo=message.photo[-1].file_id, caption=message.caption or "")
+    elif message.video:
+        await bot.send_video(chat_id=chat_id, video=message.video.file_id, caption=message.caption or "")
+    elif message.audio:
+        await bot.send_audio(chat_id=chat_id, audio=message.audio.file_id, caption=message.caption or "")
+    elif message.voice:
+        await bot.send_voice(chat_id=chat_id, voice=message.voice.file_id, caption=message.caption or "")
+    elif message.document:
+        await bot.send_document(chat_id=chat_id, document=message.document.file_id, caption=message.caption or "")
+    elif message.animation:
+        await bot.send_animation(chat_id=chat_id, animation=message.animation.file_id, caption=message.caption or "")
+    elif message.sticker:
+        await bot.send_sticker(chat_id=chat_id, sticker=message.sticker.file_id)
+    elif message.video_note:
+        await bot.send_video_note(chat_id=chat_id, video_note=message.video_note.file_id)
+    elif message.location:
+        await bot.send_location(chat_id=chat_id, latitude=message.location.latitude, longitude=message.location.longitude)
+    elif message.text:
+        await bot.send_message(chat_id=chat_id, text=message.text)
+    else:
+        raise ValueError("Unsupported message type")
+
+def is_supported_media(message) -> bool:
+    if message.video and (message.video.file_size or 0) > 50 * 1024 * 1024:
+        return False
+    if message.audio and (message.audio.file_size or 0) > 50 * 1024 * 1024:
+        return False
+    return bool(
+        message.photo or message.video or message.audio or message.voice or message.document
+        or message.animation or message.sticker or message.video_note or message.location or message.text
+    )
 
 async def send_media_or_text(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int):
     user_id = update.effective_user.id
+    if not is_supported_media(update.message):
+        await update.message.reply_text(t(user_id, "unsupported_type"))
+        return
     try:
-        if update.message.photo:
-            await context.bot.send_photo(chat_id=chat_id, photo=update.message.photo[-1].file_id, caption=update.message.caption or "")
-        elif update.message.video:
-            if update.message.video.file_size > 50 * 1024 * 1024:
-                await update.message.reply_text(t(user_id, "unsupported_type"))
-                return
-            await context.bot.send_video(chat_id=chat_id, video=update.message.video.file_id, caption=update.message.caption or "")
-        elif update.message.audio:
-            if update.message.audio.file_size > 50 * 1024 * 1024:
-                await update.message.reply_text(t(user_id, "unsupported_type"))
-                return
-            await context.bot.send_audio(chat_id=chat_id, audio=update.message.audio.file_id, caption=update.message.caption or "")
-        elif update.message.voice:
-            await context.bot.send_voice(chat_id=chat_id, voice=update.message.voice.file_id, caption=update.message.caption or "")
-        elif update.message.document:
-            await context.bot.send_document(chat_id=chat_id, document=update.message.document.file_id, caption=update.message.caption or "")
-        elif update.message.animation:
-            await context.bot.send_animation(chat_id=chat_id, animation=update.message.animation.file_id, caption=update.message.caption or "")
-        elif update.message.sticker:
-            await context.bot.send_sticker(chat_id=chat_id, sticker=update.message.sticker.file_id)
-        elif update.message.video_note:
-            await context.bot.send_video_note(chat_id=chat_id, video_note=update.message.video_note.file_id)
-        elif update.message.location:
-            await context.bot.send_location(chat_id=chat_id, latitude=update.message.location.latitude, longitude=update.message.location.longitude)
-        elif update.message.text:
-            await context.bot.send_message(chat_id=chat_id, text=update.message.text)
-        else:
-            await update.message.reply_text(t(user_id, "unsupported_type"))
+        await deliver_media_or_text(context.bot, update.message, chat_id)
     except Exception as e:
         await update.message.reply_text(f"Failed to send message: {e}")
 
 def load_users_and_languages():
-    global cached_users, user_languages
     try:
-        sync_repo()
-        file_path = os.path.join("repo", USER_DATA_FILE)
-        if os.path.exists(file_path):
-            with open(file_path, "r") as file:
-                cached_users = yaml.safe_load(file) or []
-            for user in cached_users:
-                if "chat_id" in user and "language" in user:
-                    user_languages[user["chat_id"]] = user["language"]
+        user_store.load()
         print("Users and languages loaded successfully.")
     except Exception as e:
         print(f"Error loading users and languages: {e}")
 
-def save_users_and_languages():
-    global cached_users
-    try:
-        file_path = os.path.join("repo", USER_DATA_FILE)
-        with open(file_path, "w") as file:
-            yaml.dump(cached_users, file)
-        push_changes()
-        print("Users and languages saved successfully.")
-    except Exception as e:
-        print(f"Error saving users and languages: {e}")
-
 def get_user_language(user_id):
-    return user_languages[user_id]
+    # Explicit choices of unregistered users live in memory; registered users are looked up by key
+    if user_id in user_languages:
+        return user_languages[user_id]
+    return user_store.get_language(user_id) or DEFAULT_LANGUAGE
 
 async def check_command_limit(user_id: int, command: str) -> bool:
     """
     Check if the user has exceeded the limit for a specific command.
     """
-    now = datetime.now()
-
-    # Get the command limit and reset duration
-    command_limit = COMMAND_RATE_LIMITS.get(command, {"limit": 0, "reset_duration": timedelta(days=1)})
-    limit = command_limit["limit"]
-    reset_duration = command_limit["reset_duration"]
-
-    # Reset command count if the reset time has passed
-    if now >= user_command_reset_times[user_id][command]:
-        user_command_counts[user_id][command] = 0
-        user_command_reset_times[user_id][command] = now + reset_duration
-
-    # Increment the command count
-    user_command_counts[user_id][command] += 1
-
-    # Check if the user has exceeded the limit
-    if user_command_counts[user_id][command] > limit:
-        return False  # Exceeded limit
-
-    return True  # Within limit
+    if command not in command_limiters:
+        command_limiters[command] = SlidingWindowLimiter(0, timedelta(days=1).total_seconds())
+    allowed, _ = command_limiters[command].hit(user_id)
+    return allowed
 
 # ==========================
 # Core Functions
 # ==========================
 async def check_message_limit(update: Update, context: ContextTypes.DEFAULT_TYPE, message_type: str):
     user_id = update.effective_user.id
-    now = datetime.now()
-
-    # Reset message counts for the specific message type if the reset time has passed
-    if now >= user_limit_reset_times[user_id][message_type]:
-        user_message_counts[user_id][message_type] = 0
-        user_limit_reset_times[user_id][message_type] = now + timedelta(minutes=LIMIT_DURATION_MINUTES)
-        # Clear the warning message for this message type
-        if message_type in user_warning_messages[user_id]:
-            try:
-                await context.bot.delete_message(chat_id=user_id, message_id=user_warning_messages[user_id][message_type])
-            except Exception:
-                pass
-            del user_warning_messages[user_id][message_type]
-
-    # Increment the message count for the specific message type
-    user_message_counts[user_id][message_type] += 1
-
-    # Check if the user has exceeded the limit for the given message type
-    if user_message_counts[user_id][message_type] > MESSAGE_LIMITS.get(message_type, 0):
-        # Apply the restriction for this message type
-        user_limit_reset_times[user_id][message_type] = now + timedelta(minutes=LIMIT_DURATION_MINUTES)
-
-        # Calculate remaining time and round to the nearest 15 minutes
-        remaining_time = (user_limit_reset_times[user_id][message_type] - now).seconds // 60
-        rounded_time = round_to_nearest_15_minutes(remaining_time)
-        warning_text = t(user_id, "limit_warning", type=message_type, minutes=rounded_time)
-
-        # Send or update the warning message for this message type
-        if message_type in user_warning_messages[user_id]:
-            try:
-                await context.bot.edit_message_text(chat_id=user_id, message_id=user_warning_messages[user_id][message_type], text=warning_text)
-            except Exception:
-                pass
-        else:
-            warning_message = await update.message.reply_text(warning_text)
-            user_warning_messages[user_id][message_type] = warning_message.message_id
-
-        # Schedule deletion of the warning message after the limit duration
-        asyncio.create_task(delete_warning_message(context, user_id, message_type, LIMIT_DURATION_MINUTES * 60))
-
-        # Delete the user's message to enforce the limit
-        try:
-            await context.bot.delete_message(chat_id=update.effective_chat.id, message_id=update.message.message_id)
-        except Exception:
-            pass
-        return False
+    if message_type not in message_limiters:
+        message_limiters[message_type] = SlidingWindowLimiter(MESSAGE_LIMITS.get(message_type, 0), LIMIT_DURATION_MINUTES * 60)
+    allowed, retry_after = message_limiters[message_type].hit(user_id)
+    key = warning_key(user_id, message_type)
+    warning = action_scheduler.get(key)
+
+    if allowed:
+        # The window has room again, so clear the warning message for this message type now
+        if warning:
+            action_scheduler.reschedule(key, 0)
+        return True
+
+    # Calculate remaining time and round to the nearest 15 minutes
+    remaining_time = int(retry_after) // 60
+    rounded_time = round_to_nearest_15_minutes(remaining_time)
+    warning_text = t(user_id, "limit_warning", type=message_type, minutes=rounded_time)
+
+    # Update the existing warning message or send a new one, then (re)schedule its deletion
+    # for when the limit resets. Repeated breaches move the same timer instead of adding one.
+    if warning:
+        action_scheduler.schedule_edit(user_id, warning["message_id"], warning_text, key=f"{key}:edit")
+        action_scheduler.reschedule(key, retry_after)
+    else:
+        warning_message = await update.message.reply_text(warning_text)
+        action_scheduler.schedule_delete(user_id, warning_message.message_id, retry_after, key=key)
 
-    return True
+    # Delete the user's message to enforce the limit
+    action_scheduler.schedule_delete(update.effective_chat.id, update.message.message_id, 0)
+    return False
 
-async def delete_warning_message(context: ContextTypes.DEFAULT_TYPE, user_id: int, message_type: str, delay: int):
-    await asyncio.sleep(delay)
-    if message_type in user_warning_messages[user_id]:
-        try:
-            await context.bot.delete_message(chat_id=user_id, message_id=user_warning_messages[user_id][message_type])
-        except Exception:
-            pass
-        del user_warning_messages[user_id][message_type]
+async def run_broadcast(context: ContextTypes.DEFAULT_TYPE, message, admin_chat_id: int, admin_id: int, chat_ids):
+    """
+    Deliver a broadcast through the rate-limited engine and report the outcome to the admin.
+    """
+    report = await broadcast(chat_ids, lambda chat_id: deliver_media_or_text(context.bot, message, chat_id))
+    await context.bot.send_message(
+        chat_id=admin_chat_id,
+        text=t(
+            admin_id, "broadcast_sent",
+            sent=report.sent, total=report.total, failed=report.failed, blocked=report.blocked,
+            elapsed=round(report.elapsed, 1), rate=round(report.throughput, 1)
+        )
+    )
 
 async def forward_user_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
@@ -240,9 +231,34 @@ async def forward_user_message(update: Update, context: ContextTypes.DEFAULT_TYP
         username=user.username or "N/A",
         chat_id=user.id
     )
-    for admin_id in ADMIN_CHAT_IDS:
-        await context.bot.send_message(chat_id=admin_id, text=user_info)
-        await send_media_or_text(update, context, admin_id)
+    # Deliver to every admin concurrently in the background; the user's update is done once queued
+    context.application.create_task(fan_out_to_admins(context.bot, update.message, user_info))
+
+async def copy_to_admin(bot, message, admin_id, user_info: str):
+    """
+    Deliver a user message to one admin with the sender header attached, in one call where possible.
+    """
+    if message.text and len(user_info) + len(message.text) + 2 <= MAX_MESSAGE_LENGTH:
+        await bot.send_message(chat_id=admin_id, text=f"{user_info}\n\n{message.text}")
+        return
+    if any(getattr(message, media) for media in CAPTIONED_MEDIA):
+        caption = f"{user_info}\n\n{message.caption}" if message.caption else user_info
+        if len(caption) <= MAX_CAPTION_LENGTH:
+            await bot.copy_message(chat_id=admin_id, from_chat_id=message.chat_id, message_id=message.message_id, caption=caption)
+            return
+    # Stickers, video notes, locations and oversized texts cannot carry the header
+    await bot.send_message(chat_id=admin_id, text=user_info)
+    await bot.copy_message(chat_id=admin_id, from_chat_id=message.chat_id, message_id=message.message_id)
+
+async def fan_out_to_admins(bot, message, user_info: str):
+    admin_ids = [admin_id.strip() for admin_id in ADMIN_CHAT_IDS if admin_id.strip()]
+    results = await asyncio.gather(
+        *(copy_to_admin(bot, message, admin_id, user_info) for admin_id in admin_ids),
+        return_exceptions=True
+    )
+    for admin_id, result in zip(admin_ids, results):
+        if isinstance(result, Exception):
+            print(f"Failed to forward message from {message.chat_id} to admin {admin_id}: {result}")
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
@@ -286,19 +302,16 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await send_temporary_message(context, update.effective_chat.id, t(user_id, "no_target_user"))
         context.user_data["awaiting_message"] = False
 
+    elif context.user_data.get("awaiting_search") and update.message.text:
+        context.user_data["awaiting_search"] = False
+        prompt_message_id = context.user_data.pop("prompt_message_id", None)
+        if prompt_message_id:
+            action_scheduler.schedule_delete(update.effective_chat.id, prompt_message_id, 0)
+        text, reply_markup = render_search_results(user_id, update.message.text)
+        await update.message.reply_text(text, reply_markup=reply_markup)
+
     elif context.user_data.get("awaiting_broadcast_message"):
-        sync_repo()
-        file_path = os.path.join("repo", USER_DATA_FILE)
-        with open(file_path, "r") as file:
-            users = yaml.safe_load(file) or []
-        for user in users:
-            if str(user["chat_id"]) in ADMIN_CHAT_IDS:
-                continue
-            try:
-                await send_media_or_text(update, context, user["chat_id"])
-            except Exception:
-                pass
-        await update.message.reply_text(t(user_id, "broadcast_sent"))
+        context.user_data["awaiting_broadcast_message"] = False
         prompt_message_id = context.user_data.get("prompt_message_id")
         if prompt_message_id:
             try:
@@ -306,7 +319,15 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             except Exception:
                 pass
             context.user_data.pop("prompt_message_id", None)
-        context.user_data["awaiting_broadcast_message"] = False
+        if not is_supported_media(update.message):
+            await update.message.reply_text(t(user_id, "unsupported_type"))
+            return
+        chat_ids = user_store.chat_ids(exclude_admins=True)
+        await update.message.reply_text(t(user_id, "broadcast_started", count=len(chat_ids)))
+        # Run the broadcast in the background so other handlers keep being served
+        context.application.create_task(
+            run_broadcast(context, update.message, update.effective_chat.id, user_id, chat_ids)
+        )
 
     else:
         await forward_user_message(update, context)
@@ -319,8 +340,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await check_command_limit(user_id, "start"):
         return  # Do not process further if limit is exceeded
 
-    # Check if user already exists in cached_users
-    if any(u["chat_id"] == user_id for u in cached_users):
+    # Check if user already exists in the user store
+    if user_id in user_store:
         return  # Do not send welcome message if user already exists
 
     user_data = {
@@ -328,17 +349,30 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "username": user.username,
         "first_name": user.first_name,
         "last_name": user.last_name,
-        "language": user_languages[user_id],
+        "language": get_user_language(user_id),
     }
 
-    # Add user to cached_users
-    cached_users.append(user_data)
-    save_users_and_languages()
+    # Add user to the user store; it is pushed to the repository in the background
+    user_store.add(user_data)
+    user_languages.pop(user_id, None)
 
     # Send welcome message
     await update.message.reply_text(t(user_id, "welcome_user", name=user.first_name))
     await context.bot.send_message(chat_id=ADMIN_CHAT_IDS[0], text=t(user_id, "start_admin_notify", user_data=yaml.dump(user_data)))
 
+def admin_panel_markup(user_id):
+    keyboard = [
+        [InlineKeyboardButton(t(user_id, "view_user_list"), callback_data="view_users")],
+        [InlineKeyboardButton(t(user_id, "search_users"), callback_data="search_users")],
+        [InlineKeyboardButton(t(user_id, "send_message_user"), callback_data="send_message_user")],
+        [InlineKeyboardButton(t(user_id, "send_message_all"), callback_data="send_message_all")],
+        [InlineKeyboardButton(t(user_id, "refresh_data"), callback_data="refresh_data")],
+        [InlineKeyboardButton(t(user_id, "remove_user"), callback_data="remove_user")],
+        [InlineKeyboardButton(t(user_id, "view_api_keys"), callback_data="view_api_keys")],
+        [InlineKeyboardButton(t(user_id, "cancel"), callback_data="cancel")],
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
 async def admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
 
@@ -367,26 +401,13 @@ async def admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Check if the user is an admin
     if str(user_id) not in ADMIN_CHAT_IDS:
         error_message = await update.message.reply_text(t(user_id, "not_admin"))
-        await asyncio.sleep(5)
-        try:
-            await context.bot.delete_message(chat_id=error_message.chat_id, message_id=error_message.message_id)
-        except Exception:
-            pass
+        action_scheduler.schedule_delete(error_message.chat_id, error_message.message_id, 5)
         return
 
     # Create the admin panel
-    keyboard = [
-        [InlineKeyboardButton(t(user_id, "view_user_list"), callback_data="view_users")],
-        [InlineKeyboardButton(t(user_id, "send_message_user"), callback_data="send_message_user")],
-        [InlineKeyboardButton(t(user_id, "send_message_all"), callback_data="send_message_all")],
-        [InlineKeyboardButton(t(user_id, "refresh_data"), callback_data="refresh_data")],
-        [InlineKeyboardButton(t(user_id, "remove_user"), callback_data="remove_user")],
-        [InlineKeyboardButton(t(user_id, "view_api_keys"), callback_data="view_api_keys")],
-        [InlineKeyboardButton(t(user_id, "cancel"), callback_data="cancel")],
-    ]
     admin_message = await update.message.reply_text(
         t(user_id, "welcome_admin_panel"),
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        reply_markup=admin_panel_markup(user_id)
     )
 
     # Store the message ID of the new admin panel
@@ -394,26 +415,157 @@ async def admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 def update_admin_status():
     """
-    Update the admin status of users in cached_users based on ADMIN_CHAT_IDS.
+    Update the admin status of users in the user store based on ADMIN_CHAT_IDS.
     """
-    global cached_users
-    admin_ids = set(ADMIN_CHAT_IDS)  # Convert to set for faster lookup
-    for user in cached_users:
-        user["is_admin"] = str(user["chat_id"]) in admin_ids
+    user_store.set_admins([admin_id for admin_id in ADMIN_CHAT_IDS if admin_id.strip()])
 
-    # Add missing admins to cached_users
-    for admin_id in admin_ids:
-        if not any(user["chat_id"] == int(admin_id) for user in cached_users):
-            cached_users.append({
-                "chat_id": int(admin_id),
-                "username": None,
-                "first_name": "Admin",
-                "last_name": None,
-                "language": "en",
-                "is_admin": True,
-            })
+def format_user_entry(user):
+    name = html.escape(f"{user['first_name'] or ''} {user.get('last_name') or ''}".strip())
+    username = html.escape(user["username"] or "N/A")
+    return f"👤 <b>{name}</b>\n🔗 Username: @{username}\n🆔 Chat ID: <code>{user['chat_id']}</code>\n"
 
-    save_users_and_languages()
+def render_user_page(user_id, view, page):
+    """
+    Render one page of the user list ("view") or of a user picker ("send", "remove").
+    Pages are cached per language and dropped whenever the user store changes.
+    Returns:
+        tuple: (text, reply_markup)
+    """
+    global user_page_cache_version
+    if user_page_cache_version != user_store.version:
+        user_page_cache.clear()
+        user_page_cache_version = user_store.version
+
+    exclude_admins = view != "send"  # Admins can receive messages but are never listed or removable
+    if ("pages", view) not in user_page_cache:
+        user_page_cache[("pages", view)] = max(1, -(-user_store.count(exclude_admins) // USER_PAGE_SIZE))
+    pages = user_page_cache[("pages", view)]
+    page = min(max(page, 0), pages - 1)
+    cache_key = (view, page, get_user_language(user_id))
+    if cache_key in user_page_cache:
+        return user_page_cache[cache_key]
+
+    users = user_store.page(page * USER_PAGE_SIZE, USER_PAGE_SIZE, exclude_admins=exclude_admins)
+    keyboard = []
+    if view == "view":
+        user_list = "\n".join(format_user_entry(user) for user in users) or t(user_id, "no_users_found")
+        text = t(user_id, "updated_user_list", user_list=user_list)
+    else:
+        prefix = "send_to_" if view == "send" else "remove_"
+        text = t(user_id, "select_user" if view == "send" else "remove_user")
+        keyboard = [
+            [InlineKeyboardButton(f"{user['first_name']} (@{user['username']})", callback_data=f"{prefix}{user['chat_id']}")]
+            for user in users
+        ]
+    if pages > 1:
+        navigation = []
+        if page > 0:
+            navigation.append(InlineKeyboardButton("◀️", callback_data=f"users_page:{view}:{page - 1}"))
+        navigation.append(InlineKeyboardButton(f"📄 {page + 1}/{pages}", callback_data=f"users_page:{view}:{page}"))
+        if page < pages - 1:
+            navigation.append(InlineKeyboardButton("▶️", callback_data=f"users_page:{view}:{page + 1}"))
+        keyboard.append(navigation)
+    if view == "remove":
+        keyboard.append([InlineKeyboardButton(t(user_id, "cancel"), callback_data="cancel")])
+    else:
+        keyboard.append([InlineKeyboardButton(t(user_id, "back_to_main"), callback_data="back_to_main")])
+
+    rendered = (text, InlineKeyboardMarkup(keyboard))
+    user_page_cache[cache_key] = rendered
+    return rendered
+
+async def show_user_page(query, user_id, view, page):
+    text, reply_markup = render_user_page(user_id, view, page)
+    try:
+        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode="HTML")
+    except BadRequest as e:
+        # Pressing the page indicator re-renders the same page
+        if "not modified" not in str(e).lower():
+            raise
+
+def rebuild_search_index():
+    """
+    Build a fresh index off to the side and swap it in, so searches never see a half-built index.
+    Changes made while building are replayed on the new index before the swap.
+    """
+    global user_search_index, search_index_changes, search_index_building, search_index_stale
+    started = time.perf_counter()
+    while True:
+        with search_index_lock:
+            search_index_stale = False
+            search_index_changes = []
+        index = UserSearchIndex()
+        index.build(user_store.all())
+        with search_index_lock:
+            if search_index_stale:
+                continue  # Another reload arrived meanwhile; build again from the newer data
+            for event, chat_id in search_index_changes:
+                apply_user_change(index, event, chat_id)
+            user_search_index = index
+            search_index_changes = None
+            search_index_building = False
+            break
+    print(f"Search index built with {len(index)} users in {time.perf_counter() - started:.2f}s.")
+
+def apply_user_change(index, event, chat_id):
+    if event == "remove":
+        index.remove(chat_id)
+    else:
+        user = user_store.get(chat_id)
+        if user:
+            index.add(user)
+
+def on_user_change(event, chat_id):
+    """
+    Keep the search index in step with the user store. Reloads rebuild it on a background thread.
+    """
+    global search_index_building, search_index_stale
+    with search_index_lock:
+        if event == "reload":
+            search_index_stale = True
+            if not search_index_building:
+                search_index_building = True
+                threading.Thread(target=rebuild_search_index, name="search-index-build", daemon=True).start()
+            return
+        if search_index_changes is not None:
+            search_index_changes.append((event, chat_id))
+    apply_user_change(user_search_index, event, chat_id)
+
+user_store.add_listener(on_user_change)
+
+def render_search_results(user_id, text):
+    """
+    Search users and return a message whose buttons feed the send_to_ / remove_ callbacks.
+    Returns:
+        tuple: (text, reply_markup)
+    """
+    started = time.perf_counter()
+    results = user_search_index.search(text)
+    elapsed = (time.perf_counter() - started) * 1000
+    keyboard = []
+    for chat_id, first_name, username, is_admin in results:
+        row = [InlineKeyboardButton(f"✉️ {first_name} (@{username})", callback_data=f"send_to_{chat_id}")]
+        if not is_admin:
+            row.append(InlineKeyboardButton("🗑️", callback_data=f"remove_{chat_id}"))
+        keyboard.append(row)
+    keyboard.append([InlineKeyboardButton(t(user_id, "back_to_main"), callback_data="back_to_main")])
+    if results:
+        message = t(user_id, "search_results", query=text, count=len(results), elapsed=f"{elapsed:.2f}")
+    else:
+        message = t(user_id, "search_no_results", query=text)
+    return message, InlineKeyboardMarkup(keyboard)
+
+async def find_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if str(user_id) not in ADMIN_CHAT_IDS:
+        error_message = await update.message.reply_text(t(user_id, "not_admin"))
+        action_scheduler.schedule_delete(error_message.chat_id, error_message.message_id, 5)
+        return
+    if not context.args:
+        await send_temporary_message(context, update.effective_chat.id, t(user_id, "find_usage"))
+        return
+    text, reply_markup = render_search_results(user_id, " ".join(context.args))
+    await update.message.reply_text(text, reply_markup=reply_markup)
 
 # ==========================
 # Language Configuration
@@ -424,7 +576,8 @@ LANGUAGES = {
         "welcome_admin_panel": "Welcome to the Admin Panel! Please choose an option:",
         "welcome_user": "🎉 Welcome, {name}! 🎉\nFeel free to explore and interact with the bot.",
         "message_sent": "✅ Message or media sent successfully!",
-        "broadcast_sent": "📢 Message sent to all users.",
+        "broadcast_sent": "📢 Message sent to all users.\n✅ Sent: {sent}/{total}\n❌ Failed: {failed} (blocked: {blocked})\n⏱ {elapsed}s ({rate} msg/s)",
+        "broadcast_started": "📢 Broadcasting to {count} users...",
         "operation_cancelled": "❌ Operation cancelled.",
         "user_removed": "User with Chat ID {chat_id} has been removed from the list.",
         "updated_user_list": "👥 <b>Updated User List:</b>\n\n{user_list}",
@@ -440,6 +593,11 @@ LANGUAGES = {
         "remove_user": "🗑️ Remove User from List",
         "view_api_keys": "🔑 View API Key Stats",
         "cancel": "❌ Cancel",
+        "search_users": "🔍 Search Users",
+        "type_search": "Send a name, username or chat ID to search for:",
+        "search_results": "🔍 {count} users match \"{query}\" ({elapsed} ms):",
+        "search_no_results": "No users match \"{query}\".",
+        "find_usage": "Usage: /find <name, username or chat ID>",
         "back_to_main": "🔙 Back to Main Menu",
         "select_language": "Please select your language:",
         "lang_updated": "Language updated successfully!",
@@ -454,7 +612,8 @@ LANGUAGES = {
         "welcome_admin_panel": "به پنل ادمین خوش آمدید! لطفاً یک گزینه را انتخاب کنید:",
         "welcome_user": "🎉 خوش آمدید، {name}! 🎉\nلطفاً از ربات استفاده کنید و اگر سوالی دارید، همینجا بپرسید.",
         "message_sent": "✅ پیام یا رسانه با موفقیت ارسال شد!",
-        "broadcast_sent": "📢 پیام به همه کاربران ارسال شد.",
+        "broadcast_sent": "📢 پیام به همه کاربران ارسال شد.\n✅ ارسال‌شده: {sent}/{total}\n❌ ناموفق: {failed} (مسدود: {blocked})\n⏱ {elapsed} ثانیه ({rate} پیام در ثانیه)",
+        "broadcast_started": "📢 در حال ارسال پیام به {count} کاربر...",
         "operation_cancelled": "❌ عملیات لغو شد.",
         "user_removed": "کاربر با شناسه {chat_id} از لیست حذف شد.",
         "updated_user_list": "👥 <b>لیست کاربران به‌روزرسانی شد:</b>\n\n{user_list}",
@@ -470,6 +629,11 @@ LANGUAGES = {
         "remove_user": "🗑️ حذف کاربر از لیست",
         "view_api_keys": "🔑 مشاهده وضعیت کلیدهای API",
         "cancel": "❌ لغو",
+        "search_users": "🔍 جستجوی کاربران",
+        "type_search": "نام، نام کاربری یا شناسه کاربر را برای جستجو ارسال کنید:",
+        "search_results": "🔍 {count} کاربر با «{query}» مطابقت دارند ({elapsed} میلی‌ثانیه):",
+        "search_no_results": "هیچ کاربری با «{query}» مطابقت ندارد.",
+        "find_usage": "استفاده: /find <نام، نام کاربری یا شناسه>",
         "back_to_main": "🔙 بازگشت به منوی اصلی",
         "select_language": "لطفاً زبان خود را انتخاب کنید:",
         "lang_updated": "زبان با موفقیت تغییر کرد!",
@@ -481,10 +645,9 @@ LANGUAGES = {
     },
 }
 DEFAULT_LANGUAGE = "en"
-user_languages = defaultdict(lambda: DEFAULT_LANGUAGE)
 
 def get_lang(user_id):
-    return user_languages[user_id]
+    return get_user_language(user_id)
 
 def t(user_id, key, **kwargs):
     lang = get_user_language(user_id)
@@ -509,14 +672,11 @@ async def button(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if query.data.startswith("lang_"):
         lang = query.data.split("_")[1]
-        user_languages[user_id] = lang
-
-        # Update language in cached_users
-        for user in cached_users:
-            if user["chat_id"] == user_id:
-                user["language"] = lang
-                break
-        save_users_and_languages()
+        # Update language in the user store, or remember it until the user registers
+        if user_id in user_store:
+            user_store.update(user_id, language=lang)
+        else:
+            user_languages[user_id] = lang
 
         await query.edit_message_text(
             LANGUAGES["en"]["lang_updated"] + "\n" + LANGUAGES["fa"]["lang_updated"]
@@ -524,50 +684,23 @@ async def button(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     if query.data == "view_users":
-        sync_repo()
-        update_admin_status()  # Ensure admin status is updated
-        file_path = os.path.join("repo", USER_DATA_FILE)
-        with open(file_path, "r") as file:
-            users = yaml.safe_load(file) or []
-        # Filter out admins from the user list
-        non_admin_users = [user for user in users if not user.get("is_admin", False)]
-        if non_admin_users:
-            user_list = "\n".join(
-                [f"👤 <b>{user['first_name']} {user.get('last_name', '')}</b>\n"
-                 f"🔗 Username: @{user['username'] or 'N/A'}\n"
-                 f"🆔 Chat ID: <code>{user['chat_id']}</code>\n" for user in non_admin_users]
-            )
-        else:
-            user_list = t(user_id, "no_users_found")
-        keyboard = [[InlineKeyboardButton(t(user_id, "back_to_main"), callback_data="back_to_main")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(t(user_id, "updated_user_list", user_list=user_list), reply_markup=reply_markup, parse_mode="HTML")
+        await show_user_page(query, user_id, "view", 0)
+
+    elif query.data.startswith("users_page:"):
+        _, view, page = query.data.split(":")
+        await show_user_page(query, user_id, view, int(page))
 
     elif query.data == "back_to_main":
-        keyboard = [
-            [InlineKeyboardButton(t(user_id, "view_user_list"), callback_data="view_users")],
-            [InlineKeyboardButton(t(user_id, "send_message_user"), callback_data="send_message_user")],
-            [InlineKeyboardButton(t(user_id, "send_message_all"), callback_data="send_message_all")],
-            [InlineKeyboardButton(t(user_id, "refresh_data"), callback_data="refresh_data")],
-            [InlineKeyboardButton(t(user_id, "remove_user"), callback_data="remove_user")],
-            [InlineKeyboardButton(t(user_id, "view_api_keys"), callback_data="view_api_keys")],
-            [InlineKeyboardButton(t(user_id, "cancel"), callback_data="cancel")],
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(t(user_id, "welcome_admin_panel"), reply_markup=reply_markup)
+        await query.edit_message_text(t(user_id, "welcome_admin_panel"), reply_markup=admin_panel_markup(user_id))
+
+    elif query.data == "search_users":
+        context.user_data["awaiting_search"] = True
+        keyboard = [[InlineKeyboardButton(t(user_id, "back_to_main"), callback_data="back_to_main")]]
+        prompt_message = await query.edit_message_text(t(user_id, "type_search"), reply_markup=InlineKeyboardMarkup(keyboard))
+        context.user_data["prompt_message_id"] = prompt_message.message_id
 
     elif query.data == "send_message_user":
-        sync_repo()
-        file_path = os.path.join("repo", USER_DATA_FILE)
-        with open(file_path, "r") as file:
-            users = yaml.safe_load(file) or []
-        keyboard = [
-            [InlineKeyboardButton(f"{user['first_name']} (@{user['username']})", callback_data=f"send_to_{user['chat_id']}")]
-            for user in users
-        ]
-        keyboard.append([InlineKeyboardButton(t(user_id, "back_to_main"), callback_data="back_to_main")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(t(user_id, "select_user"), reply_markup=reply_markup)
+        await show_user_page(query, user_id, "send", 0)
 
     elif query.data.startswith("send_to_"):
         chat_id = int(query.data.split("_")[2])
@@ -589,78 +722,104 @@ async def button(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data["prompt_message_id"] = prompt_message.message_id
 
     elif query.data == "refresh_data":
-        sync_repo()
+        await asyncio.get_running_loop().run_in_executor(None, user_store.refresh)
+        update_admin_status()
         await send_temporary_message(context, update.effective_chat.id, t(user_id, "refresh_success"))
         
     elif query.data == "view_api_keys":
-        # Get API key statistics
-        api_key_stats = get_api_key_stats()
+        # Get API key statistics; loading the usage shards makes several GitHub requests
+        api_key_stats = await asyncio.get_running_loop().run_in_executor(None, get_api_key_stats)
         keyboard = [[InlineKeyboardButton(t(user_id, "back_to_main"), callback_data="back_to_main")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.edit_message_text(api_key_stats, reply_markup=reply_markup, parse_mode="HTML")
 
     elif query.data == "remove_user":
-        sync_repo()
-        update_admin_status()  # Ensure admin status is updated
-        file_path = os.path.join("repo", USER_DATA_FILE)
-        with open(file_path, "r") as file:
-            users = yaml.safe_load(file) or []
-        # Filter out admins from the removable user list
-        removable_users = [user for user in users if not user.get("is_admin", False)]
-        keyboard = [
-            [InlineKeyboardButton(f"{user['first_name']} (@{user['username']})", callback_data=f"remove_{user['chat_id']}")]
-            for user in removable_users
-        ]
-        keyboard.append([InlineKeyboardButton(t(user_id, "cancel"), callback_data="cancel")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(t(user_id, "remove_user"), reply_markup=reply_markup)
+        await show_user_page(query, user_id, "remove", 0)
 
     elif query.data.startswith("remove_"):
         chat_id = int(query.data.split("_")[1])
-        sync_repo()
-        update_admin_status()  # Ensure admin status is updated
-        file_path = os.path.join("repo", USER_DATA_FILE)
-        with open(file_path, "r") as file:
-            users = yaml.safe_load(file) or []
         # Prevent removing admins
-        if any(user["chat_id"] == chat_id and user.get("is_admin", False) for user in users):
+        target = user_store.get(chat_id)
+        if target and target.get("is_admin", False):
             await send_temporary_message(context, update.effective_chat.id, "❌ You cannot remove an admin.")
             return
-        updated_users = [user for user in users if user["chat_id"] != chat_id]
-        with open(file_path, "w") as file:
-            yaml.dump(updated_users, file)
-        push_changes()
+        user_store.remove(chat_id)
         await send_temporary_message(context, update.effective_chat.id, t(user_id, "user_removed", chat_id=chat_id))
         # Refresh the user list
-        sync_repo()
-        with open(file_path, "r") as file:
-            refreshed_users = yaml.safe_load(file) or []
-        non_admin_users = [user for user in refreshed_users if not user.get("is_admin", False)]
-        if non_admin_users:
-            user_list = "\n".join(
-                [f"👤 <b>{user['first_name']} {user.get('last_name', '')}</b>\n"
-                 f"🔗 Username: @{user['username'] or 'N/A'}\n"
-                 f"🆔 Chat ID: <code>{user['chat_id']}</code>\n" for user in non_admin_users]
-            )
-        else:
-            user_list = t(user_id, "no_users_found")
-        keyboard = [[InlineKeyboardButton(t(user_id, "back_to_main"), callback_data="back_to_main")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await context.bot.send_message(chat_id=update.effective_chat.id, text=t(user_id, "updated_user_list", user_list=user_list), reply_markup=reply_markup, parse_mode="HTML")
+        text, reply_markup = render_user_page(user_id, "view", 0)
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=text, reply_markup=reply_markup, parse_mode="HTML")
 
     elif query.data == "cancel":
         cancel_message = await query.edit_message_text(t(user_id, "operation_cancelled"))
         context.user_data.clear()
-        await asyncio.sleep(5)
+        action_scheduler.schedule_delete(cancel_message.chat_id, cancel_message.message_id, 5)
+
+# ==========================
+# State Snapshot Functions
+# ==========================
+def export_state(application):
+    """
+    Collect the in-memory panel state as plain data for the warm-restart snapshot.
+    """
+    return {
+        "message_limiters": {name: limiter.snapshot() for name, limiter in message_limiters.items()},
+        "command_limiters": {name: limiter.snapshot() for name, limiter in command_limiters.items()},
+        "timers": action_scheduler.pending(),
+        "admin_last_message_ids": list(admin_last_message_ids.items()),
+        "user_languages": list(user_languages.items()),
+        "user_data": [[user_id, json_safe(data)] for user_id, data in application.user_data.items() if data],
+    }
+
+def restore_state(application, packed=None):
+    """
+    Restore the state saved by the previous process, if a fresh snapshot exists: the one
+    `packed` by a leader handing over from another runner, else the local snapshot file.
+    """
+    started = time.perf_counter()
+    try:
+        sections = unpack_sections(packed) if packed else state_snapshot.load()
+    except Exception as e:
+        print(f"Error loading state snapshot: {e}")
+        return
+    if not sections:
+        return
+    limiters, saved_at = sections.get("message_limiters", ({}, None))
+    for name, entries in limiters.items():
+        if name in message_limiters:
+            message_limiters[name].restore(entries, saved_at)
+    limiters, saved_at = sections.get("command_limiters", ({}, None))
+    for name, entries in limiters.items():
+        if name in command_limiters:
+            command_limiters[name].restore(entries, saved_at)
+    action_scheduler.restore(sections.get("timers", ([], None))[0])
+    admin_last_message_ids.update(sections.get("admin_last_message_ids", ([], None))[0])
+    user_languages.update(sections.get("user_languages", ([], None))[0])
+    for user_id, data in sections.get("user_data", ([], None))[0]:
+        application.user_data[user_id].update(data)  # user_data creates missing entries on access
+    print(f"Restored state snapshot in {(time.perf_counter() - started) * 1000:.1f} ms.")
+
+def save_state(application):
+    try:
+        state_snapshot.save(export_state(application))
+    except Exception as e:
+        print(f"Error saving state snapshot: {e}")
+
+async def snapshot_state_periodically(application):
+    """
+    Snapshot the panel state every SNAPSHOT_INTERVAL_SECONDS so a crash loses little.
+    """
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL_SECONDS)
+        sections = export_state(application)  # Exported on the event loop, written off it
         try:
-            await context.bot.delete_message(chat_id=cancel_message.chat_id, message_id=cancel_message.message_id)
-        except Exception:
-            pass
+            await asyncio.get_running_loop().run_in_executor(None, state_snapshot.save, sections)
+        except Exception as e:
+            print(f"Error saving state snapshot: {e}")
 
 # ==========================
 # Restart Functions
 # ==========================
-async def restart_panel():
+async def restart_panel(application):
     """
     Restarts the panel every 5 hours with a delay to allow workflow restart.
     """
@@ -669,12 +828,14 @@ async def restart_panel():
         print("Preparing to restart the panel...")
         await asyncio.sleep(300)  # Wait for 5 minutes to allow workflow restart
         print("Restarting the panel...")
+        save_state(application)  # The new process image resumes from this snapshot
+        user_store.stop()  # Push pending user changes before the process image is replaced
         os.execv(sys.executable, ['python'] + sys.argv)  # Restart the script
 
 # ==========================
 # Trigger Workflow Function
 # ==========================
-async def trigger_restart_workflow():
+async def trigger_restart_workflow(application):
     """
     Triggers the 'panel_restart' workflow on GitHub after 4 hours and 55 minutes.
     """
@@ -699,30 +860,156 @@ async def trigger_restart_workflow():
     # Notify GitHub Actions of success before stopping the script
     print("::notice::Panel workflow completed successfully. Preparing to stop the script.")
 
-    # Wait 1 minute before stopping the script
-    await asyncio.sleep(60)
+    if panel_lease is not None and response.status_code == 204:
+        # The lease hands polling over once the next instance has warmed up, and main() returns;
+        # still running after the deadline means no successor came
+        await asyncio.sleep(HANDOVER_DEADLINE_SECONDS)
+        print(f"No successor took the lease within {HANDOVER_DEADLINE_SECONDS}s; stopping anyway.")
+    else:
+        # Wait 1 minute before stopping the script
+        await asyncio.sleep(60)
     print("Stopping the panel...")
+    save_state(application)
+    if panel_lease is not None:
+        await panel_lease.release()
+    await asyncio.get_running_loop().run_in_executor(None, user_store.stop)  # Flush pending user changes
     os._exit(0)  # Use os._exit to terminate the process directly without raising exceptions
 
+# ==========================
+# Startup Timing Functions
+# ==========================
+def mark_startup(label):
+    startup_marks.append((label, time.perf_counter()))
+
+def print_startup_report():
+    """
+    Print how long each startup phase took, so slow boots are visible in the workflow log.
+    """
+    lines, previous = [], PROCESS_STARTED
+    for label, at in startup_marks:
+        lines.append(f"  {label:<18} +{(at - previous) * 1000:8.1f} ms  ({(at - PROCESS_STARTED) * 1000:.1f} ms)")
+        previous = at
+    print("Startup timing:\n" + "\n".join(lines))
+
+async def on_polling_ready(application):
+    mark_startup("polling started")
+    print_startup_report()
+
+# ==========================
+# Leader Lease Functions
+# ==========================
+async def fence_updates(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not update_fence.admit(update.update_id):
+        print(f"Dropping update {update.update_id}: already processed by the previous instance.")
+        raise ApplicationHandlerStop
+
+async def run_polling_with_lease(application):
+    """
+    Poll only while holding the leader lease, handing it over to the next instance on request.
+    """
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    async with application:
+        # Caches are warm by now; wait for the current leader to stop polling
+        acquire = asyncio.create_task(panel_lease.acquire())
+        stopped = asyncio.create_task(stop_event.wait())
+        await asyncio.wait({acquire, stopped}, return_when=asyncio.FIRST_COMPLETED)
+        stopped.cancel()
+        if not acquire.done():
+            acquire.cancel()
+            return
+        record = acquire.result()
+        update_fence.last_update_id = record.get("last_update_id")
+        mark_startup("lease acquired")
+        if record.get("state"):
+            restore_state(application, record["state"])  # Handed over by the previous leader's runner
+        # The previous leader pushed its last user changes before handing over; pick them up, then flush ourselves
+        await loop.run_in_executor(None, user_store.reconcile)
+        user_store.start()
+        await application.updater.start_polling(allowed_updates=ALLOWED_UPDATES)
+        await application.start()
+        mark_startup("polling started")
+        print_startup_report()
+        print(f"Polling as leader {panel_lease.instance_id} (previous leader stopped at update {update_fence.last_update_id}).")
+
+        async def handover():
+            await application.updater.stop()  # Confirms the offset of every fetched update
+            await application.stop()  # Drains queued updates and tasks started by handlers
+            await loop.run_in_executor(None, user_store.stop)  # Final push before the successor starts its flusher
+            return update_fence.last_update_id
+
+        outcome = await panel_lease.hold(handover, stop_event, lambda: pack_sections(export_state(application)))
+        if application.running:
+            await application.updater.stop()
+            await application.stop()
+        if outcome == "stopped":
+            await panel_lease.release()
+        print(
+            f"Leadership ended ({outcome}): {update_fence.processed} updates processed, "
+            f"{update_fence.duplicates} duplicates dropped, {update_fence.gaps} update IDs skipped at takeover."
+        )
+
 # ==========================
 # Main Function
 # ==========================
 async def main():
-    load_users_and_languages()  # Load users and languages from YAML file
-    update_admin_status()  # Ensure admin status is updated at startup
-
-    application = Application.builder().token(os.getenv("TELEGRAM_BOT_TOKEN")).build()
+    global panel_lease
+    mark_startup("main entered")
+    load_users_and_languages()  # Serve the local registry; the repository is reconciled in the background
+    mark_startup("users loaded")
+    update_admin_status()  # Local update only; the flusher pushes it with the next batch
+    mark_startup("admins updated")
+
+    application = Application.builder().token(os.getenv("TELEGRAM_BOT_TOKEN")).post_init(on_polling_ready).build()
+    application.add_handler(TypeHandler(Update, fence_updates), group=-1)
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("admin", admin_menu))
     application.add_handler(CommandHandler("lang", lang))
+    application.add_handler(CommandHandler("find", find_users))
     application.add_handler(CallbackQueryHandler(button))
     application.add_handler(MessageHandler(filters.ALL, handle_message))
 
-    # Start the restart workflow trigger task
-    asyncio.create_task(trigger_restart_workflow())
+    # Resume limits, pending timers and conversation flags from the previous process
+    restore_state(application)
+    mark_startup("state restored")
+
+    if PANEL_LEASE_FILE:
+        panel_lease = LeaseManager(FileLeaseStore(PANEL_LEASE_FILE))
+    elif os.getenv("GH_PAT"):
+        panel_lease = LeaseManager(GitHubLeaseStore())
+
+    # Start the deferred action scheduler, the state snapshots and the restart workflow trigger task
+    action_scheduler.start(application.bot)
+    asyncio.create_task(snapshot_state_periodically(application))
+    asyncio.create_task(trigger_restart_workflow(application))
 
-    print("Bot is starting...")
-    await application.run_polling()  # Use polling for simplicity in GitHub Actions
+    print(f"Bot is starting ({PANEL_MODE} mode)...")
+    try:
+        if PANEL_MODE == "webhook" and WEBHOOK_URL:
+            mark_startup("webhook starting")
+            print_startup_report()
+            user_store.start()  # Start the write-behind flusher
+            await run_webhook(
+                application, WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, ALLOWED_UPDATES
+            )
+        else:
+            if PANEL_MODE == "webhook":
+                print("WEBHOOK_URL is not set; falling back to polling.")
+            # Polling removes any webhook left behind by a previous webhook-mode run
+            if panel_lease is not None:
+                await run_polling_with_lease(application)  # Starts the flusher once the lease is held
+            else:
+                user_store.start()  # Start the write-behind flusher
+                await application.run_polling(allowed_updates=ALLOWED_UPDATES)
+    finally:
+        save_state(application)
+        user_store.stop()  # Flush pending user changes on shutdown
 
 if __name__ == "__main__":
     asyncio.run(main())
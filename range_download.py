@@ -0,0 +1,212 @@
+import os
+import itertools
+import logging
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from mp3_stream import DOWNLOAD_TIMEOUT, MAX_AUDIO_BYTES, STREAM_CHUNK_BYTES, InvalidAudioError, validated_mp3_chunks
+
+# ==========================
+# Configuration Variables
+# ==========================
+DOWNLOAD_SEGMENTS = int(os.getenv("DOWNLOAD_SEGMENTS", "4"))  # Concurrent byte ranges per download
+MIN_SEGMENT_BYTES = 1024 * 1024  # Smaller files are not worth splitting
+SEGMENT_RETRIES = 3  # Resumptions of one failed segment before the download fails
+SEGMENT_BACKOFF_SECONDS = 0.5
+CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+
+_session = None
+
+def get_session():
+    """
+    Return the pooled session shared by all downloads, with room for every segment connection.
+    """
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(DOWNLOAD_SEGMENTS, 1) * 2)
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
+
+def parse_content_range(response):
+    """
+    Return (first, last, total) of a 206 response's Content-Range header, or None.
+    """
+    match = CONTENT_RANGE.fullmatch(response.headers.get("Content-Range", "").strip())
+    return tuple(int(value) for value in match.groups()) if match else None
+
+def plan_segments(total, segments=DOWNLOAD_SEGMENTS, min_bytes=MIN_SEGMENT_BYTES):
+    """
+    Split `total` bytes into at most `segments` inclusive (first, last) ranges of at least `min_bytes`.
+    """
+    count = max(1, min(segments, total // min_bytes))
+    size = -(-total // count)
+    return [(first, min(first + size, total) - 1) for first in range(0, total, size)]
+
+def fetch_segment(session, url, path, first, last, stop, retries=SEGMENT_RETRIES):
+    """
+    Download bytes `first`..`last` of `url` into the same offsets of the preallocated file
+    at `path`. A failed transfer is resumed from the last byte written, up to `retries` times.
+    """
+    position, failures = first, 0
+    with open(path, "r+b") as file:
+        while position <= last:
+            try:
+                headers = {"Range": f"bytes={position}-{last}"}
+                with session.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+                    served = parse_content_range(response)
+                    if response.status_code != 206 or not served or served[0] != position:
+                        raise InvalidAudioError(f"Range {position}-{last} answered with HTTP {response.status_code}")
+                    file.seek(position)
+                    for chunk in response.iter_content(STREAM_CHUNK_BYTES):
+                        if stop.is_set():
+                            return
+                        chunk = chunk[:last + 1 - position]
+                        file.write(chunk)
+                        position += len(chunk)
+                if position <= last:
+                    raise requests.exceptions.ChunkedEncodingError(f"Range ended at byte {position}")
+            except requests.exceptions.RequestException as e:
+                failures += 1
+                if failures > retries or stop.is_set():
+                    raise
+                delay = SEGMENT_BACKOFF_SECONDS * (2 ** failures) * random.uniform(0.5, 1.5)
+                logging.warning(f"Segment {first}-{last} failed at byte {position} ({e}); resuming in {delay:.1f}s")
+                time.sleep(delay)
+
+def read_range(path, first, last, chunk_size=STREAM_CHUNK_BYTES):
+    with open(path, "rb") as file:
+        file.seek(first)
+        remaining = last + 1 - first
+        while remaining > 0:
+            chunk = file.read(min(chunk_size, remaining))
+            if not chunk:
+                raise InvalidAudioError(f"Segment file ended {remaining} bytes early")
+            remaining -= len(chunk)
+            yield chunk
+
+def segmented_mp3_chunks(url, scratch_path, segments=DOWNLOAD_SEGMENTS, max_bytes=MAX_AUDIO_BYTES, session=None):
+    """
+    Yield the body of the MP3 at `url` in order, fetching it as concurrent byte ranges.
+
+    The first request asks for `bytes=0-`. If the server answers 206, the file is split
+    into `segments` ranges: the first streams straight from that response (validated
+    like any download), the others are fetched in parallel into `scratch_path`,
+    preallocated to the full size, and yielded from there as each one completes.
+    Without range support the plain response is streamed as before.
+    """
+    session = session or get_session()
+    response = session.get(url, headers={"Range": "bytes=0-"}, stream=True, timeout=DOWNLOAD_TIMEOUT)
+    with response:
+        served = parse_content_range(response) if response.status_code == 206 else None
+        plan = plan_segments(served[2], segments) if served and served[0] == 0 else None
+        if not plan or len(plan) == 1:
+            yield from validated_mp3_chunks(response, max_bytes)
+            return
+        chunks = validated_mp3_chunks(response, max_bytes)
+        first_chunk = next(chunks)  # Headers and the first frames are valid before other ranges start
+        with open(scratch_path, "wb") as file:
+            file.truncate(served[2])
+        stop = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=len(plan) - 1, thread_name_prefix="range-download")
+        try:
+            futures = [executor.submit(fetch_segment, session, url, scratch_path, first, last, stop)
+                       for first, last in plan[1:]]
+            remaining = plan[0][1] + 1
+            for chunk in itertools.chain([first_chunk], chunks):
+                chunk = chunk[:remaining]
+                remaining -= len(chunk)
+                yield chunk
+                if remaining == 0:
+                    break
+            response.close()  # Leave the rest of the file to the range requests
+            if remaining:
+                raise InvalidAudioError(f"First segment ended {remaining} bytes early")
+            for (first, last), future in zip(plan[1:], futures):
+                future.result()
+                yield from read_range(scratch_path, first, last)
+        finally:
+            stop.set()
+            executor.shutdown(wait=True)
+            if os.path.exists(scratch_path):
+                os.remove(scratch_path)
+
+if __name__ == "__main__":
+    import hashlib
+    import tempfile
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    LATENCY_SECONDS = 0.08  # Round trip to the tunnel host
+    CONNECTION_BYTES_PER_SECOND = 2 * 1024 * 1024  # What one TCP connection sustains over that link
+    frame = bytes([0xFF, 0xFB, 0x90, 0x64]) + bytes(413)  # MPEG-1 Layer III, 128 kbps, 44.1 kHz
+    fixtures = {"/song.mp3": b"ID3\x03\x00\x00\x00\x00\x00\x00" + frame * 16000}  # About 6.4 MB
+    server_state = {"ranges": True, "drops": 0}
+    drop_lock = threading.Lock()
+
+    class FixtureHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            body = fixtures[self.path]
+            time.sleep(LATENCY_SECONDS)
+            requested = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+            if requested and server_state["ranges"]:
+                first = int(requested.group(1))
+                last = int(requested.group(2)) if requested.group(2) else len(body) - 1
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {first}-{last}/{len(body)}")
+            else:
+                first, last = 0, len(body) - 1
+                self.send_response(200)
+            self.send_header("Content-Type", "audio/mpeg")
+            self.send_header("Content-Length", str(last + 1 - first))
+            self.send_header("Accept-Ranges", "bytes" if server_state["ranges"] else "none")
+            self.end_headers()
+            with drop_lock:
+                drop = server_state["drops"] > 0 and first > 0
+                server_state["drops"] -= drop
+            drop_at = first + (last - first) // 2 if drop else None
+            step = 64 * 1024
+            try:
+                for position in range(first, last + 1, step):
+                    if drop_at is not None and position >= drop_at:
+                        self.close_connection = True
+                        return
+                    self.wfile.write(body[position:min(position + step, last + 1)])
+                    time.sleep(step / CONNECTION_BYTES_PER_SECOND)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(message)s")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/song.mp3"
+    expected = hashlib.sha256(fixtures["/song.mp3"]).hexdigest()
+
+    def run(label, segments, ranges=True, drops=0):
+        server_state.update(ranges=ranges, drops=drops)
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            started = time.perf_counter()
+            digest = hashlib.sha256()
+            for chunk in segmented_mp3_chunks(url, os.path.join(scratch_dir, "segments"), segments=segments):
+                digest.update(chunk)
+            elapsed = time.perf_counter() - started
+        status = "ok" if digest.hexdigest() == expected else "CORRUPT"
+        print(f"{label:<34} {elapsed:6.2f}s  {len(fixtures['/song.mp3']) / elapsed / 1e6:5.1f} MB/s  {status}")
+
+    print(f"Fixture {len(fixtures['/song.mp3']) / 1e6:.1f} MB, {LATENCY_SECONDS * 1000:.0f} ms latency, "
+          f"{CONNECTION_BYTES_PER_SECOND / 1e6:.1f} MB/s per connection")
+    run("single stream", 1)
+    run("4 segments", 4)
+    run("8 segments", 8)
+    run("no range support (fallback)", 4, ranges=False)
+    run("4 segments, one dropped mid-range", 4, drops=1)
@@ -0,0 +1,157 @@
+import time
+from array import array
+
+# ==========================
+# Configuration Variables
+# ==========================
+SWEEP_INTERVAL_SECONDS = 60  # How often idle users are evicted
+
+# ==========================
+# Sliding Window Limiter
+# ==========================
+class _Window:
+    """
+    Per-user state: a packed array of monotonic timestamps of accepted hits, oldest first.
+    """
+    __slots__ = ("stamps",)
+
+    def __init__(self):
+        self.stamps = array("d")
+
+class SlidingWindowLimiter:
+    """
+    Allow at most `limit` hits per key within any `window` seconds.
+
+    Only accepted hits are recorded, so a rejected hit never extends the block.
+    Keys whose last hit left the window are swept automatically, which keeps memory
+    proportional to the users active within the last window.
+    """
+
+    def __init__(self, limit, window, sweep_interval=SWEEP_INTERVAL_SECONDS, clock=time.monotonic):
+        self.limit = limit
+        self.window = window
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        self.windows = {}
+        self.last_sweep = clock()
+
+    def __len__(self):
+        return len(self.windows)
+
+    def _prune(self, state, now):
+        stamps = state.stamps
+        cutoff = now - self.window
+        expired = 0
+        while expired < len(stamps) and stamps[expired] <= cutoff:
+            expired += 1
+        if expired:
+            del stamps[:expired]
+
+    def hit(self, key):
+        """
+        Record a hit for `key` if allowed.
+        Returns:
+            tuple: (allowed, retry_after) where retry_after is the number of seconds
+            until the next hit would be accepted (0 when allowed).
+        """
+        now = self.clock()
+        if now - self.last_sweep >= self.sweep_interval:
+            self.sweep(now)
+        if self.limit <= 0:
+            return False, self.window
+        state = self.windows.get(key)
+        if state is None:
+            state = self.windows[key] = _Window()
+        else:
+            self._prune(state, now)
+        if len(state.stamps) >= self.limit:
+            return False, state.stamps[0] + self.window - now
+        state.stamps.append(now)
+        return True, 0.0
+
+    def remaining(self, key):
+        """
+        Return how many more hits `key` may make in the current window.
+        """
+        state = self.windows.get(key)
+        if state is None:
+            return max(self.limit, 0)
+        self._prune(state, self.clock())
+        return max(self.limit - len(state.stamps), 0)
+
+    def reset(self, key):
+        self.windows.pop(key, None)
+
+    def snapshot(self):
+        """
+        Export live windows as [key, [ages in seconds]] pairs, independent of the monotonic clock.
+        """
+        now = self.clock()
+        self.sweep(now)
+        return [[key, [round(now - stamp, 3) for stamp in state.stamps]] for key, state in self.windows.items()]
+
+    def restore(self, entries, saved_at=None):
+        """
+        Load windows exported by `snapshot` at wall-clock time `saved_at`. Ages are advanced
+        by the time since then, so downtime counts against the window; hits older than the
+        window are dropped.
+        """
+        now = self.clock()
+        elapsed = max(time.time() - saved_at, 0.0) if saved_at else 0.0
+        for key, ages in entries:
+            stamps = [now - (age + elapsed) for age in ages if age + elapsed < self.window]
+            if stamps:
+                state = self.windows[key] = _Window()
+                state.stamps.extend(sorted(stamps))
+
+    def sweep(self, now=None):
+        """
+        Evict every key with no hit inside the window. Returns the number of evicted keys.
+        """
+        now = self.clock() if now is None else now
+        cutoff = now - self.window
+        idle = [key for key, state in self.windows.items() if not state.stamps or state.stamps[-1] <= cutoff]
+        for key in idle:
+            del self.windows[key]
+        self.last_sweep = now
+        return len(idle)
+
+# ==========================
+# Benchmark
+# ==========================
+if __name__ == "__main__":
+    import tracemalloc
+    from collections import defaultdict
+    from datetime import datetime, timedelta
+
+    users = 100_000
+
+    # Baseline: the nested defaultdicts of counts and datetimes previously kept in panel.py
+    tracemalloc.start()
+    counts = defaultdict(lambda: defaultdict(int))
+    reset_times = defaultdict(lambda: defaultdict(lambda: datetime.now() + timedelta(minutes=30)))
+    for user_id in range(users):
+        counts[1_000_000_000 + user_id]["text"] += 1
+        reset_times[1_000_000_000 + user_id]["text"]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"legacy defaultdicts, {users} users x 1 type: {current / 1024 / 1024:.1f} MiB ({current / users:.0f} B/user, never evicted)")
+    del counts, reset_times
+
+    for hits_per_user in (1, 5, 40):
+        tracemalloc.start()
+        limiter = SlidingWindowLimiter(limit=40, window=30 * 60)
+        for user_id in range(users):
+            for _ in range(hits_per_user):
+                limiter.hit(1_000_000_000 + user_id)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        started = time.perf_counter()
+        for user_id in range(users):
+            limiter.hit(1_000_000_000 + user_id)
+        elapsed = time.perf_counter() - started
+        print(
+            f"{users} users x {hits_per_user} hits: {current / 1024 / 1024:.1f} MiB "
+            f"({current / users:.0f} B/user, peak {peak / 1024 / 1024:.1f} MiB), "
+            f"{elapsed / users * 1e6:.2f} us/hit"
+        )
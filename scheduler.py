@@ -0,0 +1,140 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+# ==========================
+# Action Scheduler
+# ==========================
+class ActionScheduler:
+    """
+    Single-task scheduler for deferred bot actions such as deleting or editing messages.
+
+    Timers live in one heap and are run by one asyncio task, so thousands of pending
+    deletions cost a heap entry each instead of a sleeping task. Every timer has a key:
+    scheduling an existing key replaces its timer (coalescing), and `cancel` drops it.
+    Replaced and cancelled timers are discarded lazily when they reach the top of the heap.
+    Actions are plain data (kind + payload) so pending timers can be listed and restored.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.heap = []  # (due, seq, key)
+        self.entries = {}  # key -> (due, seq, kind, payload)
+        self.counter = itertools.count()
+        self.wakeup = None
+        self.bot = None
+        self.task = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    # ---------- Scheduling ----------
+    def schedule(self, key, delay, kind, **payload):
+        """
+        Run action `kind` with `payload` after `delay` seconds, replacing any timer with the same key.
+        """
+        self.schedule_at(key, self.clock() + max(delay, 0), kind, **payload)
+
+    def schedule_at(self, key, due, kind, **payload):
+        seq = next(self.counter)
+        self.entries[key] = (due, seq, kind, payload)
+        heapq.heappush(self.heap, (due, seq, key))
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    def schedule_delete(self, chat_id, message_id, delay, key=None):
+        self.schedule(key or f"delete:{chat_id}:{message_id}", delay, "delete", chat_id=chat_id, message_id=message_id)
+
+    def schedule_edit(self, chat_id, message_id, text, delay=0, key=None):
+        self.schedule(key or f"edit:{chat_id}:{message_id}", delay, "edit", chat_id=chat_id, message_id=message_id, text=text)
+
+    def reschedule(self, key, delay):
+        """
+        Move an existing timer. Returns False if no timer exists for `key`.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        _, _, kind, payload = entry
+        self.schedule(key, delay, kind, **payload)
+        return True
+
+    def get(self, key):
+        """
+        Return the payload of the pending timer for `key`, or None.
+        """
+        entry = self.entries.get(key)
+        return entry[3] if entry else None
+
+    def cancel(self, key):
+        return self.entries.pop(key, None) is not None
+
+    def pending(self):
+        """
+        List pending timers as (key, due, kind, payload) tuples in due order.
+        """
+        return sorted(
+            ((key, due, kind, payload) for key, (due, _, kind, payload) in self.entries.items()),
+            key=lambda item: item[1],
+        )
+
+    def restore(self, timers):
+        """
+        Re-arm timers listed by `pending`. Timers that fell due meanwhile run at once.
+        """
+        for key, due, kind, payload in timers:
+            self.schedule_at(key, due, kind, **payload)
+
+    # ---------- Execution ----------
+    async def execute(self, kind, payload):
+        if kind == "delete":
+            await self.bot.delete_message(chat_id=payload["chat_id"], message_id=payload["message_id"])
+        elif kind == "edit":
+            await self.bot.edit_message_text(chat_id=payload["chat_id"], message_id=payload["message_id"], text=payload["text"])
+        else:
+            logging.error(f"Unknown scheduled action: {kind}")
+
+    def _pop_due(self, now):
+        due_actions = []
+        while self.heap and self.heap[0][0] <= now:
+            due, seq, key = heapq.heappop(self.heap)
+            entry = self.entries.get(key)
+            if entry is None or entry[1] != seq:
+                continue  # Replaced or cancelled
+            del self.entries[key]
+            due_actions.append((key, entry[2], entry[3]))
+        return due_actions
+
+    async def run(self, bot):
+        """
+        Process timers until cancelled. Start it once with asyncio.create_task.
+        """
+        self.bot = bot
+        self.wakeup = asyncio.Event()
+        while True:
+            self.wakeup.clear()
+            for key, kind, payload in self._pop_due(self.clock()):
+                try:
+                    await self.execute(kind, payload)
+                except Exception as e:
+                    logging.debug(f"Scheduled action {key} failed: {e}")
+            # Discard stale entries so the next due time is accurate
+            while self.heap and self.entries.get(self.heap[0][2], (None, None))[1] != self.heap[0][1]:
+                heapq.heappop(self.heap)
+            timeout = self.heap[0][0] - self.clock() if self.heap else None
+            if timeout is not None and timeout <= 0:
+                continue
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self, bot):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run(bot))
+        return self.task
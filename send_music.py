@@ -8,6 +8,7 @@ from telegram_bot import send_music_recommendation as send_to_telegram
 from telegram_bot import notify_admins
 from send_quote import stylize_text
 from telegram_bot import append_channel_id
+from telegram_client import get_client
 
 DEBUG_MODE = os.getenv("DEBUG_MODE", "False").lower() == "true"
 
@@ -69,4 +70,5 @@ def process_music_recommendation():
     notify_admins("⚠️ Failed to retrieve or send a music recommendation after 7 consecutive attempts. Possible API key exhaustion or no suitable songs found.")
 
 if __name__ == "__main__":
+    get_client().warm_up()  # Open the pooled Telegram connection while nothing waits on it
     process_music_recommendation()
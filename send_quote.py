@@ -6,6 +6,7 @@ from quote import get_quote
 from google_translate import translate_to_persian
 from telegram_bot import send_message
 from telegram_bot import append_channel_id
+from telegram_client import get_client
 
 DEBUG_MODE = os.getenv("DEBUG_MODE", "False").lower() == "true"
 
@@ -79,4 +80,5 @@ def send_quote_message():
         logging.error("Failed to retrieve quote.")
 
 if __name__ == "__main__":
+    get_client().warm_up()  # Open the pooled Telegram connection while nothing waits on it
     send_quote_message()
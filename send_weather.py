@@ -4,6 +4,7 @@ from weather import get_weather
 from telegram_bot import send_message
 from spotify import push_file_to_github
 from telegram_bot import append_channel_id
+from telegram_client import get_client
 
 DEBUG_MODE = os.getenv("DEBUG_MODE", "False").lower() == "true"
 GITHUB_REPO = "Zudiaq/youtube-mp3-apis"
@@ -116,5 +117,6 @@ def send_weather_update():
         logging.error("Failed to retrieve weather data.")
 
 if __name__ == "__main__":
+    get_client().warm_up()  # Open the pooled Telegram connection while nothing waits on it
     send_weather_update()
 
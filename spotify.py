@@ -6,7 +6,7 @@ import yaml
 import random 
 from dotenv import load_dotenv
 from mood_mapping import get_spotify_recommendations_params
-from youtube_downloader import update_key_usage
+from youtube_downloader import key_pool
 
 load_dotenv()
 
@@ -268,7 +268,7 @@ def get_song_by_mood_spotify(mood):
                     continue
 
                 # Update usage for every attempt
-                update_key_usage("spotify", SPOTIFY_CLIENT_ID, reset_day=None)
+                key_pool.record("spotify", SPOTIFY_CLIENT_ID)
 
                 if song_key not in sent_songs:
                     logging.info(f"Selected unique song: {song_key}")
@@ -288,7 +288,7 @@ def get_song_by_mood_spotify(mood):
         result = direct_search(mood, headers)
         if not result:
             # Update usage for every failed attempt
-            update_key_usage("spotify", SPOTIFY_CLIENT_ID, reset_day=None)
+            key_pool.record("spotify", SPOTIFY_CLIENT_ID)
             return None
         track_name, artist_name, album_name, album_image, preview_url, album_markets = result
         song_key = (track_name, artist_name, album_name)
@@ -302,7 +302,7 @@ def get_song_by_mood_spotify(mood):
             continue
 
         # Update usage for every attempt
-        update_key_usage("spotify", SPOTIFY_CLIENT_ID, reset_day=None)
+        key_pool.record("spotify", SPOTIFY_CLIENT_ID)
 
         if song_key not in sent_songs:
             logging.info(f"Selected unique song: {song_key}")
@@ -0,0 +1,114 @@
+import os
+import json
+import base64
+import zlib
+import logging
+import sqlite3
+import threading
+import time
+
+# ==========================
+# Configuration Variables
+# ==========================
+STATE_DB_FILE = os.getenv("PANEL_STATE_FILE", "panel_state.db")  # Warm-restart snapshot of in-memory panel state
+SNAPSHOT_INTERVAL_SECONDS = int(os.getenv("PANEL_SNAPSHOT_SECONDS", "60"))
+MAX_SNAPSHOT_AGE_SECONDS = 6 * 60 * 60  # Older snapshots belong to a previous deployment and are ignored
+MAX_PACKED_BYTES = 512 * 1024  # Packed snapshots travel in the lease file, which the contents API serves up to 1 MB
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sections (
+    name     TEXT PRIMARY KEY,
+    data     TEXT NOT NULL,
+    saved_at REAL NOT NULL
+);
+"""
+
+# ==========================
+# State Snapshot
+# ==========================
+class StateSnapshot:
+    """
+    SQLite file holding named JSON sections of process state.
+
+    Each component exports plain data (lists, dicts, numbers, strings), so the snapshot
+    never unpickles code. All sections are replaced in one transaction, so a crash
+    mid-write leaves the previous snapshot intact.
+
+    The file only outlives the process on the same host (in-place restarts). A panel
+    replaced by a new workflow run on a fresh runner hands its state over in the lease
+    record instead (see pack_sections).
+    """
+
+    def __init__(self, db_path=STATE_DB_FILE):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def save(self, sections):
+        """
+        Replace the snapshot with `sections`, a dict of section name -> JSON-serializable data.
+        """
+        now = time.time()
+        rows = [(name, json.dumps(data, separators=(",", ":")), now) for name, data in sections.items()]
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.execute("DELETE FROM sections")
+                self.conn.executemany("INSERT INTO sections (name, data, saved_at) VALUES (?, ?, ?)", rows)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def load(self, max_age=MAX_SNAPSHOT_AGE_SECONDS):
+        """
+        Return the saved sections as name -> (data, saved_at), or an empty dict when there
+        is no fresh snapshot. `saved_at` is wall-clock time, for state that ages.
+        """
+        with self.lock:
+            rows = self.conn.execute("SELECT name, data, saved_at FROM sections").fetchall()
+        sections = {}
+        for name, data, saved_at in rows:
+            if time.time() - saved_at > max_age:
+                logging.info(f"Ignoring stale snapshot section {name}.")
+                continue
+            try:
+                sections[name] = (json.loads(data), saved_at)
+            except ValueError as e:
+                logging.error(f"Corrupt snapshot section {name}: {e}")
+        return sections
+
+def pack_sections(sections, max_bytes=MAX_PACKED_BYTES):
+    """
+    Compress `sections` (name -> data) into a string that can be handed to the next
+    process on another host, or None when it would exceed `max_bytes`.
+    """
+    packed = base64.b64encode(zlib.compress(json.dumps(
+        {"saved_at": time.time(), "sections": sections}, separators=(",", ":")
+    ).encode("utf-8"))).decode("ascii")
+    if len(packed) > max_bytes:
+        logging.warning(f"State snapshot is {len(packed)} bytes packed; not handing it over.")
+        return None
+    return packed
+
+def unpack_sections(packed, max_age=MAX_SNAPSHOT_AGE_SECONDS):
+    """
+    Inverse of pack_sections, in the shape returned by StateSnapshot.load.
+    """
+    data = json.loads(zlib.decompress(base64.b64decode(packed)).decode("utf-8"))
+    if time.time() - data["saved_at"] > max_age:
+        logging.info("Ignoring stale handed-over snapshot.")
+        return {}
+    return {name: (section, data["saved_at"]) for name, section in data["sections"].items()}
+
+def json_safe(data):
+    """
+    Keep only the entries of a flat dict that survive a JSON round trip unchanged.
+    """
+    return {key: value for key, value in data.items() if isinstance(value, (bool, int, float, str, type(None)))}
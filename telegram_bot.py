@@ -1,26 +1,28 @@
-import mutagen
-from mutagen.mp3 import MP3
-from mutagen.id3 import ID3, APIC, TIT2, TPE1, TALB
-from youtube_downloader import search_youtube_video, fetch_youtube_download_link
+import asyncio
+import youtube_downloader
+from telegram_client import get_client
+from telegram_client import notify_admins  # Re-exported for the scripts importing it from here
+from media_cache import content_key, get_file_id_cache, track_key
+from mp3_stream import COVER_TIMEOUT_SECONDS, build_id3_tag, fetch_cover_async
 import requests
 import os
 import logging
 from dotenv import load_dotenv
-from pydub import AudioSegment
-from pydub.exceptions import CouldntDecodeError
 import yaml
 
 load_dotenv()
 
 DEBUG_MODE = os.getenv("DEBUG_MODE", "False").lower() == "true"
 ENABLE_TELEGRAM = os.getenv("ENABLE_TELEGRAM", "True").lower() == "true"
+TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")  # Target chat of the scheduled posts
+# Parts of the 400 descriptions Telegram returns for unusable file_ids; other 400s are about the message
+BAD_FILE_ID_ERRORS = ("wrong file identifier", "wrong remote file identifier", "file_id", "file reference")
 
 logging.basicConfig(
     level=logging.DEBUG if DEBUG_MODE else logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
-AudioSegment.converter = "ffmpeg"  
 FONT_MAPPING = {
     "bold": {
         "A": "𝐀", "B": "𝐁", "C": "𝐂", "D": "𝐃", "E": "𝐄", "F": "𝐅", "G": "𝐆", "H": "𝐇", "I": "𝐈", "J": "𝐉",
@@ -82,56 +84,93 @@ def send_message(message):
     if not ENABLE_TELEGRAM:
         logging.info("Telegram messaging is disabled in config")
         return None
-    token = os.getenv('TELEGRAM_BOT_TOKEN')
-    chat_id = os.getenv('TELEGRAM_CHAT_ID')
-    if not token or not chat_id:
+    client = get_client()
+    chat_id = TELEGRAM_CHAT_ID
+    if not client.token or not chat_id:
         logging.error("Telegram credentials are not set in environment variables")
         return None
-    url = f'https://api.telegram.org/bot{token}/sendMessage'
-    payload = {
-        'chat_id': chat_id,
-        'text': append_channel_id(message),
-        'parse_mode': 'HTML',
-        'disable_web_page_preview': True  # Disable preview for hyperlinks
-    }
+    text = append_channel_id(message)
     try:
-        logging.debug(f"Sending message to Telegram chat {chat_id} with payload: {payload}")
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
+        logging.debug(f"Sending message to Telegram chat {chat_id}: {text}")
+        result = client.send_message(chat_id, text)  # Hyperlink previews are disabled
         logging.debug("Message sent successfully")
-        return response.json()
+        return result
     except requests.exceptions.RequestException as e:
         logging.error(f"Error sending message: {e}")
-        logging.error(f"Payload causing error: {payload}")
+        logging.error(f"Message causing error: {text}")
+        return None
+
+def send_cached_audio(file_id, caption):
+    """
+    Send a previously uploaded audio file by its Telegram file_id, without uploading bytes.
+    Returns:
+        dict: Telegram API response, or None if the send failed. A file_id Telegram
+        reports as invalid is removed from the cache so the caller can upload the file again.
+    """
+    if not ENABLE_TELEGRAM:
+        logging.info("Telegram messaging is disabled in config")
+        return None
+    client = get_client()
+    if not client.token or not TELEGRAM_CHAT_ID:
+        logging.error("Telegram credentials are not set in environment variables")
+        return None
+    try:
+        result = client.send_audio(TELEGRAM_CHAT_ID, file_id, append_channel_id(caption))
+        logging.info(f"Sent cached audio {file_id} without uploading")
+        return result
+    except requests.exceptions.HTTPError as e:
+        description = e.response.text.lower() if e.response is not None else ""
+        if e.response is not None and e.response.status_code == 400 and any(
+            error in description for error in BAD_FILE_ID_ERRORS
+        ):
+            logging.warning(f"Telegram rejected cached file_id {file_id}; invalidating it: {e.response.text}")
+            get_file_id_cache().invalidate(file_id)
+        else:
+            logging.error(f"Error sending cached audio: {e} {description}")
+        return None
+    except requests.exceptions.RequestException as e:
+        logging.error(f"Error sending cached audio: {e}")
         return None
 
-def send_audio_with_caption(audio_path, caption):
+def send_audio_with_caption(audio_path, caption, cache_keys=()):
     """
     Send an audio file with caption to the configured Telegram chat.
+    A file with the same content already uploaded is sent by file_id instead.
     Args:
         audio_path (str): Path to the audio file.
         caption (str): Caption text for the audio.
+        cache_keys (tuple): Extra keys (such as the track identity) to remember the file_id under.
     Returns:
         dict: Telegram API response or None if error.
     """
     if not ENABLE_TELEGRAM:
         logging.info("Telegram messaging is disabled in config")
         return None
-    token = os.getenv('TELEGRAM_BOT_TOKEN')
-    chat_id = os.getenv('TELEGRAM_CHAT_ID')
-    if not token or not chat_id:
+    client = get_client()
+    chat_id = TELEGRAM_CHAT_ID
+    if not client.token or not chat_id:
         logging.error("Telegram credentials are not set in environment variables")
         return None
-    url = f'https://api.telegram.org/bot{token}/sendAudio'
+    cache = get_file_id_cache()
+    try:
+        keys = tuple(cache_keys) + (content_key(audio_path),)
+    except FileNotFoundError:
+        logging.error(f"Audio file not found: {audio_path}")
+        return None
+    file_id = cache.get(*keys)
+    if file_id:
+        result = send_cached_audio(file_id, caption)
+        if result:
+            return result
     try:
         with open(audio_path, 'rb') as audio_file:
-            files = {'audio': audio_file}
-            data = {'chat_id': chat_id, 'caption': append_channel_id(caption), 'parse_mode': 'HTML'}
             logging.debug(f"Sending audio to Telegram chat {chat_id}")
-            response = requests.post(url, files=files, data=data)
-            response.raise_for_status()
+            result = client.send_audio(chat_id, audio_file, append_channel_id(caption))
             logging.debug("Audio sent successfully")
-            return response.json()
+        audio = (result.get("result") or {}).get("audio") or {}
+        if audio.get("file_id"):
+            cache.put(audio["file_id"], *keys)
+        return result
     except FileNotFoundError:
         logging.error(f"Audio file not found: {audio_path}")
         return None
@@ -158,9 +197,7 @@ def send_music_recommendation(track_name, artist_name, album_name=None, album_im
         logging.info("Telegram messaging is disabled in config")
         return None
 
-    token = os.getenv('TELEGRAM_BOT_TOKEN')
-    chat_id = os.getenv('TELEGRAM_CHAT_ID')
-    if not token or not chat_id:
+    if not get_client().token or not TELEGRAM_CHAT_ID:
         logging.error("Telegram credentials are not set in environment variables")
         return None
 
@@ -170,41 +207,33 @@ def send_music_recommendation(track_name, artist_name, album_name=None, album_im
         message += f"\U0001F4BF {stylize_text(album_name, 'italic')}"
 
     logging.info(f"Sending music recommendation: {message}")
-    # Search and download audio from YouTube
-    audio_path = search_and_download_youtube_mp3(track_name, artist_name, album_name)
-    if audio_path and os.path.exists(audio_path):
-        # Format the MP3 file name properly
-        formatted_name = format_mp3_filename(track_name, artist_name, album_name)
-        formatted_path = os.path.join(os.path.dirname(audio_path), formatted_name)
-        os.rename(audio_path, formatted_path)
-        audio_path = formatted_path
+    # A track uploaded before is re-sent by file_id, skipping the search, download and upload
+    file_id = get_file_id_cache().get(track_key(track_name, artist_name, album_name))
+    if file_id:
+        result = send_cached_audio(file_id, message)
+        if result:
+            return result
 
-        try:
-            # Embed metadata
-            logging.info(f"Embedding metadata into MP3 file: {audio_path}")
-            audio = MP3(audio_path, ID3=ID3)
+    # The cover downloads while the track is searched; its tag is written ahead of the audio
+    cover_future = fetch_cover_async(album_image)
+
+    def id3_tag():
+        cover = None
+        if cover_future is not None:
             try:
-                audio.add_tags()
-            except Exception:
-                pass
-            audio.tags.add(TIT2(encoding=3, text=track_name))  # Track name
-            audio.tags.add(TPE1(encoding=3, text=artist_name if artist_name else "Unknown Artist"))  # Artist name
-            if album_name:
-                audio.tags.add(TALB(encoding=3, text=album_name))  # Album name
-            if album_image:
-                img_data = requests.get(album_image).content
-                audio.tags.add(APIC(
-                    encoding=3,
-                    mime='image/jpeg',
-                    type=3,
-                    desc='Cover',
-                    data=img_data
-                ))
-            audio.save()
-            logging.info(f"Metadata embedded successfully into MP3 file: {audio_path}")
+                cover = cover_future.result(timeout=COVER_TIMEOUT_SECONDS)
+            except Exception as e:
+                logging.warning(f"Sending without cover art: {e}")
+        return build_id3_tag(track_name, artist_name, album_name, cover)
 
+    # Search and download audio from YouTube straight into a tagged, correctly named file
+    audio_path = search_and_download_youtube_mp3(
+        track_name, artist_name, album_name, tag=id3_tag, file_name=format_mp3_filename(track_name, artist_name, album_name)
+    )
+    if audio_path and os.path.exists(audio_path):
+        try:
             # Send MP3 to Telegram
-            return send_audio_with_caption(audio_path, message)
+            return send_audio_with_caption(audio_path, message, (track_key(track_name, artist_name, album_name),))
         except Exception as e:
             logging.error(f"Error sending MP3: {e}")
             if os.path.exists(audio_path):
@@ -222,23 +251,6 @@ def send_music_recommendation(track_name, artist_name, album_name=None, album_im
 
     return None
 
-def is_valid_mp3(file_path):
-    """
-    Validate if the given file is a valid MP3 file.
-    Args:
-        file_path (str): Path to the file to validate.
-    Returns:
-        bool: True if the file is a valid MP3, False otherwise.
-    """
-    try:
-        logging.info(f"Validating MP3 file: {file_path}")
-        MP3(file_path)  # Attempt to load the file as an MP3
-        logging.info(f"MP3 validation successful: {file_path}")
-        return True
-    except Exception as e:
-        logging.error(f"MP3 validation failed for {file_path}: {e}")
-        return False
-
 def increment_api_usage():
     """
     Increment the API usage count in a YAML file.
@@ -258,67 +270,16 @@ def increment_api_usage():
     except Exception as e:
         logging.error(f"Failed to increment API usage: {e}")
 
-def search_and_download_youtube_mp3(track_name, artist_name, album_name=None):
+def search_and_download_youtube_mp3(track_name, artist_name, album_name=None, tag=b"", file_name=None):
     """
-    Search YouTube for the track and download the audio as MP3.
-    Retry up to 3 times if the initial attempt fails.
+    Synchronous entry point of the acquisition pipeline for the scheduled scripts
+    (see youtube_downloader.search_and_download_youtube_mp3), counting every attempt
+    in the API usage file.
     Returns the path to the downloaded MP3 file or None if failed.
     """
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            # Increment API usage only for YouTube API requests
-            increment_api_usage()
-
-            # Search for the video
-            query = f"{track_name} {artist_name}"
-            if album_name:
-                query += f" {album_name}"
-            video_url = search_youtube_video(query, artist_name)  # Pass artist_name explicitly
-            if not video_url:
-                logging.error(f"No YouTube video found for the query (Attempt {attempt + 1}/{max_retries})")
-                continue
-
-            # Get the download link
-            mp3_url = fetch_youtube_download_link(video_url)
-            if not mp3_url:
-                logging.error(f"Failed to fetch YouTube MP3 download link (Attempt {attempt + 1}/{max_retries})")
-                continue
-
-            # Download the MP3 file
-            response = requests.get(mp3_url, stream=True)
-            if response.status_code == 200:
-                file_name = f"{track_name}_{artist_name}.mp3".replace(" ", "_")
-                with open(file_name, 'wb') as f:
-                    for chunk in response.iter_content(1024):
-                        f.write(chunk)
-                return file_name
-            else:
-                logging.error(f"Failed to download MP3 file (Attempt {attempt + 1}/{max_retries})")
-                continue
-        except Exception as e:
-            logging.error(f"Error in search_and_download_youtube_mp3 (Attempt {attempt + 1}/{max_retries}): {e}")
-
-    logging.error("All attempts to fetch YouTube MP3 download link failed.")
-    return None
-
-def notify_admins(message):
-    """
-    Notify admins via Telegram when an issue occurs.
-    """
-    admin_chat_ids = os.getenv('ADMIN_CHAT_ID', '')
-    if not admin_chat_ids:
-        logging.error("ADMIN_CHAT_ID is not set in environment variables")
-        return
-    admin_ids = admin_chat_ids.split(",")
-    for admin_id in admin_ids:
-        payload = {'chat_id': admin_id.strip(), 'text': message, 'parse_mode': 'HTML'}
-        try:
-            response = requests.post(f'https://api.telegram.org/bot{os.getenv("TELEGRAM_BOT_TOKEN")}/sendMessage', json=payload)
-            response.raise_for_status()
-            logging.info(f"Notification sent to admin {admin_id}")
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Failed to notify admin {admin_id}: {e}")
+    return asyncio.run(youtube_downloader.search_and_download_youtube_mp3(
+        track_name, artist_name, album_name, tag=tag, file_name=file_name, on_attempt=increment_api_usage
+    ))
 
 def edit_message(message_id, new_text):
     """
@@ -332,12 +293,11 @@ def edit_message(message_id, new_text):
     if not ENABLE_TELEGRAM:
         logging.info("Telegram messaging is disabled in config")
         return None
-    token = os.getenv('TELEGRAM_BOT_TOKEN')
-    chat_id = os.getenv('TELEGRAM_CHAT_ID')
-    if not token or not chat_id:
+    client = get_client()
+    chat_id = TELEGRAM_CHAT_ID
+    if not client.token or not chat_id:
         logging.error("Telegram credentials are not set in environment variables")
         return None
-    url = f'https://api.telegram.org/bot{token}/editMessageText'
     # Convert message_id to integer to ensure proper format for Telegram API
     try:
         message_id = int(message_id)
@@ -345,20 +305,13 @@ def edit_message(message_id, new_text):
         logging.error(f"Invalid message_id format: {message_id}. Must be convertible to integer.")
         return None
         
-    payload = {
-        'chat_id': chat_id,
-        'message_id': message_id,
-        'text': append_channel_id(new_text),
-        'parse_mode': 'HTML',
-        'disable_web_page_preview': True  # Disable preview for hyperlinks
-    }
+    text = append_channel_id(new_text)
     try:
-        logging.debug(f"Editing message {message_id} in Telegram chat {chat_id} with payload: {payload}")
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
+        logging.debug(f"Editing message {message_id} in Telegram chat {chat_id}: {text}")
+        result = client.edit_message_text(chat_id, message_id, text)  # Hyperlink previews are disabled
         logging.debug("Message edited successfully")
-        return response.json()
+        return result
     except requests.exceptions.RequestException as e:
         logging.error(f"Error editing message: {e}")
-        logging.error(f"Payload causing error: {payload}")
+        logging.error(f"Message causing error: {text}")
         return None
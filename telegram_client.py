@@ -0,0 +1,156 @@
+import os
+import logging
+import random
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+# ==========================
+# Configuration Variables
+# ==========================
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "https://api.telegram.org")
+CONNECT_TIMEOUT_SECONDS = 5
+READ_TIMEOUT_SECONDS = 30
+UPLOAD_READ_TIMEOUT_SECONDS = 120  # Uploads of large MP3 files wait longest for the answer
+MAX_RETRIES = 3
+BACKOFF_BASE_SECONDS = 1.0
+POOL_SIZE = 4
+# Read-only methods: retrying one whose answer timed out cannot post anything twice
+IDEMPOTENT_METHODS = {"getMe", "getFile", "getChat", "getChatMember", "getChatMemberCount", "getUpdates"}
+
+# ==========================
+# Telegram Client
+# ==========================
+class TelegramClient:
+    """
+    Minimal synchronous Bot API client for the scheduled scripts.
+
+    One pooled keep-alive session is shared by every call, so a script pays for the TLS
+    handshake once. Calls have connect and read timeouts, honour 429 `retry_after`, and
+    retry 5xx answers and connection errors with jittered exponential back-off. A read
+    timeout is only retried for IDEMPOTENT_METHODS: Telegram may already have posted the
+    message whose answer was slow. Errors
+    that remain are raised as requests exceptions, which the callers already handle.
+    """
+
+    def __init__(self, token=None, base_url=TELEGRAM_API_BASE_URL, max_retries=MAX_RETRIES,
+                 timeout=(CONNECT_TIMEOUT_SECONDS, READ_TIMEOUT_SECONDS)):
+        self.token = token or os.getenv("TELEGRAM_BOT_TOKEN")
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.me = None
+
+    def backoff(self, attempt):
+        return BACKOFF_BASE_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+    def call(self, method, payload=None, files=None, timeout=None):
+        """
+        Call Bot API `method`. JSON payloads are sent as JSON, payloads with files as multipart.
+        Returns:
+            dict: The decoded Telegram response.
+        """
+        if not self.token:
+            raise requests.exceptions.InvalidURL("TELEGRAM_BOT_TOKEN is not set")
+        url = f"{self.base_url}/bot{self.token}/{method}"
+        for attempt in range(self.max_retries + 1):
+            for file in (files or {}).values():
+                file.seek(0)  # Rewind uploads consumed by a failed attempt
+            try:
+                if files:
+                    response = self.session.post(url, data=payload, files=files, timeout=timeout or self.timeout)
+                else:
+                    response = self.session.post(url, json=payload, timeout=timeout or self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                # ConnectTimeout is a ConnectionError: the request never reached Telegram
+                retryable = isinstance(e, requests.exceptions.ConnectionError) or method in IDEMPOTENT_METHODS
+                if attempt == self.max_retries or not retryable:
+                    raise
+                delay = self.backoff(attempt)
+                logging.warning(f"Telegram {method} failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            if response.status_code == 429 and attempt < self.max_retries:
+                try:
+                    retry_after = response.json().get("parameters", {}).get("retry_after", 1)
+                except ValueError:
+                    retry_after = 1
+                delay = retry_after + random.uniform(0, 1)
+                logging.warning(f"Telegram {method} rate limited; retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            if response.status_code >= 500 and attempt < self.max_retries:
+                delay = self.backoff(attempt)
+                logging.warning(f"Telegram {method} returned {response.status_code}; retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            response.raise_for_status()
+            return response.json()
+
+    def warm_up(self):
+        """
+        Open the pooled connection with a getMe call so the first real message skips the handshake.
+        Returns the bot user, or None when the call failed.
+        """
+        started = time.perf_counter()
+        try:
+            self.me = self.call("getMe").get("result")
+            logging.info(f"Telegram connection ready as @{self.me.get('username')} in {time.perf_counter() - started:.2f}s")
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Telegram warm-up failed: {e}")
+        return self.me
+
+    # ---------- Bot API methods ----------
+    def send_message(self, chat_id, text, parse_mode="HTML", disable_web_page_preview=True):
+        return self.call("sendMessage", {
+            "chat_id": chat_id, "text": text, "parse_mode": parse_mode,
+            "disable_web_page_preview": disable_web_page_preview,
+        })
+
+    def send_audio(self, chat_id, audio, caption=None, parse_mode="HTML"):
+        """
+        Send audio given either an open file (uploaded) or the file_id of an earlier upload.
+        """
+        payload = {"chat_id": chat_id, "caption": caption, "parse_mode": parse_mode}
+        if isinstance(audio, str):
+            return self.call("sendAudio", dict(payload, audio=audio))
+        return self.call(
+            "sendAudio", payload, files={"audio": audio}, timeout=(CONNECT_TIMEOUT_SECONDS, UPLOAD_READ_TIMEOUT_SECONDS),
+        )
+
+    def edit_message_text(self, chat_id, message_id, text, parse_mode="HTML", disable_web_page_preview=True):
+        return self.call("editMessageText", {
+            "chat_id": chat_id, "message_id": message_id, "text": text, "parse_mode": parse_mode,
+            "disable_web_page_preview": disable_web_page_preview,
+        })
+
+_client = None
+
+def get_client():
+    """
+    Return the process-wide client, created on first use.
+    """
+    global _client
+    if _client is None:
+        _client = TelegramClient()
+    return _client
+
+def notify_admins(message):
+    """
+    Send `message` to every chat in ADMIN_CHAT_ID through the shared client.
+    """
+    admin_ids = [admin_id.strip() for admin_id in os.getenv("ADMIN_CHAT_ID", "").split(",") if admin_id.strip()]
+    if not admin_ids:
+        logging.error("ADMIN_CHAT_ID is not set in environment variables")
+        return
+    client = get_client()
+    for admin_id in admin_ids:
+        try:
+            client.call("sendMessage", {"chat_id": admin_id, "text": message, "parse_mode": "HTML"})
+            logging.info(f"Notification sent to admin {admin_id}")
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Failed to notify admin {admin_id}: {e}")
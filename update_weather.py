@@ -5,6 +5,7 @@ from weather import get_weather
 from telegram_bot import edit_message
 from send_quote import stylize_text
 from telegram_bot import append_channel_id
+from telegram_client import get_client
 from datetime import datetime
 from pytz import timezone
 
@@ -93,4 +94,5 @@ def update_weather_message():
         logging.error("Failed to retrieve weather data.")
 
 if __name__ == "__main__":
+    get_client().warm_up()  # Open the pooled Telegram connection while nothing waits on it
     update_weather_message()
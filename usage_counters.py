@@ -0,0 +1,400 @@
+import os
+import json
+import base64
+import calendar
+import fcntl
+import hashlib
+import logging
+import socket
+import uuid
+from datetime import date
+import requests
+import yaml
+
+# ==========================
+# Configuration Variables
+# ==========================
+USAGE_REPO = os.getenv("KEY_USAGE_REPO", "Zudiaq/youtube-mp3-apis")  # Repository holding the key files and shards
+USAGE_STORE_DIR = os.getenv("KEY_USAGE_STORE_DIR")  # Local directory used instead of GitHub when set
+SHARD_ROOT = "usage-shards"
+FOLDED_FIELD = "folded usage shards"  # Base-file map of shard counts already added to the key entries
+COMPACT_AFTER_SHARDS = 8  # A flush that saw this many shards folds them into the base file
+WRITE_RETRIES = 3
+
+def reset_epoch(reset_day, today=None):
+    """
+    Date of the most recent monthly reset of a key as an ISO string, or "" for keys without a
+    reset_day. A reset_day past the end of a month falls on its last day.
+    """
+    if not reset_day:
+        return ""
+    today = today or date.today()
+    year, month = today.year, today.month
+    if today.day < min(reset_day, calendar.monthrange(year, month)[1]):
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return date(year, month, min(reset_day, calendar.monthrange(year, month)[1])).isoformat()
+
+def counter_id(service_name, key, epoch):
+    return f"{service_name}|{key}|{epoch}"
+
+def parse_counter_id(counter):
+    service_name, rest = counter.split("|", 1)
+    key, epoch = rest.rsplit("|", 1)
+    return service_name, key, epoch
+
+# ==========================
+# Shard Stores
+# ==========================
+class ShardConflict(Exception):
+    """
+    Raised when a file changed (or vanished) since the version the writer named.
+    """
+
+class FileShardStore:
+    """
+    Local store: files under `root`, versioned by content hash, with compare-and-swap under
+    flock. Stand-in for the GitHub store in tests and single-host deployments.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _locked(self):
+        handle = open(os.path.join(self.root, ".lock"), "a+")
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    def _read(self, path):
+        try:
+            with open(os.path.join(self.root, path), "rb") as file:
+                content = file.read()
+            return content, hashlib.sha1(content).hexdigest()
+        except FileNotFoundError:
+            return None, None
+
+    def read(self, path):
+        """
+        Returns:
+            tuple: (bytes or None, version or None)
+        """
+        with self._locked():
+            return self._read(path)
+
+    def write(self, path, content, version=None):
+        """
+        Store `content` if `path` is still at `version` (None: must not exist). Returns the new version.
+        """
+        with self._locked():
+            if self._read(path)[1] != version:
+                raise ShardConflict(f"{path} is not at version {version}")
+            full_path = os.path.join(self.root, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "wb") as file:
+                file.write(content)
+            return hashlib.sha1(content).hexdigest()
+
+    def delete(self, path, version):
+        with self._locked():
+            if version is None or self._read(path)[1] != version:
+                raise ShardConflict(f"{path} is not at version {version}")
+            os.remove(os.path.join(self.root, path))
+
+    def list(self, directory):
+        """
+        Returns:
+            dict: path -> version of the files directly under `directory`.
+        """
+        with self._locked():
+            try:
+                names = os.listdir(os.path.join(self.root, directory))
+            except FileNotFoundError:
+                return {}
+            return {f"{directory}/{name}": self._read(f"{directory}/{name}")[1] for name in names}
+
+class GitHubShardStore:
+    """
+    Files in a GitHub repository through the contents API. The blob SHA is the version,
+    so writes and deletes naming a stale SHA are rejected.
+    """
+
+    def __init__(self, repo=USAGE_REPO, token=None):
+        self.base_url = f"https://api.github.com/repos/{repo}/contents"
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"token {token or os.getenv('GH_PAT')}"
+
+    def read(self, path):
+        response = self.session.get(f"{self.base_url}/{path}", timeout=10)
+        if response.status_code == 404:
+            return None, None
+        response.raise_for_status()
+        data = response.json()
+        return base64.b64decode(data["content"]), data["sha"]
+
+    def write(self, path, content, version=None):
+        payload = {
+            "message": f"Update {path}",
+            "content": base64.b64encode(content).decode("utf-8"),
+        }
+        if version:
+            payload["sha"] = version
+        response = self.session.put(f"{self.base_url}/{path}", json=payload, timeout=10)
+        if response.status_code in (404, 409, 422):
+            raise ShardConflict(f"{path} changed concurrently: {response.status_code}")
+        response.raise_for_status()
+        return response.json()["content"]["sha"]
+
+    def delete(self, path, version):
+        payload = {"message": f"Compact {path}", "sha": version}
+        response = self.session.delete(f"{self.base_url}/{path}", json=payload, timeout=10)
+        if response.status_code in (404, 409, 422):
+            raise ShardConflict(f"{path} changed concurrently: {response.status_code}")
+        response.raise_for_status()
+
+    def list(self, directory):
+        response = self.session.get(f"{self.base_url}/{directory}", timeout=10)
+        if response.status_code == 404:
+            return {}
+        response.raise_for_status()
+        return {item["path"]: item["sha"] for item in response.json() if item["type"] == "file"}
+
+def default_store():
+    return FileShardStore(USAGE_STORE_DIR) if USAGE_STORE_DIR else GitHubShardStore()
+
+# ==========================
+# Sharded Usage
+# ==========================
+class ShardedUsage:
+    """
+    Usage counts of a YAML key file as a grow-only counter (G-counter) split per writer.
+
+    Every process writes only its own shard, `usage-shards/<file>/<writer>.json`, holding its
+    cumulative count per (service, key, reset epoch), so concurrent writers never contend
+    on a SHA. Readers add the shards to the base file. `compact` folds the shards into the
+    base: it records what it folded under FOLDED_FIELD, writes the base with its SHA, then
+    deletes each shard by the SHA it read. A writer whose shard was deleted therefore knows
+    all of it was folded and starts a fresh one. Totals stay exact through any
+    interleaving, and a compaction that dies half-way is redone without double counting.
+    """
+
+    def __init__(self, store, base_path, writer_id=None):
+        self.store = store
+        self.base_path = base_path
+        self.shard_dir = f"{SHARD_ROOT}/{os.path.splitext(os.path.basename(base_path))[0]}"
+        self.writer_id = writer_id or f"{os.getenv('GITHUB_RUN_ID', socket.gethostname())}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.generation = 0
+        self.written = {}  # Counts in our current shard
+        self.version = None
+        self.shard_count = 0  # Shards seen by the last read
+
+    def _shard_path(self):
+        return f"{self.shard_dir}/{self.writer_id}.{self.generation}.json"
+
+    def _read_base(self):
+        content, version = self.store.read(self.base_path)
+        return (yaml.safe_load(content) or {}) if content else {}, version
+
+    def _read_shards(self):
+        shards = {}
+        for path, version in self.store.list(self.shard_dir).items():
+            content, version = self.store.read(path)
+            if content is not None:
+                shards[os.path.basename(path)[:-len(".json")]] = (json.loads(content), version)
+        self.shard_count = len(shards)
+        return shards
+
+    @staticmethod
+    def _fold(data, shards, today):
+        """
+        Add shard counts not yet folded to the key entries of `data`, applying monthly resets.
+        """
+        entries = {}
+        for section, keys in data.items():
+            for entry in keys if isinstance(keys, list) and section.endswith(" keys") else []:
+                entries[(section[:-len(" keys")], entry["key"])] = entry
+                epoch = reset_epoch(entry.get("reset_day"), today)
+                if epoch and str(entry.get("last_reset") or "") < epoch:
+                    entry["usage"], entry["last_reset"] = 0, epoch
+        folded = data.setdefault(FOLDED_FIELD, {})
+        for writer, counts in shards.items():
+            done = folded.get(writer, {})
+            for counter, count in counts.items():
+                service_name, key, epoch = parse_counter_id(counter)
+                entry = entries.get((service_name, key))
+                if entry is not None and epoch == reset_epoch(entry.get("reset_day"), today):
+                    entry["usage"] += count - done.get(counter, 0)
+            folded[writer] = dict(counts)
+        for writer in [writer for writer in folded if writer not in shards]:
+            del folded[writer]  # Its shard is gone, so nothing can be folded twice
+        return data
+
+    def load(self, today=None):
+        """
+        Return the base file's data with every shard added to the key usage counts.
+        """
+        shards = self._read_shards()  # Before the base: a compaction in between then only adds folded entries
+        data, _ = self._read_base()
+        data = self._fold(data, {writer: counts for writer, (counts, _) in shards.items()}, today or date.today())
+        data.pop(FOLDED_FIELD, None)
+        return data
+
+    def add(self, counts):
+        """
+        Add `counts` (counter_id -> uses) to this writer's shard.
+        """
+        for _ in range(WRITE_RETRIES):
+            merged = dict(self.written)
+            for counter, count in counts.items():
+                merged[counter] = merged.get(counter, 0) + count
+            try:
+                self.version = self.store.write(self._shard_path(), json.dumps(merged, sort_keys=True).encode("utf-8"),
+                                                self.version)
+                self.written = merged
+                return
+            except ShardConflict:
+                content, version = self.store.read(self._shard_path())
+                if content is None:  # Compacted: everything we wrote is in the base file
+                    self.generation += 1
+                    self.written, self.version = {}, None
+                else:
+                    self.written, self.version = json.loads(content), version
+        raise ShardConflict(f"Could not write {self._shard_path()}")
+
+    def compact(self, today=None):
+        """
+        Fold all shards into the base file and delete them. Returns the number of shards folded.
+        """
+        for _ in range(WRITE_RETRIES):
+            data, base_version = self._read_base()
+            shards = self._read_shards()
+            self._fold(data, {writer: counts for writer, (counts, _) in shards.items()}, today or date.today())
+            try:
+                self.store.write(self.base_path, yaml.safe_dump(data).encode("utf-8"), base_version)
+            except ShardConflict:
+                continue
+            for writer, (_, version) in shards.items():
+                try:
+                    self.store.delete(f"{self.shard_dir}/{writer}.json", version)
+                except ShardConflict:
+                    pass  # Written again since we read it; the next compaction folds the rest
+            logging.info(f"Compacted {len(shards)} usage shards into {self.base_path}.")
+            return len(shards)
+        raise ShardConflict(f"Could not compact {self.base_path}")
+
+if __name__ == "__main__":
+    import random
+    import tempfile
+    import threading
+    import time
+
+    WRITERS = 24
+    ROUNDS = 20
+    services = {"youtube-mp3-2025.p.rapidapi.com": ["key-a", "key-b", "key-c"], "spotify": ["client"]}
+    base = {f"{service} keys": [{"key": key, "usage": 0, "reset_day": None} for key in keys]
+            for service, keys in services.items()}
+
+    class JitteryStore(FileShardStore):
+        """
+        Local store with network-like delays, counting the conflicts seen per kind of file.
+        """
+
+        def __init__(self, root):
+            super().__init__(root)
+            self.conflicts = {"shard write": 0, "shard delete": 0, "base write": 0}
+            self.stats_lock = threading.Lock()
+
+        def _call(self, method, path, *args):
+            time.sleep(random.uniform(0, 0.002))
+            try:
+                return method(path, *args)
+            except ShardConflict:
+                with self.stats_lock:
+                    kind = "shard" if path.startswith(SHARD_ROOT) else "base"
+                    self.conflicts[f"{kind} {method.__name__}"] += 1
+                raise
+
+        def write(self, path, content, version=None):
+            return self._call(super().write, path, content, version)
+
+        def delete(self, path, version):
+            return self._call(super().delete, path, version)
+
+    def simulate_single_file(store, truth, lock):
+        """
+        The previous scheme: every writer rewrites the shared file, retrying a conflict once.
+        """
+        for _ in range(ROUNDS):
+            service = random.choice(list(services))
+            key = random.choice(services[service])
+            with lock:
+                truth[(service, key)] += 1
+            for _ in range(2):
+                content, version = store.read("single.yaml")
+                data = yaml.safe_load(content)
+                next(entry for entry in data[f"{service} keys"] if entry["key"] == key)["usage"] += 1
+                try:
+                    store.write("single.yaml", yaml.safe_dump(data).encode("utf-8"), version)
+                    break
+                except ShardConflict:
+                    continue
+
+    def simulate_sharded(store, truth, lock):
+        usage = ShardedUsage(store, "keys.yaml")
+        for _ in range(ROUNDS):
+            counts = {}
+            for _ in range(random.randint(1, 5)):
+                service = random.choice(list(services))
+                key = random.choice(services[service])
+                counter = counter_id(service, key, "")
+                counts[counter] = counts.get(counter, 0) + 1
+            usage.add(counts)
+            with lock:
+                for counter, count in counts.items():
+                    service, key, _ = parse_counter_id(counter)
+                    truth[(service, key)] += count
+            if random.random() < 0.15:
+                try:
+                    usage.compact()
+                except ShardConflict:
+                    pass  # Another writer kept winning; its compaction covers ours
+
+    def totals(data):
+        return {(section[:-len(" keys")], entry["key"]): entry["usage"]
+                for section, keys in data.items() if section.endswith(" keys") for entry in keys}
+
+    def run(label, target, check):
+        with tempfile.TemporaryDirectory() as root:
+            store = JitteryStore(root)
+            store.write("single.yaml", yaml.safe_dump(base).encode("utf-8"))
+            store.write("keys.yaml", yaml.safe_dump(base).encode("utf-8"))
+            truth = {(service, key): 0 for service, keys in services.items() for key in keys}
+            lock = threading.Lock()
+            started = time.perf_counter()
+            threads = [threading.Thread(target=target, args=(store, truth, lock)) for _ in range(WRITERS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            counted = check(store)
+            lost = sum(truth.values()) - sum(counted.values())
+            print(f"{label:<22} {sum(truth.values()):5} uses  {sum(counted.values()):5} counted  {lost:4} lost  "
+                  f"conflicts {store.conflicts}  {elapsed:.2f}s  exact: {counted == truth}")
+
+    def check_single(store):
+        return totals(yaml.safe_load(store.read("single.yaml")[0]))
+
+    def check_sharded(store):
+        usage = ShardedUsage(store, "keys.yaml", writer_id="checker")
+        merged = totals(usage.load())
+        usage.compact()
+        compacted = totals(usage.load())
+        remaining = len(store.list(usage.shard_dir))
+        assert merged == compacted and remaining == 0, (merged, compacted, remaining)
+        return merged
+
+    logging.basicConfig(level=logging.WARNING)
+    print(f"{WRITERS} concurrent writers, {ROUNDS} flushes each. Shard write conflicts only mean "
+          f"'your shard was compacted'; shard delete and base write conflicts are compactions racing.")
+    run("single shared file", simulate_single_file, check_single)
+    run("sharded G-counter", simulate_sharded, check_sharded)
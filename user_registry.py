@@ -0,0 +1,282 @@
+import os
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+import yaml
+
+# ==========================
+# Configuration Variables
+# ==========================
+USER_DB_FILE = os.getenv("USER_DB_FILE", "panel_users.db")  # Local SQLite database of panel users
+USER_FIELDS = ("chat_id", "username", "first_name", "last_name", "language", "is_admin", "joined_at")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    chat_id    INTEGER PRIMARY KEY,
+    username   TEXT,
+    first_name TEXT,
+    last_name  TEXT,
+    language   TEXT NOT NULL DEFAULT 'en',
+    is_admin   INTEGER NOT NULL DEFAULT 0,
+    joined_at  TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_users_language ON users (language);
+CREATE INDEX IF NOT EXISTS idx_users_is_admin ON users (is_admin);
+CREATE INDEX IF NOT EXISTS idx_users_joined_at ON users (joined_at);
+CREATE INDEX IF NOT EXISTS idx_users_admin_joined ON users (is_admin, joined_at);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+def row_to_user(row):
+    """
+    Convert a database row into the user dict shape used by the panel and the YAML file.
+    """
+    if row is None:
+        return None
+    user = dict(zip(USER_FIELDS, row))
+    user["is_admin"] = bool(user["is_admin"])
+    if user["joined_at"] is None:
+        del user["joined_at"]
+    return user
+
+# ==========================
+# User Registry
+# ==========================
+class UserRegistry:
+    """
+    Embedded SQLite registry of panel users keyed by chat_id.
+
+    Every lookup goes through the primary key or one of the secondary indexes on
+    language, admin flag and join date, so no caller has to load the whole user base.
+    The connection is shared between the event loop and the flusher thread behind a lock.
+    """
+
+    def __init__(self, db_path=USER_DB_FILE):
+        self.db_path = db_path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    # ---------- Meta ----------
+    def get_meta(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    # ---------- Reads ----------
+    def get(self, chat_id):
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT {', '.join(USER_FIELDS)} FROM users WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+        return row_to_user(row)
+
+    def exists(self, chat_id):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM users WHERE chat_id = ?", (chat_id,)).fetchone() is not None
+
+    def get_language(self, chat_id):
+        with self.lock:
+            row = self.conn.execute("SELECT language FROM users WHERE chat_id = ?", (chat_id,)).fetchone()
+        return row[0] if row else None
+
+    def count(self, exclude_admins=False):
+        query = "SELECT COUNT(*) FROM users" + (" WHERE is_admin = 0" if exclude_admins else "")
+        with self.lock:
+            return self.conn.execute(query).fetchone()[0]
+
+    def list_users(self, exclude_admins=False, offset=0, limit=-1):
+        """
+        Return users in join order (legacy users without a join date first).
+        `limit=-1` returns every remaining user.
+        """
+        query = f"SELECT {', '.join(USER_FIELDS)} FROM users"
+        if exclude_admins:
+            query += " WHERE is_admin = 0"
+        query += " ORDER BY joined_at, chat_id LIMIT ? OFFSET ?"
+        with self.lock:
+            rows = self.conn.execute(query, (limit, offset)).fetchall()
+        return [row_to_user(row) for row in rows]
+
+    def chat_ids(self, exclude_admins=False, language=None):
+        query = "SELECT chat_id FROM users"
+        conditions, params = [], []
+        if exclude_admins:
+            conditions.append("is_admin = 0")
+        if language:
+            conditions.append("language = ?")
+            params.append(language)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self.lock:
+            return [row[0] for row in self.conn.execute(query, params)]
+
+    # ---------- Mutations ----------
+    def add(self, user):
+        """
+        Insert a user. Returns False if the chat_id is already registered.
+        """
+        values = (
+            user["chat_id"], user.get("username"), user.get("first_name"), user.get("last_name"),
+            user.get("language") or "en", int(bool(user.get("is_admin", False))),
+            user.get("joined_at") or datetime.now().isoformat(timespec="seconds"),
+        )
+        with self.lock:
+            cursor = self.conn.execute(
+                f"INSERT OR IGNORE INTO users ({', '.join(USER_FIELDS)}) VALUES (?, ?, ?, ?, ?, ?, ?)", values
+            )
+        return cursor.rowcount > 0
+
+    def update(self, chat_id, **fields):
+        """
+        Update fields of a user. Returns the number of rows that actually changed.
+        """
+        fields = {key: value for key, value in fields.items() if key in USER_FIELDS and key != "chat_id"}
+        if not fields:
+            return 0
+        if "is_admin" in fields:
+            fields["is_admin"] = int(bool(fields["is_admin"]))
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        changes = " OR ".join(f"{key} IS NOT ?" for key in fields)
+        params = list(fields.values()) + [chat_id] + list(fields.values())
+        with self.lock:
+            cursor = self.conn.execute(
+                f"UPDATE users SET {assignments} WHERE chat_id = ? AND ({changes})", params
+            )
+        return cursor.rowcount
+
+    def remove(self, chat_id):
+        with self.lock:
+            cursor = self.conn.execute("DELETE FROM users WHERE chat_id = ?", (chat_id,))
+        return cursor.rowcount > 0
+
+    def set_admins(self, admin_ids):
+        """
+        Flag exactly `admin_ids` as admins and register missing admins.
+        Returns the chat IDs whose row was added or changed.
+        """
+        admin_ids = [int(admin_id) for admin_id in admin_ids]
+        placeholders = ", ".join("?" for _ in admin_ids) or "NULL"
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                changed = [row[0] for row in self.conn.execute(
+                    f"SELECT chat_id FROM users WHERE is_admin IS NOT (chat_id IN ({placeholders}))", admin_ids
+                )]
+                self.conn.execute(
+                    f"UPDATE users SET is_admin = (chat_id IN ({placeholders})) "
+                    f"WHERE is_admin IS NOT (chat_id IN ({placeholders}))",
+                    admin_ids + admin_ids,
+                )
+                for admin_id in admin_ids:
+                    if self.conn.execute(
+                        "INSERT OR IGNORE INTO users (chat_id, first_name, language, is_admin) VALUES (?, 'Admin', 'en', 1)",
+                        (admin_id,),
+                    ).rowcount:
+                        changed.append(admin_id)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return changed
+
+    def merge(self, users, skip=()):
+        """
+        Insert users that are not registered yet, leaving existing rows untouched.
+        Chat IDs in `skip` (users removed locally) are not brought back.
+        Returns the number of users added.
+        """
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                count = 0
+                for user in users:
+                    if "chat_id" not in user or int(user["chat_id"]) in skip:
+                        continue
+                    count += self.conn.execute(
+                        f"INSERT OR IGNORE INTO users ({', '.join(USER_FIELDS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            int(user["chat_id"]), user.get("username"), user.get("first_name"), user.get("last_name"),
+                            user.get("language") or "en", int(bool(user.get("is_admin", False))), user.get("joined_at"),
+                        ),
+                    ).rowcount
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return count
+
+    def replace_all(self, users):
+        """
+        Make the registry mirror `users` exactly.
+        Returns the number of users written.
+        """
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS incoming (chat_id INTEGER PRIMARY KEY)")
+                self.conn.execute("DELETE FROM incoming")
+                count = 0
+                for user in users:
+                    if "chat_id" not in user:
+                        continue
+                    chat_id = int(user["chat_id"])
+                    self.conn.execute("INSERT OR IGNORE INTO incoming (chat_id) VALUES (?)", (chat_id,))
+                    self.conn.execute(
+                        f"INSERT INTO users ({', '.join(USER_FIELDS)}) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT (chat_id) DO UPDATE SET username = excluded.username, "
+                        "first_name = excluded.first_name, last_name = excluded.last_name, "
+                        "language = excluded.language, is_admin = excluded.is_admin, "
+                        "joined_at = COALESCE(excluded.joined_at, users.joined_at)",
+                        (
+                            chat_id, user.get("username"), user.get("first_name"), user.get("last_name"),
+                            user.get("language") or "en", int(bool(user.get("is_admin", False))), user.get("joined_at"),
+                        ),
+                    )
+                    count += 1
+                self.conn.execute("DELETE FROM users WHERE chat_id NOT IN (SELECT chat_id FROM incoming)")
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return count
+
+# ==========================
+# YAML Migration
+# ==========================
+def migrate_yaml_to_sqlite(yaml_path, registry, force=False):
+    """
+    One-shot import of the legacy panel_user_data.yaml list into the registry.
+    Skipped when the registry has already been migrated, unless `force` is set.
+    Returns the number of users imported.
+    """
+    if not force and registry.get_meta("yaml_migrated_at"):
+        return 0
+    if not os.path.exists(yaml_path):
+        logging.info(f"No legacy user file at {yaml_path}; nothing to migrate.")
+        return 0
+    with open(yaml_path, "r") as file:
+        users = yaml.safe_load(file) or []
+    count = registry.replace_all(users)
+    registry.set_meta("yaml_migrated_at", datetime.now().isoformat(timespec="seconds"))
+    logging.info(f"Migrated {count} users from {yaml_path} into {registry.db_path}.")
+    return count
+
+if __name__ == "__main__":
+    import sys
+    source = sys.argv[1] if len(sys.argv) > 1 else os.path.join("repo", "panel_user_data.yaml")
+    migrate_yaml_to_sqlite(source, UserRegistry(), force=True)
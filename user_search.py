@@ -0,0 +1,214 @@
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+from itertools import islice
+
+# ==========================
+# Configuration Variables
+# ==========================
+SEARCH_FIELDS = ("first_name", "last_name", "username", "chat_id")
+GRAM_SIZE = 3  # Trigram index for substring and fuzzy matching
+MAX_RESULTS = 10
+MAX_CANDIDATES = 200  # Verified matches collected before ranking; bounds very unselective queries
+MAX_SCAN = 2000  # Users of the rarest trigram intersected with the others; bounds digit queries on similar chat IDs
+FUZZY_MIN_OVERLAP = 0.5  # Share of query trigrams a fuzzy match must contain
+
+def normalize(text):
+    return str(text).strip().lstrip("@").lower() if text is not None else ""
+
+def tokens(values):
+    """
+    Return the prefix-index keys of a user: every field value and every word inside one.
+    """
+    keys = set()
+    for value in values:
+        if value:
+            keys.add(value)
+            keys.update(value.split())
+    return keys
+
+def grams(text):
+    """
+    Return the set of trigrams of `text`, padded so short words still produce grams.
+    """
+    padded = f"  {text} "
+    return {padded[i:i + GRAM_SIZE] for i in range(len(padded) - GRAM_SIZE + 1)}
+
+# ==========================
+# User Search Index
+# ==========================
+class UserSearchIndex:
+    """
+    In-memory trigram inverted index over the searchable fields of panel users, plus a
+    sorted prefix index of field values and words.
+
+    Every query first walks its range of the prefix index (bisect), which alone answers
+    queries shorter than a trigram and fills the page for chat ID and name prefixes.
+    Otherwise the posting sets of the query trigrams are intersected smallest first and
+    the candidates verified, so lookups touch only users sharing every trigram with the
+    query. When nothing matches exactly, users sharing at least FUZZY_MIN_OVERLAP of the
+    trigrams are returned as fuzzy matches. The index is maintained incrementally
+    through `add` / `remove`; `add` on a known user re-indexes it.
+    """
+
+    def __init__(self):
+        self.postings = defaultdict(set)  # trigram -> chat_ids
+        self.documents = {}  # chat_id -> (normalized field values, display tuple)
+        self.prefixes = []  # Sorted (token, chat_id) pairs, see tokens()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def build(self, users):
+        self.postings.clear()
+        self.documents.clear()
+        self.prefixes = []
+        for user in users:
+            self._index(user)
+        self.prefixes = sorted((token, chat_id) for chat_id, (values, _) in self.documents.items()
+                               for token in tokens(values))
+
+    def _index(self, user):
+        chat_id = user["chat_id"]
+        values = tuple(normalize(user.get(field)) for field in SEARCH_FIELDS)
+        display = (user.get("first_name"), user.get("username"), bool(user.get("is_admin", False)))
+        self.documents[chat_id] = (values, display)
+        for value in values:
+            if value:
+                for gram in grams(value):
+                    self.postings[gram].add(chat_id)
+        return values
+
+    def add(self, user):
+        if user["chat_id"] in self.documents:
+            self.remove(user["chat_id"])
+        for token in tokens(self._index(user)):
+            insort(self.prefixes, (token, user["chat_id"]))
+
+    def remove(self, chat_id):
+        document = self.documents.pop(chat_id, None)
+        if document is None:
+            return
+        for value in document[0]:
+            if value:
+                for gram in grams(value):
+                    posting = self.postings.get(gram)
+                    if posting is not None:
+                        posting.discard(chat_id)
+                        if not posting:
+                            del self.postings[gram]
+        for token in tokens(document[0]):
+            position = bisect_left(self.prefixes, (token, chat_id))
+            if position < len(self.prefixes) and self.prefixes[position] == (token, chat_id):
+                del self.prefixes[position]
+
+    def _score(self, values, query):
+        """
+        Rank a verified candidate: exact field match, then prefix match, then substring match.
+        """
+        best = 0
+        for value in values:
+            if value == query:
+                return 3
+            if value.startswith(query) or any(word.startswith(query) for word in value.split()):
+                best = max(best, 2)
+            elif query in value:
+                best = max(best, 1)
+        return best
+
+    def search(self, text, limit=MAX_RESULTS):
+        """
+        Find users whose name, username or chat ID contains `text`.
+        Returns:
+            list: (chat_id, first_name, username, is_admin) tuples, best matches first.
+        """
+        query = normalize(text)
+        if not query:
+            return []
+        if query.isdigit() and int(query) in self.documents:
+            # A full chat ID identifies exactly one user
+            chat_id = int(query)
+            return [(chat_id,) + self.documents[chat_id][1]]
+        # Field and word prefixes sort next to each other, tokens equal to the query first;
+        # past those every match ranks as a prefix match, so a full page ends the walk
+        scored, seen = [], set()
+        position = bisect_left(self.prefixes, (query,))
+        while position < len(self.prefixes) and len(scored) < MAX_CANDIDATES:
+            token, chat_id = self.prefixes[position]
+            if not token.startswith(query) or (len(scored) >= limit and token != query):
+                break
+            position += 1
+            if chat_id not in seen:
+                seen.add(chat_id)
+                values, display = self.documents[chat_id]
+                scored.append((-self._score(values, query), chat_id, display))
+        if len(query) < GRAM_SIZE or len(scored) >= limit:
+            # Short queries only match prefixes, and substring matches rank below a full page of them
+            scored.sort(key=lambda item: (item[0], item[1]))
+            return [(chat_id,) + display for _, chat_id, display in scored[:limit]]
+        # Unpadded grams: the query may sit anywhere inside a field
+        query_grams = {query[i:i + GRAM_SIZE] for i in range(len(query) - GRAM_SIZE + 1)}
+        postings = sorted((self.postings.get(gram, set()) for gram in query_grams), key=len)
+        # Intersect smallest first at C speed and verify. Every prefix match came from the
+        # walk above, so what is left are substring matches: a full page of them is enough.
+        # An unselective rarest trigram (digits shared by most chat IDs) only contributes
+        # its first MAX_SCAN users.
+        pool = postings[0] if len(postings[0]) <= MAX_SCAN else set(islice(postings[0], MAX_SCAN))
+        for chat_id in sorted(pool.intersection(*postings[1:]) - seen):
+            values, display = self.documents[chat_id]
+            if any(query in value for value in values):
+                scored.append((-1, chat_id, display))
+                if len(scored) >= limit:
+                    break
+        if not scored and len(query_grams) > 1:
+            # Fuzzy fallback. A user sharing `threshold` of the query trigrams must appear in
+            # at least one of the rarest len - threshold + 1 posting lists (pigeonhole),
+            # so only those are walked to collect candidates.
+            threshold = max(2, int(len(query_grams) * FUZZY_MIN_OVERLAP))
+            pool = set().union(*postings[:len(postings) - threshold + 1])
+            for chat_id in pool:
+                count = sum(1 for posting in postings if chat_id in posting)
+                if count >= threshold:
+                    scored.append((-count / len(query_grams), chat_id, self.documents[chat_id][1]))
+        scored.sort(key=lambda item: (item[0], item[1]))
+        return [(chat_id,) + display for _, chat_id, display in scored[:limit]]
+
+# ==========================
+# Benchmark
+# ==========================
+if __name__ == "__main__":
+    import random
+    import string
+
+    random.seed(1)
+    def word(length):
+        return "".join(random.choice(string.ascii_lowercase) for _ in range(length)).capitalize()
+    users = [
+        {"chat_id": 100_000_000 + i, "first_name": word(6), "last_name": word(8), "username": word(9).lower()}
+        for i in range(100_000)
+    ]
+    started = time.perf_counter()
+    index = UserSearchIndex()
+    index.build(users)
+    print(f"Indexed {len(index)} users in {time.perf_counter() - started:.2f}s")
+    picks = range(0, 100_000, 1000)
+    query_classes = {
+        "username prefix": [users[i]["username"][:5] for i in picks],
+        "name infix": [users[i]["first_name"][1:4] for i in picks],
+        "1-2 characters": [users[i]["first_name"][:1 + i % 2] for i in picks],
+        "chat ID prefix": [str(users[i]["chat_id"])[:5] for i in picks],
+        "chat ID tail": [str(users[i]["chat_id"])[-6:] for i in picks],
+        "chat ID middle": [str(users[i]["chat_id"])[3:7] for i in picks],
+        "full chat ID": [str(users[i]["chat_id"]) for i in picks],
+        "typo (fuzzy)": [users[i]["last_name"][:3] + "x" + users[i]["last_name"][4:] for i in picks],
+    }
+    query_classes["mix of all"] = [query for queries in query_classes.values() for query in queries]
+    for name, queries in query_classes.items():
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        print(f"{name:<16} {len(queries):4} queries  mean {sum(timings) / len(timings) * 1000:.3f} ms  "
+              f"p95 {timings[int(len(timings) * 0.95)] * 1000:.3f} ms  max {timings[-1] * 1000:.3f} ms")
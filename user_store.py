@@ -0,0 +1,373 @@
+import os
+import logging
+import subprocess
+import threading
+import time
+import yaml
+from user_registry import UserRegistry, USER_DB_FILE, migrate_yaml_to_sqlite
+
+# ==========================
+# Configuration Variables
+# ==========================
+GH_PAT = os.getenv("GH_PAT")  # GitHub Personal Access Token
+REPO_URL = "github.com/Zudiaq/panel_user_data.git"  # GitHub repository URL
+REPO_DIR = "repo"  # Local checkout of the user data repository
+USER_DATA_FILE = "panel_user_data.yaml"  # User data file name
+FLUSH_INTERVAL_SECONDS = int(os.getenv("USER_DATA_FLUSH_SECONDS", "60"))  # Minimum seconds between two pushes
+PUSH_ATTEMPTS = 3  # Pushes per flush; each rejected one is merged with the remote first
+
+# ==========================
+# Git Helpers
+# ==========================
+def git(repo_dir, *args, check=True):
+    return subprocess.run(["git", "-C", repo_dir, *args], check=check, capture_output=True, text=True)
+
+def sync_repo(repo_dir=REPO_DIR):
+    """
+    Shallow clone or fetch the user data repository and return its HEAD commit.
+    The checkout is reset to the remote: the registry, not the checkout, holds unpushed changes.
+    """
+    if not os.path.exists(repo_dir):
+        subprocess.run(["git", "clone", "--depth", "1", f"https://{GH_PAT}@{REPO_URL}", repo_dir], check=True)
+    else:
+        subprocess.run(["git", "-C", repo_dir, "fetch", "--depth", "1", "origin"], check=True)
+        subprocess.run(["git", "-C", repo_dir, "reset", "--hard", "@{upstream}"], check=True)
+    return head_commit(repo_dir)
+
+def head_commit(repo_dir=REPO_DIR):
+    return git(repo_dir, "rev-parse", "HEAD").stdout.strip()
+
+def commits_ahead(repo_dir=REPO_DIR):
+    """
+    Number of local commits the remote branch does not have yet.
+    """
+    return int(git(repo_dir, "rev-list", "--count", "@{upstream}..HEAD").stdout.strip() or 0)
+
+def read_remote_users(repo_dir=REPO_DIR, file_name=USER_DATA_FILE):
+    result = git(repo_dir, "show", f"@{{upstream}}:{file_name}", check=False)
+    return (yaml.safe_load(result.stdout) or []) if result.returncode == 0 else []
+
+def push_changes(repo_dir=REPO_DIR, file_name=USER_DATA_FILE, rebase=None, attempts=PUSH_ATTEMPTS):
+    """
+    Commit the user file if it changed and push every commit the remote lacks, including
+    ones left behind by an earlier failed push. When the push is rejected, the remote is
+    fetched, the file is rewritten on top of it as `rebase(remote_users)` and pushed again.
+    Returns the HEAD commit the remote now has; raises CalledProcessError once `attempts`
+    pushes failed.
+    """
+    git(repo_dir, "config", "user.email", "you@example.com")
+    git(repo_dir, "config", "user.name", "Your Name")
+    for attempt in range(1, attempts + 1):
+        git(repo_dir, "add", file_name)
+        if git(repo_dir, "diff", "--cached", "--quiet", check=False).returncode != 0:
+            git(repo_dir, "commit", "-m", "Update user data")
+        if commits_ahead(repo_dir) == 0:
+            return head_commit(repo_dir)
+        pushed = git(repo_dir, "push", check=False)
+        if pushed.returncode == 0:
+            return head_commit(repo_dir)
+        if rebase is None or attempt == attempts:
+            raise subprocess.CalledProcessError(pushed.returncode, pushed.args, pushed.stdout, pushed.stderr)
+        logging.warning(f"Push of {file_name} rejected ({pushed.stderr.strip()}); merging with the remote.")
+        git(repo_dir, "fetch", "--depth", "1", "origin")
+        git(repo_dir, "reset", "--hard", "@{upstream}")
+        users = rebase(read_remote_users(repo_dir, file_name))
+        with open(os.path.join(repo_dir, file_name), "w") as file:
+            yaml.dump(users, file)
+
+# ==========================
+# User Store
+# ==========================
+class UserStore:
+    """
+    Authoritative store of panel users with write-behind persistence.
+
+    Users live in a local SQLite registry (see user_registry.py); handlers read and
+    mutate it directly. Mutations mark the store dirty, and a background thread
+    exports the registry to the YAML file of the user data repository, coalescing
+    them into at most one git commit and push per `flush_interval` seconds.
+    `stop()` performs a final flush.
+
+    The registry remembers the repository commit it matches, so a process with a local
+    registry serves from it right away and reconciles with the remote in the background.
+    """
+
+    def __init__(self, repo_dir=REPO_DIR, file_name=USER_DATA_FILE, flush_interval=FLUSH_INTERVAL_SECONDS,
+                 db_path=USER_DB_FILE):
+        self.repo_dir = repo_dir
+        self.file_name = file_name
+        self.flush_interval = flush_interval
+        self.db_path = db_path
+        self.registry = None  # Opened lazily so importing the panel has no side effects
+        self.version = 0  # Bumped on every mutation and every import from the repository
+        self.flushed_version = 0
+        self.pushing_version = 0  # Version the flush in progress exports
+        self.removed = set()  # Chat IDs removed locally and not pushed yet; imports must not resurrect them
+        self.last_flush_at = 0.0
+        self.lock = threading.RLock()
+        self.git_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+        self.listeners = []  # Callables notified as listener(event, chat_id) after every change
+
+    @property
+    def file_path(self):
+        return os.path.join(self.repo_dir, self.file_name)
+
+    @property
+    def dirty(self):
+        return self.version != self.flushed_version
+
+    def add_listener(self, listener):
+        """
+        Register `listener(event, chat_id)`. Events are "add", "update" and "remove",
+        plus "reload" (chat_id None) after the registry was (re)loaded from the repository.
+        """
+        self.listeners.append(listener)
+
+    def _notify(self, event, chat_id=None):
+        for listener in self.listeners:
+            try:
+                listener(event, chat_id)
+            except Exception as e:
+                logging.error(f"User store listener failed on {event} {chat_id}: {e}")
+
+    def open(self):
+        if self.registry is None:
+            self.registry = UserRegistry(self.db_path)
+        return self.registry
+
+    # ---------- Loading ----------
+    def load(self, background=True):
+        """
+        Make the registry usable. A local registry is served immediately and reconciled with
+        the repository on a background thread; without one, the repository is cloned first.
+        Returns the reconciliation thread, or None when loading was synchronous.
+        """
+        registry = self.open()
+        if registry.get_meta("yaml_migrated_at") and background:
+            self._notify("reload")
+            thread = threading.Thread(target=self.reconcile, name="user-store-reconcile", daemon=True)
+            thread.start()
+            return thread
+        with self.git_lock:
+            commit = sync_repo(self.repo_dir)
+            migrate_yaml_to_sqlite(self.file_path, registry)
+            registry.set_meta("synced_commit", commit)
+        self._notify("reload")
+        return None
+
+    def reconcile(self):
+        """
+        Fetch the repository and import its user file if it moved past the commit the registry
+        matches. Users changed locally meanwhile are kept: the remote file is then merged
+        in instead of mirrored.
+        """
+        started = time.perf_counter()
+        registry = self.open()
+        try:
+            with self.git_lock:
+                commit = sync_repo(self.repo_dir)
+                if commit == registry.get_meta("synced_commit"):
+                    logging.info(f"User registry already matches {commit[:7]} ({time.perf_counter() - started:.2f}s).")
+                    return
+                count = self._import(commit)
+            logging.info(f"Reconciled {count} users with {commit[:7]} in {time.perf_counter() - started:.2f}s.")
+            self._notify("reload")
+        except Exception as e:
+            logging.error(f"Error reconciling user data: {e}")
+
+    def refresh(self):
+        """
+        Push pending changes, then pull the remote copy and mirror it into the registry
+        (merge it, if the push failed). Intended for the admin "refresh" action.
+        """
+        self.flush()
+        with self.git_lock:
+            self._import(sync_repo(self.repo_dir))
+        self._notify("reload")
+
+    def _import(self, commit):
+        """
+        Import the checked-out user file at `commit`: mirrored while nothing is pending, merged
+        otherwise, so unpushed adds and removals (a failed flush included) survive.
+        Caller holds git_lock. Returns the number of users imported.
+        """
+        registry = self.open()
+        with open(self.file_path, "r") as file:
+            users = yaml.safe_load(file) or []
+        with self.lock:  # No mutation may slip in between the dirty check and the import
+            if self.dirty:
+                count = registry.merge(users, skip=self.removed)
+            else:
+                count = registry.replace_all(users)
+            self._imported()
+        registry.set_meta("synced_commit", commit)
+        return count
+
+    # ---------- Reads ----------
+    def __contains__(self, chat_id):
+        return self.open().exists(chat_id)
+
+    def __len__(self):
+        return self.open().count()
+
+    def get(self, chat_id):
+        return self.open().get(chat_id)
+
+    def get_language(self, chat_id):
+        return self.open().get_language(chat_id)
+
+    def all(self):
+        return self.open().list_users()
+
+    def non_admins(self):
+        return self.open().list_users(exclude_admins=True)
+
+    def count(self, exclude_admins=False):
+        return self.open().count(exclude_admins=exclude_admins)
+
+    def page(self, offset, limit, exclude_admins=False):
+        return self.open().list_users(exclude_admins=exclude_admins, offset=offset, limit=limit)
+
+    def chat_ids(self, exclude_admins=False):
+        return self.open().chat_ids(exclude_admins=exclude_admins)
+
+    # ---------- Mutations ----------
+    def _touch(self):
+        with self.lock:
+            self.version += 1
+        self.wake.set()
+
+    def _imported(self):
+        """
+        Bump the version after users were imported from the repository, so version-keyed
+        caches refresh. An import alone leaves a clean store clean.
+        """
+        with self.lock:
+            clean = not self.dirty
+            self.version += 1
+            if clean:
+                self.flushed_version = self.version
+
+    # Mutations hold the store lock around the registry write, so an import sees them all or none
+    def add(self, user):
+        """
+        Add a user. Returns False if a user with the same chat_id already exists.
+        """
+        with self.lock:
+            added = self.open().add(user)
+            if added:
+                self.removed.discard(int(user["chat_id"]))
+                self._touch()
+        if added:
+            self._notify("add", user["chat_id"])
+        return added
+
+    def update(self, chat_id, **fields):
+        """
+        Update fields of an existing user. Only marks the store dirty when a value actually changes.
+        """
+        with self.lock:
+            changed = self.open().update(chat_id, **fields)
+            if changed:
+                self._touch()
+        if changed:
+            self._notify("update", chat_id)
+        return changed > 0
+
+    def remove(self, chat_id):
+        with self.lock:
+            removed = self.open().remove(chat_id)
+            if removed:
+                self.removed.add(int(chat_id))
+                self._touch()
+        if removed:
+            self._notify("remove", chat_id)
+        return removed
+
+    def set_admins(self, admin_ids):
+        """
+        Flag exactly `admin_ids` as admins and register missing ones in a single statement batch.
+        """
+        with self.lock:
+            changed = self.open().set_admins(admin_ids)
+            if changed:
+                self.removed.difference_update(changed)
+                self._touch()
+        if changed:
+            for chat_id in changed:
+                self._notify("update", chat_id)
+
+    # ---------- Write-behind flushing ----------
+    def flush(self):
+        """
+        Export the registry to the repository YAML and push it if anything changed.
+        Blocking; runs on the flusher thread or during shutdown, never on the event loop.
+        """
+        with self.git_lock:
+            with self.lock:
+                if not self.dirty or self.registry is None:
+                    return
+                self.pushing_version = self.version
+                removed = set(self.removed)
+            try:
+                users = self.registry.list_users()
+                with open(self.file_path, "w") as file:
+                    yaml.dump(users, file)
+                commit = push_changes(self.repo_dir, self.file_name, rebase=self._rebase)
+                # Only a pushed commit counts as synced; otherwise the next flush pushes again
+                self.registry.set_meta("synced_commit", commit)
+                with self.lock:
+                    self.flushed_version = max(self.flushed_version, self.pushing_version)
+                    self.removed -= removed  # The remote no longer has them
+                logging.info(f"Flushed {self.registry.count()} users to the user data repository.")
+            except Exception as e:
+                logging.error(f"Error flushing user data: {e}")
+                self.wake.set()  # Retry after the next interval
+            finally:
+                self.last_flush_at = time.monotonic()
+
+    def _rebase(self, remote_users):
+        """
+        Import the users another process pushed meanwhile and return the user list to push on top of them.
+        """
+        with self.lock:
+            count = self.registry.merge(remote_users, skip=self.removed)
+            if count:
+                self._imported()
+            self.pushing_version = self.version  # The list below includes the import and every change so far
+            users = self.registry.list_users()
+        if count:
+            logging.info(f"Merged {count} users pushed by another process.")
+            self._notify("reload")
+        return users
+
+    def _run(self):
+        while not self.stopping.is_set():
+            self.wake.wait()
+            self.wake.clear()
+            # Coalesce every mutation made within the interval into one push
+            wait = self.last_flush_at + self.flush_interval - time.monotonic()
+            if wait > 0 and self.stopping.wait(wait):
+                break
+            self.flush()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="user-store-flusher", daemon=True)
+            self.thread.start()
+            if self.dirty:
+                self.wake.set()
+
+    def stop(self):
+        """
+        Stop the flusher thread and push any pending changes.
+        """
+        self.stopping.set()
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join(timeout=30)
+            self.thread = None
+        self.flush()
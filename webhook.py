@@ -0,0 +1,323 @@
+import asyncio
+import hmac
+import json
+import logging
+import secrets
+import signal
+import socket
+import time
+from urllib.parse import parse_qsl, urlparse
+from telegram import Update
+
+# ==========================
+# Configuration Variables
+# ==========================
+ALLOWED_UPDATES = ["message", "callback_query"]  # The only update types the panel handles
+MAX_BODY_BYTES = 1024 * 1024  # Telegram updates are far smaller than this
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+# ==========================
+# Minimal HTTP Helpers
+# ==========================
+async def read_http_request(reader):
+    """
+    Read one HTTP/1.1 request. Returns (method, path, headers, body) or None on EOF.
+    """
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY_BYTES:
+        raise ValueError(f"Request body too large: {length} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method, path, headers, body
+
+def http_response(status, body=b"", content_type="application/json"):
+    reason = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed"}.get(status, "")
+    head = (
+        f"HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\nConnection: keep-alive\r\n\r\n"
+    )
+    return head.encode("latin-1") + body
+
+# ==========================
+# Webhook Receiver
+# ==========================
+class WebhookServer:
+    """
+    Embedded asyncio HTTP server receiving Telegram webhook calls.
+
+    Requests must be POSTs to `path` carrying the secret token header set with
+    setWebhook. Accepted updates are filtered by `allowed_updates` and queued into
+    the application's update queue, so the existing handlers process them unchanged.
+    """
+
+    def __init__(self, application, secret_token, listen="0.0.0.0", port=8443, path="/telegram",
+                 allowed_updates=ALLOWED_UPDATES):
+        self.application = application
+        self.secret_token = secret_token
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.allowed_updates = set(allowed_updates or [])
+        self.server = None
+        self.received = 0
+        self.rejected = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_connection, self.listen, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logging.info(f"Webhook receiver listening on {self.listen}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    def accepts(self, data):
+        return not self.allowed_updates or any(key in self.allowed_updates for key in data if key != "update_id")
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await read_http_request(reader)
+                if request is None:
+                    break
+                writer.write(await self.handle_request(*request))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            logging.debug(f"Webhook connection closed: {e}")
+        finally:
+            writer.close()
+
+    async def handle_request(self, method, path, headers, body):
+        if path.split("?", 1)[0] != self.path:
+            return http_response(404)
+        if method != "POST":
+            return http_response(405)
+        if not hmac.compare_digest(headers.get(SECRET_HEADER, ""), self.secret_token):
+            self.rejected += 1
+            logging.warning("Rejected webhook call with a missing or invalid secret token.")
+            return http_response(403)
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return http_response(400)
+        if self.accepts(data):
+            update = Update.de_json(data, self.application.bot)
+            await self.application.update_queue.put(update)
+            self.received += 1
+        return http_response(200)
+
+async def run_webhook(application, webhook_url, secret_token=None, listen="0.0.0.0", port=8443, path="/telegram",
+                      allowed_updates=ALLOWED_UPDATES, stop_event=None):
+    """
+    Serve the application through a webhook until `stop_event` is set or SIGINT/SIGTERM arrives.
+
+    Args:
+        application: The python-telegram-bot Application with its handlers registered.
+        webhook_url (str): Public base URL Telegram should call; `path` is appended.
+        secret_token (str): Value Telegram echoes in the secret header. Generated if omitted.
+    """
+    secret_token = secret_token or secrets.token_urlsafe(32)
+    stop_event = stop_event or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    server = WebhookServer(application, secret_token, listen, port, path, allowed_updates)
+    async with application:
+        await server.start()
+        await application.bot.set_webhook(
+            url=webhook_url.rstrip("/") + path, secret_token=secret_token, allowed_updates=allowed_updates
+        )
+        await application.start()
+        try:
+            await stop_event.wait()
+        finally:
+            await server.stop()
+            try:
+                await application.bot.delete_webhook()
+            except Exception as e:
+                logging.error(f"Failed to delete webhook: {e}")
+            await application.stop()
+
+# ==========================
+# Latency Benchmark
+# ==========================
+class FakeBotApi:
+    """
+    Local stand-in for the Bot API: answers getMe, getUpdates (long polling), setWebhook,
+    deleteWebhook and sendMessage, and either queues published updates for getUpdates
+    or POSTs them to the registered webhook.
+    """
+
+    def __init__(self):
+        self.updates = []
+        self.new_update = asyncio.Event()
+        self.webhook = None  # (host, port, path, secret)
+        self.server = None
+        self.port = None
+        self.next_update_id = 1
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_connection, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await read_http_request(reader)
+                if request is None:
+                    break
+                method_name = request[1].rsplit("/", 1)[-1]
+                result = await self.call(method_name, self.parse_params(request[2], request[3]))
+                writer.write(http_response(200, json.dumps({"ok": True, "result": result}).encode()))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    def parse_params(self, headers, body):
+        if not body:
+            return {}
+        if "json" in headers.get("content-type", ""):
+            return json.loads(body)
+        params = {}
+        for key, value in parse_qsl(body.decode()):
+            try:
+                params[key] = json.loads(value)
+            except ValueError:
+                params[key] = value
+        return params
+
+    async def call(self, method_name, params):
+        if method_name == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        if method_name == "setWebhook":
+            url = urlparse(params["url"])
+            self.webhook = (url.hostname, url.port, url.path, params.get("secret_token", ""))
+            return True
+        if method_name == "deleteWebhook":
+            self.webhook = None
+            return True
+        if method_name == "getUpdates":
+            offset = int(params.get("offset", 0) or 0)
+            self.updates = [update for update in self.updates if update["update_id"] >= offset]
+            if not self.updates:
+                self.new_update.clear()
+                try:
+                    await asyncio.wait_for(self.new_update.wait(), float(params.get("timeout", 0) or 0))
+                except asyncio.TimeoutError:
+                    pass
+            return self.updates
+        if method_name == "sendMessage":
+            return {"message_id": 1, "date": int(time.time()), "chat": {"id": int(params["chat_id"]), "type": "private"}, "text": params.get("text", "")}
+        return True
+
+    def make_update(self, text="ping"):
+        update_id = self.next_update_id
+        self.next_update_id += 1
+        return {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id, "date": int(time.time()), "text": text,
+                "chat": {"id": 42, "type": "private"}, "from": {"id": 42, "is_bot": False, "first_name": "Bench"},
+            },
+        }
+
+    async def publish(self, update):
+        if self.webhook is None:
+            self.updates.append(update)
+            self.new_update.set()
+            return
+        host, port, path, secret = self.webhook
+        reader, writer = await asyncio.open_connection(host, port)
+        body = json.dumps(update).encode()
+        writer.write(
+            f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+            f"{SECRET_HEADER}: {secret}\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+        await reader.readline()
+        writer.close()
+
+async def measure_latency(mode, samples=200):
+    """
+    Publish `samples` updates through the fake Bot API and measure publish-to-handler latency.
+    """
+    from telegram.ext import Application, TypeHandler
+
+    api = FakeBotApi()
+    await api.start()
+    published, latencies = {}, []
+    done = asyncio.Event()
+
+    async def record(update, context):
+        latencies.append(time.perf_counter() - published[update.update_id])
+        if len(latencies) >= samples:
+            done.set()
+
+    application = Application.builder().token("123:bench").base_url(api.base_url).build()
+    application.add_handler(TypeHandler(Update, record))
+    stop_event = asyncio.Event()
+    if mode == "webhook":
+        port = free_port()
+        runner = asyncio.create_task(run_webhook(
+            application, f"http://127.0.0.1:{port}", listen="127.0.0.1", port=port, stop_event=stop_event
+        ))
+        while api.webhook is None:
+            await asyncio.sleep(0.01)
+    else:
+        await application.initialize()
+        await application.updater.start_polling(poll_interval=0, timeout=10, allowed_updates=ALLOWED_UPDATES)
+        await application.start()
+
+    for _ in range(samples):
+        update = api.make_update()
+        published[update["update_id"]] = time.perf_counter()
+        await api.publish(update)
+        await asyncio.sleep(0.005)
+    await asyncio.wait_for(done.wait(), 30)
+
+    if mode == "webhook":
+        stop_event.set()
+        await runner
+    else:
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+    await api.stop()
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)]
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+if __name__ == "__main__":
+    for mode in ("polling", "webhook"):
+        p50, p95 = asyncio.run(measure_latency(mode))
+        print(f"{mode}: p50 {p50 * 1000:.2f} ms, p95 {p95 * 1000:.2f} ms")
@@ -0,0 +1,193 @@
+import os
+import re
+import json
+import logging
+import threading
+from datetime import datetime
+import requests
+from pytz import timezone
+from media_cache import MEDIA_CACHE_DIR, atomic_write_json
+
+# ==========================
+# Configuration Variables
+# ==========================
+SEARCH_URL = "https://www.googleapis.com/youtube/v3/search"
+VIDEOS_URL = "https://www.googleapis.com/youtube/v3/videos"
+SEARCH_LIST_UNITS = 100  # Quota cost of one search.list call, whatever its maxResults
+VIDEOS_LIST_UNITS = 1  # Quota cost of one videos.list call for up to 50 ids
+DAILY_QUOTA_UNITS = int(os.getenv("YOUTUBE_DAILY_QUOTA", "10000"))
+QUOTA_TIMEZONE = "America/Los_Angeles"  # The YouTube Data API quota resets at midnight Pacific time
+QUOTA_FILE = "youtube_quota.json"
+SEARCH_PAGE_SIZE = 25  # Costs the same as 5 results and gives the ranking more to choose from
+CONFIDENT_SCORE = 0.5  # Stop searching once a candidate matches half the track and album words
+DURATION_CHECK_CANDIDATES = 5  # Best candidates whose durations are fetched in one videos.list call
+MIN_TRACK_SECONDS = 60
+MAX_TRACK_SECONDS = 15 * 60  # Longer videos are mixes, full albums or loops
+BANNED_KEYWORDS = ["live", "karaoke", "cover", "remix", "loop"]
+ISO_DURATION = re.compile(r"P(?:(\d+)D)?T?(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?")
+
+class QuotaExhausted(Exception):
+    """
+    Raised when a call would exceed the remaining daily YouTube Data API budget.
+    """
+
+class QuotaBudget:
+    """
+    Units spent on the YouTube Data API today (Pacific time), kept in the media cache so
+    every run of the day sees what the earlier ones spent.
+    """
+
+    def __init__(self, daily_units=DAILY_QUOTA_UNITS, path=None):
+        self.daily_units = daily_units
+        self.path = path or os.path.join(MEDIA_CACHE_DIR, QUOTA_FILE)
+        self.lock = threading.Lock()
+
+    def _today(self):
+        return datetime.now(timezone(QUOTA_TIMEZONE)).date().isoformat()
+
+    def _read(self):
+        try:
+            with open(self.path, "r") as file:
+                data = json.load(file)
+        except (FileNotFoundError, ValueError):
+            data = {}
+        return data if data.get("date") == self._today() else {"date": self._today(), "units": 0}
+
+    def remaining(self):
+        with self.lock:
+            return self.daily_units - self._read()["units"]
+
+    def spend(self, units):
+        """
+        Charge `units` against today's budget, or raise QuotaExhausted without charging.
+        """
+        with self.lock:
+            data = self._read()
+            if data["units"] + units > self.daily_units:
+                raise QuotaExhausted(f"{units} units needed, {self.daily_units - data['units']} left today")
+            data["units"] += units
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            atomic_write_json(self.path, data)
+
+    def exhaust(self):
+        """
+        Record that the API itself reported the quota as used up.
+        """
+        with self.lock:
+            data = self._read()
+            data["units"] = self.daily_units
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            atomic_write_json(self.path, data)
+
+def parse_duration(value):
+    """
+    Seconds of an ISO 8601 duration such as PT3M45S, or None.
+    """
+    match = ISO_DURATION.fullmatch(value or "")
+    if not match or not any(match.groups()):
+        return None
+    days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+def score_candidate(item, query, artist_name):
+    """
+    Rank a search result for `query`: None if it is unacceptable (banned keyword, or the
+    artist appears in neither title nor channel), otherwise the share of the query's
+    non-artist words found in the title, plus bonuses for official uploads.
+    """
+    title = item["snippet"]["title"].lower()
+    channel = item["snippet"].get("channelTitle", "").lower()
+    artist = (artist_name or "").lower()
+    if any(keyword in title for keyword in BANNED_KEYWORDS):
+        return None
+    if artist not in title and artist not in channel:
+        return None
+    words = [word for word in query.lower().split() if word not in artist.split()]
+    score = sum(word in title for word in words) / len(words) if words else 1.0
+    if artist in channel or channel.endswith(" - topic") or "vevo" in channel:
+        score += 0.25  # The artist's own channel or YouTube Music's auto-generated one
+    if "official" in title:
+        score += 0.25
+    return score
+
+class SearchPlanner:
+    """
+    Finds the YouTube video of a track with as few quota units as possible.
+
+    Every search.list costs 100 units, so each one fetches a full page of results, which
+    are ranked locally (see score_candidate). The fallback queries only run while no
+    candidate reaches CONFIDENT_SCORE and the daily budget allows. A single videos.list
+    call (1 unit) then drops the best candidates whose duration is not a song's. Units
+    spent are logged per resolved track.
+    """
+
+    def __init__(self, api_key=None, budget=None, page_size=SEARCH_PAGE_SIZE, check_durations=True):
+        self.api_key = api_key or os.getenv("YOUTUBE_API_KEY")
+        self.budget = budget or QuotaBudget()
+        self.page_size = page_size
+        self.check_durations = check_durations
+
+    def _get(self, url, units, params):
+        self.budget.spend(units)
+        response = requests.get(url, params=dict(params, key=self.api_key), timeout=10)
+        if response.status_code == 403 and "quota" in response.text.lower():
+            self.budget.exhaust()
+            raise QuotaExhausted("YouTube reported the daily quota as exceeded")
+        response.raise_for_status()
+        return response.json().get("items", [])
+
+    def durations(self, video_ids):
+        items = self._get(VIDEOS_URL, VIDEOS_LIST_UNITS, {"part": "contentDetails", "id": ",".join(video_ids)})
+        return {item["id"]: parse_duration(item["contentDetails"].get("duration")) for item in items}
+
+    def plan_queries(self, query, artist_name):
+        queries = [query, f"{artist_name} {query.split()[0]}", artist_name]  # Most to least specific
+        return list(dict.fromkeys(q for q in queries if q))
+
+    def find(self, query, artist_name):
+        """
+        Returns:
+            tuple: (video_id or None, units spent, whether every API call succeeded)
+        """
+        candidates, units, complete = {}, 0, True
+        for planned in self.plan_queries(query, artist_name):
+            if self.budget.remaining() < SEARCH_LIST_UNITS:
+                logging.warning(f"YouTube quota budget exhausted; skipping search for '{planned}'.")
+                complete = False
+                break
+            try:
+                logging.info(f"Searching YouTube for query: {planned}")
+                items = self._get(SEARCH_URL, SEARCH_LIST_UNITS,
+                                  {"part": "snippet", "type": "video", "maxResults": self.page_size, "q": planned})
+                units += SEARCH_LIST_UNITS
+            except (requests.exceptions.RequestException, QuotaExhausted) as e:
+                logging.error(f"Error during YouTube search for query '{planned}': {e}")
+                complete = False
+                continue
+            for item in items:
+                score = score_candidate(item, query, artist_name)
+                video_id = item["id"].get("videoId")
+                if score is not None and video_id and score > candidates.get(video_id, -1):
+                    candidates[video_id] = score
+            if candidates and max(candidates.values()) >= CONFIDENT_SCORE:
+                break
+            logging.warning(f"No confident match for query: {planned}")
+
+        ranked = sorted(candidates, key=candidates.get, reverse=True)
+        if ranked and self.check_durations:
+            shortlist = ranked[:DURATION_CHECK_CANDIDATES]
+            try:
+                durations = self.durations(shortlist)
+                units += VIDEOS_LIST_UNITS
+                ranked = [video_id for video_id in shortlist
+                          if durations.get(video_id) is None or MIN_TRACK_SECONDS <= durations[video_id] <= MAX_TRACK_SECONDS
+                          ] + ranked[len(shortlist):]
+            except (requests.exceptions.RequestException, QuotaExhausted) as e:
+                logging.warning(f"Skipping the duration check: {e}")
+        video_id = ranked[0] if ranked else None
+        if video_id:
+            logging.info(f"Found matching video {video_id} (score {candidates[video_id]:.2f}) for '{query}' "
+                         f"with {units} quota units; {self.budget.remaining()} left today.")
+        else:
+            logging.info(f"No match for '{query}' after {units} quota units; {self.budget.remaining()} left today.")
+        return video_id, units, complete